@@ -1,9 +1,13 @@
+import hmac
 import os
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
-from supabase import create_client, Client
 from extensions import supabase
+from utils import metrics
+from utils.json_provider import FastJSONProvider
+from utils.compression import compress_response
+from utils.storage import AVATAR_MAX_BYTES, MULTIPART_OVERHEAD_BYTES
 
 
 # .env dosyasındaki ortam değişkenlerini yükler
@@ -13,11 +17,18 @@ load_dotenv()
 
 # Flask uygulamasını oluşturur
 app = Flask(__name__)
+# jsonify/get_json orjson ile (yüklüyse); büyük yanıtlar gzip/brotli ile sıkıştırılır
+app.json = FastJSONProvider(app)
+app.after_request(compress_response)
+# En büyük gövde avatar yüklemesidir; daha büyük istekler gövde okunmadan/parse
+# edilmeden 413 ile reddedilir (Content-Length'i olmayan akışlar dahil)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', AVATAR_MAX_BYTES + MULTIPART_OVERHEAD_BYTES))
 # Frontend'den gelecek isteklere izin vermek için CORS'u etkinleştirir
 CORS(app, resources={r"/api/*": {
     "origins": ["http://localhost:5173", "http://127.0.0.1:5173"],
     "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept", "Origin", "Referer", "User-Agent"],
+    "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept", "Origin", "Referer", "User-Agent", "Idempotency-Key", "X-Request-Id"],
+    "expose_headers": ["Idempotent-Replayed"],
     "supports_credentials": True
 }})
 
@@ -56,6 +67,11 @@ def upload_avatar_root():
 
 
 
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify(error=f"Request body must be at most {app.config['MAX_CONTENT_LENGTH']} bytes"), 413
+
+
 # --- Ana Test Route'u ---
 
 # Sunucunun ayakta olup olmadığını kontrol etmek için basit bir endpoint
@@ -64,6 +80,28 @@ def index():
     return jsonify(status="API is up and running!")
 
 
+# /api/metrics için erişim anahtarı (Authorization: Bearer veya X-Metrics-Token).
+# Tanımlı değilse metrikler sadece aynı makineden (loopback) okunabilir.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+_LOOPBACK_ADDRS = {'127.0.0.1', '::1'}
+
+
+def _metrics_authorized():
+    if not METRICS_TOKEN:
+        return request.remote_addr in _LOOPBACK_ADDRS
+    auth = request.headers.get('Authorization', '')
+    token = auth[7:] if auth.startswith('Bearer ') else request.headers.get('X-Metrics-Token', '')
+    return hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())
+
+
+# Süreç içi kuyruk/önbellek metrikleri (flush gecikmesi vb.)
+@app.route("/api/metrics")
+def get_metrics():
+    if not _metrics_authorized():
+        return jsonify(error="Forbidden"), 403
+    return jsonify(metrics.snapshot())
+
+
 # Bu blok, 'python app.py' komutuyla direkt çalıştırma için kullanılır.
 # 'flask run' komutuyla çalıştırdığımızda bu bloğa ihtiyaç duyulmaz ama
 # standart bir pratiktir.
@@ -0,0 +1,89 @@
+"""Gerçek route'larda bağımsız upstream çağrılarının sıralı ve paralel çalışmasını karşılaştırır.
+
+Uygulama Flask test istemcisiyle çağrılır; sorgular gerçek PostgREST
+istemcisinden geçer, sadece HTTP katmanı her isteğe sabit gecikme ekleyen
+sahte bir transport ile değiştirilir. Her route önce FANOUT_ENABLED=0
+(sıralı), sonra paralel (utils.fanout thread havuzu) ölçülür.
+
+    python -m benchmarks.bench_fanout [latency_ms] [repeats]
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SUPABASE_URL', 'https://bench.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'bench-key')
+os.environ['SUPABASE_JWT_SECRET'] = 'bench-secret'
+os.environ['AUTH_REMOTE_RECHECK_SECONDS'] = '0'
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+
+from utils import fanout  # noqa: E402
+from app import app  # noqa: E402
+from utils.profiles import _full_profile_cache  # noqa: E402
+from utils.social_graph import social_graph  # noqa: E402
+from utils.usernames import username_index  # noqa: E402
+
+USER_ID = '00000000-0000-0000-0000-000000000001'
+ROW = {'id': USER_ID, 'level': 1, 'username': 'bench', 'avatar_url': None,
+       'user1_id': USER_ID, 'user2_id': USER_ID, 'status': 'accepted'}
+
+ROUTES = {
+    'users_search': ('get', '/api/social/users/search?query=be', None),
+    'get_levels_for_category': ('get', '/api/games/bench/bench/levels', None),
+    'profile_batch (8 ids)': ('post', '/api/profile/batch',
+                              {'ids': [f'00000000-0000-0000-0000-00000000010{i}' for i in range(8)]}),
+}
+
+
+def latency_transport(latency):
+    def handle_request(self, request):
+        time.sleep(latency)
+        if 'vnd.pgrst.object' in request.headers.get('accept', ''):
+            body = ROW
+        elif '/rpc/' in request.url.path:
+            body = [{'profile': ROW, 'game_scores': [], 'achievements': []}]
+        else:
+            body = [ROW]
+        return httpx.Response(200, json=body, headers={'content-range': '0-0/1'}, request=request)
+    return handle_request
+
+
+def measure(client, method, path, body, token, repeats):
+    samples = []
+    for _ in range(repeats):
+        # Önbellekler her turda boşaltılır, her istek upstream'e gider
+        _full_profile_cache.clear()
+        social_graph._adjacency.clear()
+        started = time.perf_counter()
+        response = getattr(client, method)(path, headers={'Authorization': f'Bearer {token}'},
+                                           data=json.dumps(body) if body else None,
+                                           content_type='application/json')
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code < 500, response.get_data(as_text=True)
+    return statistics.median(samples)
+
+
+if __name__ == '__main__':
+    latency = (float(sys.argv[1]) if len(sys.argv) > 1 else 40) / 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    httpx.HTTPTransport.handle_request = latency_transport(latency)
+    # users_search'ün veritabanı yolunu ölçmek için bellekteki username indeksi yüklenmez
+    username_index._ensure_started = lambda: None
+    token = jwt.encode({'sub': USER_ID, 'aud': 'authenticated', 'exp': int(time.time()) + 3600},
+                       'bench-secret', algorithm='HS256')
+    client = app.test_client()
+
+    print(f"upstream latency: {latency * 1000:.0f} ms per call, median of {repeats} runs")
+    print(f"{'route':28} {'sequential ms':>14} {'parallel ms':>12}")
+    for name, (method, path, body) in ROUTES.items():
+        fanout.FANOUT_ENABLED = False
+        sequential = measure(client, method, path, body, token, repeats)
+        fanout.FANOUT_ENABLED = True
+        parallel = measure(client, method, path, body, token, repeats)
+        print(f"{name:28} {sequential:14.1f} {parallel:12.1f}")
@@ -0,0 +1,128 @@
+"""Yanıt serileştirme: Flask'ın varsayılan `jsonify`'ı ile orjson'ı ve sıkıştırmayı karşılaştırır.
+
+Gerçek yanıt şekillerine benzeyen sentetik yükler (20 soruluk düello, tam
+profil, arkadaş listesi, liderlik tablosu) üretilir. Her yük için
+serileştirme süresi ve ham / gzip / brotli bayt sayıları ölçülür.
+`stdlib` sütunu Flask'ın üretimdeki ayarlarıdır (sort_keys, ensure_ascii,
+sıkışık ayraçlar); `orjson` utils/json_provider.py ile aynı seçenekleri kullanır.
+
+    python -m benchmarks.bench_json [repeats]
+"""
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+
+WORDS = ['başkent', 'nehir', 'dağ', 'ülke', 'şehir', 'göl', 'yıl', 'savaş', 'kral', 'imparatorluk',
+         'element', 'gezegen', 'yazar', 'roman', 'ressam', 'besteci', 'capital', 'river', 'planet', 'novel']
+
+
+def _uuid(rng):
+    return '%08x-%04x-4%03x-8%03x-%012x' % (rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(12),
+                                            rng.getrandbits(12), rng.getrandbits(48))
+
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '?'
+
+
+def _profile_row(rng):
+    return {'id': _uuid(rng), 'username': f"{rng.choice(WORDS)}{rng.randint(1, 9999)}",
+            'avatar_url': f"https://example.supabase.co/storage/v1/object/public/avatars/thumbs/{rng.getrandbits(128):032x}/64.webp",
+            'avatar_url_original': f"https://example.supabase.co/storage/v1/object/public/avatars/{_uuid(rng)}/{rng.getrandbits(128):032x}.png",
+            'total_score': rng.randint(0, 200000)}
+
+
+def duel_payload(rng):
+    questions = []
+    for i in range(20):
+        options = [_sentence(rng, 3) for _ in range(4)]
+        questions.append({
+            'id': rng.randint(1, 50000), 'game_type_id': rng.randint(1, 6), 'category_id': rng.randint(1, 40),
+            'level': rng.randint(1, 10),
+            'content': {'question': _sentence(rng, 14), 'options': options, 'answer': options[0],
+                        'explanation': _sentence(rng, 30), 'image_url': None,
+                        'translations': {'en': {'question': _sentence(rng, 14), 'options': options}}},
+        })
+    return {'duel': {'id': _uuid(rng), 'status': 'active', 'challenger': _profile_row(rng),
+                     'opponent': _profile_row(rng), 'questions': questions,
+                     'created_at': '2026-10-19T12:00:00+00:00'}}
+
+
+def full_profile(rng):
+    return {'profile': dict(_profile_row(rng), bio=_sentence(rng, 20), mixed_rush_highscore=rng.randint(0, 500)),
+            'achievements': [{'id': i, 'name': _sentence(rng, 2), 'description': _sentence(rng, 10),
+                              'icon': f'icon_{i}.svg', 'earned_at': '2026-09-01T10:00:00+00:00'} for i in range(30)],
+            'progress': [{'category_id': c, 'language_code': 'tr', 'level': lv, 'score': rng.randint(0, 3000)}
+                         for c in range(25) for lv in range(1, 9)]}
+
+
+def friends_list(rng):
+    return {'friends': [_profile_row(rng) for _ in range(150)],
+            'incoming_requests': [dict(_profile_row(rng), friendship_id=rng.randint(1, 10 ** 6)) for _ in range(20)],
+            'sent_requests': [_profile_row(rng) for _ in range(20)]}
+
+
+def leaderboard(rng):
+    return [_profile_row(rng) for _ in range(100)]
+
+
+def stdlib_dumps(obj):
+    return (json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def orjson_dumps(obj):
+    return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+def measure(fn, obj, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(obj)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(42)
+    payloads = {'duel (20 q)': duel_payload(rng), 'full profile': full_profile(rng),
+                'friends list': friends_list(rng), 'leaderboard': leaderboard(rng)}
+
+    print(f"orjson: {'yes' if orjson else 'no'}, brotli: {'yes' if brotli else 'no'}, median of {repeats} runs")
+    print(f"{'payload':14} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8} {'stdlib B':>9} {'orjson B':>9} "
+          f"{'gzip B':>8} {'gzip ms':>8} {'br B':>8} {'br ms':>7}")
+    for name, obj in payloads.items():
+        std_ms = measure(stdlib_dumps, obj, repeats)
+        std_body = stdlib_dumps(obj)
+        fast_ms = measure(orjson_dumps, obj, repeats) if orjson else float('nan')
+        body = orjson_dumps(obj) if orjson else std_body
+        assert json.loads(body) == json.loads(std_body)
+        gz_ms = measure(lambda b: gzip.compress(b, compresslevel=GZIP_LEVEL), body, max(1, repeats // 4))
+        gz_len = len(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        if brotli:
+            br_ms = measure(lambda b: brotli.compress(b, quality=BROTLI_QUALITY), body, max(1, repeats // 4))
+            br_len = str(len(brotli.compress(body, quality=BROTLI_QUALITY)))
+            br_ms = f'{br_ms:.3f}'
+        else:
+            br_len, br_ms = '-', '-'
+        print(f"{name:14} {std_ms:10.3f} {fast_ms:10.3f} {std_ms / fast_ms:7.1f}x {len(std_body):9d} {len(body):9d} "
+              f"{gz_len:8d} {gz_ms:8.3f} {br_len:>8} {br_ms:>7}")
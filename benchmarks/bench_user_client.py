@@ -0,0 +1,53 @@
+"""Per-request istemci kurulum maliyetini ölçer.
+
+Eski yol: her istekte `create_client(...)` + token başlığı.
+Yeni yol: `extensions.get_user_client(token)` (önbellekli kullanıcı istemcisi).
+
+Ağ çağrısı yapılmaz; sadece istemci kurulumu ölçülür.
+
+    python -m benchmarks.bench_user_client [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase import create_client  # noqa: E402
+
+from extensions import url, key, get_user_client  # noqa: E402
+
+
+def old_path(token):
+    client = create_client(url, key)
+    client.postgrest.auth(token)
+    client.storage  # storage istemcisi ilk erişimde kurulur
+    return client
+
+
+def new_path(token):
+    client = get_user_client(token)
+    client.storage
+    return client
+
+
+def bench(fn, iterations, tokens):
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - started
+    return elapsed / iterations * 1e6
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    # Bir oyun oturumu aynı token'la onlarca istek gönderir; 20 eşzamanlı kullanıcı varsayılır
+    tokens = [f"token-{i}" for i in range(20)]
+    old_us = bench(old_path, iterations, tokens)
+    new_us = bench(new_path, iterations, tokens)
+    # Önbellek ısındıktan sonra (tüm token'lar için istemci kurulmuşken) isabet maliyeti
+    warm_us = bench(new_path, iterations, tokens)
+    print(f"create_client per request : {old_us:10.1f} us/request")
+    print(f"cached user client        : {new_us:10.1f} us/request (cold start dahil)")
+    print(f"cached user client (warm) : {warm_us:10.1f} us/request")
+    print(f"speedup                   : {old_us / new_us:10.1f}x")
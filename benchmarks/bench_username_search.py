@@ -0,0 +1,84 @@
+"""Username araması: tam tarama (`ILIKE '%q%'` eşdeğeri) ile önek/trigram indeksini karşılaştırır.
+
+Sentetik username'ler üretilir, indeks kurulur ve önek, alt dizi ve
+eşleşmeyen sorgular için sorgu başı gecikmeler ölçülür.
+
+    python -m benchmarks.bench_username_search [user_count] [query_count]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.username_search import UsernameSearchIndex  # noqa: E402
+
+SYLLABLES = ['ka', 'ze', 'mi', 'ro', 'tu', 'la', 'ne', 'so', 'vi', 'da', 'kor', 'mer', 'tan', 'yil', 'can',
+             'ali', 'ece', 'han', 'nur', 'pro', 'dark', 'king', 'star', 'wolf', 'gamer', 'xx']
+
+
+def make_usernames(count, seed=42):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.6:
+            name += str(rng.randint(0, 9999))
+        if rng.random() < 0.2:
+            name = name.capitalize()
+        names.add(name)
+    return [{'id': f'{i:08x}-0000-4000-8000-000000000000', 'username': n} for i, n in enumerate(sorted(names))]
+
+
+def make_queries(rows, count, seed=7):
+    rng = random.Random(seed)
+    queries = {'prefix': [], 'substring': [], 'short (2)': [], 'no match': []}
+    for _ in range(count):
+        name = rng.choice(rows)['username'].casefold()
+        queries['prefix'].append(name[:rng.randint(3, 5)])
+        start = rng.randint(1, max(1, len(name) - 4))
+        queries['substring'].append(name[start:start + rng.randint(3, 5)])
+        queries['short (2)'].append(name[:2])
+        queries['no match'].append('qj' + str(rng.randint(0, 99)) + 'zq')
+    return queries
+
+
+def naive_search(folded_rows, query, limit=10):
+    """Veritabanındaki indekssiz ILIKE'ın yaptığı gibi her ismi tarar, sonra sıralar."""
+    q = query.casefold()
+    hits = [(name.find(q) != 0, name.find(q), len(name), name, user_id)
+            for name, user_id in folded_rows if q in name]
+    hits.sort()
+    return hits[:limit]
+
+
+def measure(fn, queries):
+    samples = []
+    for q in queries:
+        started = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+if __name__ == '__main__':
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    rows = make_usernames(user_count)
+    folded_rows = [(r['username'].casefold(), r['id']) for r in rows]
+
+    started = time.perf_counter()
+    index = UsernameSearchIndex(rows)
+    build_ms = (time.perf_counter() - started) * 1000
+    exclude = {r['id'] for r in random.Random(1).sample(rows, 200)}
+
+    print(f"{len(index)} usernames, index build {build_ms:.0f} ms, {query_count} queries per kind")
+    print(f"{'query kind':12} {'scan p50':>10} {'scan p95':>10} {'index p50':>10} {'index p95':>10}  (ms)")
+    for kind, queries in make_queries(rows, query_count).items():
+        scan = measure(lambda q: naive_search(folded_rows, q), queries)
+        indexed = measure(lambda q: index.search(q, limit=10, exclude=exclude), queries)
+        print(f"{kind:12} {scan[0]:10.2f} {scan[1]:10.2f} {indexed[0]:10.3f} {indexed[1]:10.3f}")
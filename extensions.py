@@ -1,8 +1,228 @@
 import os
+import hashlib
+import threading
+import time
+from collections import deque
 from dotenv import load_dotenv
-from supabase import create_client, Client
+import httpx
+from supabase import create_client
+from postgrest import SyncPostgrestClient
+from storage3 import SyncStorageClient
+from utils import metrics
+from utils.cache import TTLCache
 
 load_dotenv()
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# Sunucu tarafı yetkili işlemler (service_role'e açık RPC'ler, RLS'li iç tablolar,
+# storage yönetimi) için; RLS'i atlar, hiçbir zaman istemciye gönderilmez
+service_key: str = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+
+# --- HTTP bağlantı havuzu ayarları ---
+# Tüm Supabase istemcileri (servis ve kullanıcı bazlı) aynı havuzu paylaşır.
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_CONNECTIONS', 50))
+SUPABASE_MAX_KEEPALIVE = int(os.environ.get('SUPABASE_MAX_KEEPALIVE', 20))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get('SUPABASE_KEEPALIVE_EXPIRY', 30))
+SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', '0') == '1'
+SUPABASE_CONNECT_TIMEOUT = float(os.environ.get('SUPABASE_CONNECT_TIMEOUT', 5))
+SUPABASE_READ_TIMEOUT = float(os.environ.get('SUPABASE_READ_TIMEOUT', 15))
+SUPABASE_WRITE_TIMEOUT = float(os.environ.get('SUPABASE_WRITE_TIMEOUT', 30))
+# Havuzda boş bağlantı beklenecek en uzun süre (doygunluk belirtisi)
+SUPABASE_POOL_TIMEOUT = float(os.environ.get('SUPABASE_POOL_TIMEOUT', 5))
+
+USER_CLIENT_CACHE_SIZE = int(os.environ.get('USER_CLIENT_CACHE_SIZE', 256))
+USER_CLIENT_TTL_SECONDS = float(os.environ.get('USER_CLIENT_TTL_SECONDS', 300))
+# Önbellekten düşen istemci, hâlâ onu kullanan istekler bitsin diye bu süre sonra kapatılır
+USER_CLIENT_CLOSE_GRACE_SECONDS = float(os.environ.get('USER_CLIENT_CLOSE_GRACE_SECONDS', 60))
+
+SUPABASE_TIMEOUT = httpx.Timeout(
+    connect=SUPABASE_CONNECT_TIMEOUT,
+    read=SUPABASE_READ_TIMEOUT,
+    write=SUPABASE_WRITE_TIMEOUT,
+    pool=SUPABASE_POOL_TIMEOUT,
+)
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class PooledTransport(httpx.BaseTransport):
+    """Tüm istemcilerin paylaştığı, ölçümlü HTTP transport'u.
+
+    Bağlantı havuzu süreç başına bir kez kurulur (gunicorn fork'undan sonra
+    yeniden oluşturulur). Aynı anda süren istek sayısı, tepe değer ve havuz
+    zaman aşımları /api/metrics altında raporlanır.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._inner = None
+        self._stats = {
+            'requests_total': 0,
+            'in_flight': 0,
+            'in_flight_peak': 0,
+            'pool_timeouts_total': 0,
+            'errors_total': 0,
+            'total_time_ms': 0.0,
+        }
+
+    def _transport(self):
+        if self._inner is None or self._pid != os.getpid():
+            with self._lock:
+                if self._inner is None or self._pid != os.getpid():
+                    self._inner = httpx.HTTPTransport(
+                        http2=SUPABASE_HTTP2 and _http2_available(),
+                        limits=httpx.Limits(
+                            max_connections=SUPABASE_MAX_CONNECTIONS,
+                            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+                        ),
+                    )
+                    self._pid = os.getpid()
+        return self._inner
+
+    def handle_request(self, request):
+        transport = self._transport()
+        with self._lock:
+            self._stats['requests_total'] += 1
+            self._stats['in_flight'] += 1
+            self._stats['in_flight_peak'] = max(self._stats['in_flight_peak'], self._stats['in_flight'])
+        started = time.perf_counter()
+        try:
+            return transport.handle_request(request)
+        except httpx.PoolTimeout:
+            with self._lock:
+                self._stats['pool_timeouts_total'] += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats['errors_total'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+                self._stats['total_time_ms'] += (time.perf_counter() - started) * 1000
+
+    def close(self):
+        # İstemciler kapansa da paylaşılan havuz süreç boyunca açık kalır
+        pass
+
+    def stats(self):
+        with self._lock:
+            requests_total = self._stats['requests_total']
+            return dict(
+                self._stats,
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                saturation=round(self._stats['in_flight'] / SUPABASE_MAX_CONNECTIONS, 3),
+                avg_time_ms=round(self._stats['total_time_ms'] / requests_total, 1) if requests_total else None,
+                http2=SUPABASE_HTTP2 and _http2_available(),
+            )
+
+
+pooled_transport = PooledTransport()
+metrics.register('http_pool', pooled_transport.stats)
+
+
+def _pooled_session(headers):
+    """Paylaşılan transport'u kullanan httpx istemcisi (postgrest/storage3 `http_client`)."""
+    return httpx.Client(headers=headers, timeout=SUPABASE_TIMEOUT, transport=pooled_transport,
+                        follow_redirects=True)
+
+
+class SupabaseClient:
+    """Paylaşılan bağlantı havuzunu kullanan Supabase istemcisi (PostgREST + Storage).
+
+    `token` verilirse istekler kullanıcının JWT'siyle yapılır, böylece RLS
+    politikaları doğru kullanıcıyı görür; verilmezse `api_key` (varsayılan
+    anon key) kullanılır. `auth` (gotrue) sadece uzak token doğrulaması
+    için, ilk erişimde kurulur.
+    """
+
+    def __init__(self, token=None, api_key=None):
+        api_key = api_key or key
+        headers = {'apikey': api_key, 'Authorization': f'Bearer {token or api_key}'}
+        self.postgrest = SyncPostgrestClient(f"{url}/rest/v1", headers=headers,
+                                             http_client=_pooled_session(headers))
+        self.storage = SyncStorageClient(f"{url}/storage/v1/", headers, http_client=_pooled_session(headers))
+        self._auth = None
+
+    def table(self, table_name):
+        return self.postgrest.from_(table_name)
+
+    def rpc(self, fn, params=None):
+        return self.postgrest.rpc(fn, params or {})
+
+    def close(self):
+        """İstemcinin HTTP oturumlarını kapatır (paylaşılan havuz açık kalır)."""
+        for session in (self.postgrest.session, self.storage.session):
+            try:
+                session.close()
+            except Exception as e:
+                print(f"[supabase] could not close client session: {e}")
+
+    @property
+    def auth(self):
+        if self._auth is None:
+            self._auth = create_client(url, key).auth
+        return self._auth
+
+
+# Tüm blueprint'lerin kullandığı tek servis istemcisi
+supabase = SupabaseClient()
+
+# service_role istemcisi; SUPABASE_SERVICE_ROLE_KEY yoksa None ve bu istemciyi
+# gerektiren yollar eski (anon'a açık) yollarına düşer
+service_supabase = SupabaseClient(api_key=service_key) if service_key else None
+if service_supabase is None:
+    print("Warning: SUPABASE_SERVICE_ROLE_KEY is not set; service-only RPCs, tables and storage operations are disabled")
+
+# Önbellekten düşen, kapatılmayı bekleyen istemciler: (düştüğü an, istemci)
+_retired_clients = deque()
+_retired_lock = threading.Lock()
+
+
+def _retire_user_client(_cache_key, client):
+    with _retired_lock:
+        _retired_clients.append((time.monotonic(), client))
+
+
+def _close_retired_clients():
+    cutoff = time.monotonic() - USER_CLIENT_CLOSE_GRACE_SECONDS
+    expired = []
+    with _retired_lock:
+        while _retired_clients and _retired_clients[0][0] <= cutoff:
+            expired.append(_retired_clients.popleft()[1])
+    for client in expired:
+        client.close()
+
+
+def _user_client_stats():
+    with _retired_lock:
+        retired = len(_retired_clients)
+    return dict(_user_clients.stats(), retired_pending_close=retired)
+
+
+# Aynı token ile gelen istekler aynı istemciyi kullanır
+_user_clients = TTLCache(USER_CLIENT_CACHE_SIZE, USER_CLIENT_TTL_SECONDS, on_evict=_retire_user_client)
+metrics.register('user_clients', _user_client_stats)
+
+
+def get_user_client(token):
+    """Token'a ait önbellekteki kullanıcı istemcisini döndürür, yoksa oluşturur.
+
+    Önbellekten düşen istemcilerin HTTP oturumları
+    USER_CLIENT_CLOSE_GRACE_SECONDS sonra burada kapatılır.
+    """
+    _close_retired_clients()
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    client = _user_clients.get(cache_key)
+    if client is None:
+        client = SupabaseClient(token)
+        _user_clients.set(cache_key, client)
+    return client
@@ -1,20 +1,31 @@
+from datetime import datetime, timezone
 from flask import Blueprint, jsonify, request
 from extensions import supabase
+from utils.auth import get_user_from_request
 
 achievements_bp = Blueprint('achievements_bp', __name__, url_prefix='/api/achievements')
 
 @achievements_bp.route('/', methods=['GET'])
 def get_user_achievements():
-    try:
-        auth_header = request.headers.get('Authorization')
-        jwt = auth_header.split(" ")[1]
-        user = supabase.auth.get_user(jwt).user
-        if not user: return jsonify(error="Invalid user"), 401
+    user, err = get_user_from_request(request)
+    if err: return err
 
+    try:
         # Kazanılan madalyaları, madalya bilgileriyle birleştirerek çek
-        response = supabase.table('user_achievements').select('earned_at, achievements(*)').eq('user_id', user.id).execute()
+        response = supabase.table('user_achievements').select('earned_at, seen_at, achievements(*)').eq('user_id', user.id).execute()
+
+        # Henüz görülmemiş madalyalar bu okumada bir kez 'is_new' ile işaretlenir
+        data = response.data or []
+        for item in data:
+            item['is_new'] = item.pop('seen_at', None) is None
+        # Sadece bu yanıtta gösterilenler görüldü sayılır; arada kazanılan bir madalya sonraki okumada gelir
+        new_ids = [(item.get('achievements') or {}).get('id') for item in data if item['is_new']]
+        new_ids = [i for i in new_ids if i is not None]
+        if new_ids:
+            supabase.table('user_achievements').update({'seen_at': datetime.now(timezone.utc).isoformat()}) \
+                .eq('user_id', user.id).in_('achievement_id', new_ids).is_('seen_at', 'null').execute()
 
-        return jsonify(response.data)
+        return jsonify(data)
     except Exception as e:
         print(f"Error in get_user_achievements: {e}")
         return jsonify(error="An internal server error occurred"), 500
\ No newline at end of file
@@ -1,32 +1,29 @@
-import os
 import random
 import uuid
 import json # JSON verilerini işlemek için
-from flask import Blueprint, request, jsonify
-from supabase import create_client, Client
+from flask import Blueprint, request, jsonify, g
+from extensions import supabase
 import traceback
+from utils.idempotency import run_idempotent
+from utils.auth import extract_token, verify_token
+from utils.thumbnails import with_avatar_variants
 
 duel_bp = Blueprint('duel', __name__,url_prefix='/api/duel')
 
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # --- Yardımcı Fonksiyonlar ---
 
 # JWT'den kullanıcı ID'sini çıkarmak için yeniden kullanılabilir fonksiyon
 def get_user_id_from_jwt():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or 'Bearer ' not in auth_header:
+    token = extract_token(request)
+    if not token:
         return None, "Authorization header is missing or malformed"
-    jwt = auth_header.split(' ')[1]
     try:
-        user_res = supabase.auth.get_user(jwt)
-        user_id = getattr(getattr(user_res, 'user', None), 'id', None)
-        if not user_id:
+        user = verify_token(token)
+        if not user or not user.id:
             return None, "Invalid or expired token, or user ID not found"
-        return user_id, None
+        g.user = user
+        return user.id, None
     except Exception as e:
         print(f"Token validation error: {e}")
         return None, "Token validation failed"
@@ -204,11 +201,14 @@ def get_my_duels():
     try:
         # Hem challenger hem de challenged olduğumuz duelleri çek
         # profiles tablosundan username ve avatar_url'i de çekmek için join kullanıyoruz
+        # (tek sorgu; ayrı bir profil turu gerekmez)
         response = supabase.table('duels').select(
             '*, challenger:challenger_id(username, avatar_url), challenged:challenged_id(username, avatar_url)'
         ).or_(f'challenger_id.eq.{user_id},challenged_id.eq.{user_id}').order('created_at', desc=True).execute()
-        
-        duels_data = response.data
+
+        duels_data = response.data or []
+        for duel in duels_data:
+            with_avatar_variants([duel.get('challenger'), duel.get('challenged')])
 
         # Duelleri bekleyen ve tamamlanmış olarak ayrıştırabiliriz (isteğe bağlı)
         pending_challenges_for_me = [] # Bana gelen ve benim oynamam gereken dueller
@@ -303,7 +303,11 @@ def submit_duel_result(duel_id):
     user_id, error = get_user_id_from_jwt()
     if error:
         return jsonify(error=error), 401
+    # Tekrar denenen sonuç gönderimleri saklanan yanıtı alır
+    return run_idempotent(user_id, f'submit-duel-result:{duel_id}', lambda: _submit_duel_result(user_id, duel_id))
+
 
+def _submit_duel_result(user_id, duel_id):
     data = request.get_json()
     player_score = data.get('score')
     player_time_taken = data.get('time_taken')
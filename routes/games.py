@@ -4,6 +4,8 @@ import traceback
 from flask import Blueprint, app, jsonify, request
 
 from .extensions import supabase
+from utils.auth import get_user_from_request
+from utils.fanout import gather
 games_bp = Blueprint('games_bp', __name__, url_prefix='/api/games')
 
 # --- SENTENCE SCRAMBLE (GET) - GÜNCELLENDİ ---
@@ -337,36 +339,6 @@ def get_mixed_rush_question():
 @games_bp.route("/<game_slug>/<category_slug>/levels")
 def get_levels_for_category(game_slug, category_slug):
     """Belirli bir oyun ve kategori için mevcut olan tüm seviyeleri listeler ve kilit durumunu döner."""
-    # Auth helper function
-    def get_user_from_request(current_request):
-        auth_header = current_request.headers.get('Authorization')
-        if not auth_header or ' ' not in auth_header:
-            return None, (jsonify(error="Authorization header missing or malformed"), 401)
-        token = auth_header.split(' ', 1)[1].strip()
-        # tolerate JSON-wrapped token
-        if token.startswith('{'):
-            try:
-                import json
-                parsed = json.loads(token)
-                token = parsed.get('access_token') or parsed.get('accessToken') or parsed.get('token') or (parsed.get('data') or {}).get('access_token')
-            except Exception:
-                pass
-        try:
-            user_resp = supabase.auth.get_user(token)
-            user = None
-            if hasattr(user_resp, 'user'):
-                user = user_resp.user
-            elif isinstance(user_resp, dict):
-                user = user_resp.get('user') or (user_resp.get('data') and user_resp['data'].get('user'))
-            
-            if not user:
-                return None, (jsonify(error="Invalid or expired token"), 401)
-            
-            return user, None
-        except Exception as e:
-            print(f"Auth validation error in get_levels_for_category: {e}")
-            return None, (jsonify(error="Failed to validate token"), 401)
-    
     # Bu endpoint artık kimlik doğrulaması gerektiriyor
     user, err = get_user_from_request(request)
     if err:
@@ -382,26 +354,29 @@ def get_levels_for_category(game_slug, category_slug):
             return jsonify(error=f"Category '{category_slug}' not found."), 404
         category_id = category_response.data['id']
 
-        # 1. Bu kategoride var olan tüm seviyeleri (game_items tablosundan) bul
-        all_levels_res = supabase.table('game_items').select('level').eq('category_id', category_id).order('level').execute()
+        # 1. Bu kategoride var olan tüm seviyeler ve 2. kullanıcının bu kategori,
+        # bu dil için tamamladığı en yüksek seviye birbirinden bağımsızdır; paralel çekilir
+        UNLOCK_THRESHOLD = int(os.environ.get('UNLOCK_THRESHOLD', 25))
+        user_id = user.id if hasattr(user, 'id') else user.get('id')
+
+        all_levels_res, highest_completed_res = gather(
+            lambda: supabase.table('game_items').select('level').eq('category_id', category_id).order('level').execute(),
+            lambda: supabase.table('user_level_progress')
+                            .select('level')
+                            .eq('user_id', user_id)
+                            .eq('category_id', category_id)
+                            .eq('language_code', language_code)
+                            .gte('score', UNLOCK_THRESHOLD)
+                            .order('level', desc=True)
+                            .limit(1)
+                            .execute(),
+        )
         if not all_levels_res.data:
             return jsonify([])
 
         # Tekrar eden seviyeleri temizle ve sırala
         all_levels = sorted(list(set([item['level'] for item in all_levels_res.data])))
 
-        # 2. Kullanıcının bu kategori, bu dil için tamamladığı en yüksek seviyeyi bul
-        UNLOCK_THRESHOLD = int(os.environ.get('UNLOCK_THRESHOLD', 25))
-
-        highest_completed_res = supabase.table('user_level_progress') \
-                                        .select('level') \
-                                        .eq('user_id', user.id if hasattr(user, 'id') else user.get('id')) \
-                                        .eq('category_id', category_id) \
-                                        .eq('language_code', language_code) \
-                                        .gte('score', UNLOCK_THRESHOLD) \
-                                        .order('level', desc=True) \
-                                        .limit(1) \
-                                        .execute()
         highest_completed_level = 0
         if highest_completed_res.data:
             highest_completed_level = highest_completed_res.data[0]['level']
@@ -1,20 +1,40 @@
 from flask import Blueprint, jsonify, request
 from extensions import supabase
+from utils.score_buckets import score_buckets
+from utils.pagination import page_params, apply_keyset, keyset_slice, keyset_rpc_params, build_page
+from utils.profiles import get_profile_loader
+from utils.thumbnails import with_avatar_variants
 
 leaderboard_bp = Blueprint('leaderboard_bp', __name__, url_prefix='/api/leaderboard')
 
+# Sayfalı mod: ?page_size=N ve/veya ?cursor=... verildiğinde tüm liderlik
+# tabloları (score desc, id asc) sırasıyla {items, next_cursor} döndürür.
+# Sayfalar SQL'de keyset uygulayan *_page RPC'lerinden okunur
+# (sql/leaderboard_keyset.sql); yüklü değilse eski yollara düşülür.
+# Parametresiz çağrılar eski liste formatını korur.
+
 @leaderboard_bp.route('/total-score')
 def get_total_score_leaderboard():
     try:
+        paged, page_size, cursor = page_params(request.args)
         # Try RPC first, fallback to manual query with avatar_url
         try:
-            response = supabase.rpc('get_leaderboard_total_score').execute()
+            if paged:
+                query = supabase.rpc('get_leaderboard_total_score_page', keyset_rpc_params(cursor, page_size))
+            else:
+                query = supabase.rpc('get_leaderboard_total_score')
+            response = query.execute()
             data = response.data or []
         except:
             # Fallback: manual query with avatar_url join
-            response = supabase.table('profiles').select('id, username, total_score, avatar_url').order('total_score', desc=True).limit(50).execute()
+            query = supabase.table('profiles').select('id, username, total_score, avatar_url')
+            if paged:
+                query = apply_keyset(query, 'total_score', cursor, page_size)
+            else:
+                query = query.order('total_score', desc=True).limit(50)
+            response = query.execute()
             data = response.data or []
-            
+
         # sanitize: ensure numeric scores and avatar_url exist to avoid frontend errors
         for item in data:
             if 'total_score' in item:
@@ -28,6 +48,9 @@ def get_total_score_leaderboard():
                 except Exception:
                     item['mixed_rush_highscore'] = 0
             item.setdefault('avatar_url', None)
+        with_avatar_variants(data)
+        if paged:
+            return jsonify(build_page(data, 'total_score', page_size))
         return jsonify(data)
     except Exception as e:
         return jsonify(error=str(e)), 500
@@ -37,24 +60,34 @@ def get_total_scores_leaderboard():
     """Frontend compatibility endpoint with limit support"""
     try:
         limit = request.args.get('limit', 10, type=int)
-        
+        paged, page_size, cursor = page_params(request.args, default_size=limit or 10)
+
         # Try RPC first, fallback to manual query with avatar_url
         try:
-            response = supabase.rpc('get_leaderboard_total_score').execute()
+            # Limit/keyset RPC sonucuna sunucu tarafında uygulanır,
+            # tüm liste çekilip Python'da kesilmez.
+            if paged:
+                query = supabase.rpc('get_leaderboard_total_score_page', keyset_rpc_params(cursor, page_size))
+            else:
+                query = supabase.rpc('get_leaderboard_total_score')
+                if limit:
+                    query = query.limit(limit)
+            response = query.execute()
             data = response.data or []
-            
+
             # Check if avatar_url is missing from RPC result
             if data and not any('avatar_url' in item for item in data[:3]):
                 raise Exception("RPC missing avatar_url")
-                
+
         except:
             # Fallback: manual query with avatar_url join
-            response = supabase.table('profiles').select('id, username, total_score, avatar_url').order('total_score', desc=True).limit(limit or 50).execute()
+            query = supabase.table('profiles').select('id, username, total_score, avatar_url')
+            if paged:
+                query = apply_keyset(query, 'total_score', cursor, page_size)
+            else:
+                query = query.order('total_score', desc=True).limit(limit or 50)
+            response = query.execute()
             data = response.data or []
-        
-        # Limit the results if specified and using RPC
-        if limit and isinstance(data, list) and len(data) > limit:
-            data = data[:limit]
 
         # sanitize
         for item in data:
@@ -64,7 +97,10 @@ def get_total_scores_leaderboard():
                 except Exception:
                     item['total_score'] = 0
             item.setdefault('avatar_url', None)
+        with_avatar_variants(data)
 
+        if paged:
+            return jsonify(build_page(data, 'total_score', page_size))
         return jsonify(data)
     except Exception as e:
         return jsonify(error=str(e)), 500
@@ -72,20 +108,30 @@ def get_total_scores_leaderboard():
 @leaderboard_bp.route('/mixed-rush')
 def get_mixed_rush_leaderboard():
     try:
+        paged, page_size, cursor = page_params(request.args)
         # Try RPC first, fallback to manual query with avatar_url
         try:
-            response = supabase.rpc('get_leaderboard_mixed_rush').execute()
+            if paged:
+                query = supabase.rpc('get_leaderboard_mixed_rush_page', keyset_rpc_params(cursor, page_size))
+            else:
+                query = supabase.rpc('get_leaderboard_mixed_rush')
+            response = query.execute()
             data = response.data or []
-            
+
             # Check if avatar_url is missing from RPC result
             if data and not any('avatar_url' in item for item in data[:3]):
                 raise Exception("RPC missing avatar_url")
-                
+
         except:
             # Fallback: manual query with avatar_url join
-            response = supabase.table('profiles').select('id, username, mixed_rush_highscore, avatar_url').order('mixed_rush_highscore', desc=True).limit(50).execute()
+            query = supabase.table('profiles').select('id, username, mixed_rush_highscore, avatar_url')
+            if paged:
+                query = apply_keyset(query, 'mixed_rush_highscore', cursor, page_size)
+            else:
+                query = query.order('mixed_rush_highscore', desc=True).limit(50)
+            response = query.execute()
             data = response.data or []
-            
+
         # sanitize
         for item in data:
             if 'mixed_rush_highscore' in item:
@@ -94,6 +140,9 @@ def get_mixed_rush_leaderboard():
                 except Exception:
                     item['mixed_rush_highscore'] = 0
             item.setdefault('avatar_url', None)
+        with_avatar_variants(data)
+        if paged:
+            return jsonify(build_page(data, 'mixed_rush_highscore', page_size))
         return jsonify(data)
     except Exception as e:
         return jsonify(error=str(e)), 500
@@ -101,29 +150,32 @@ def get_mixed_rush_leaderboard():
 @leaderboard_bp.route('/game/<game_slug>')
 def get_game_leaderboard(game_slug):
     try:
+        paged, page_size, cursor = page_params(request.args)
         # Try RPC first, fallback to manual query with avatar_url
         try:
-            response = supabase.rpc('get_leaderboard_for_game', {'p_game_slug': game_slug}).execute()
+            if paged:
+                query = supabase.rpc('get_leaderboard_for_game_page',
+                                     dict(keyset_rpc_params(cursor, page_size), p_game_slug=game_slug))
+            else:
+                query = supabase.rpc('get_leaderboard_for_game', {'p_game_slug': game_slug})
+            response = query.execute()
             data = response.data or []
-            
+
             # Check if avatar_url is missing from RPC result
             if data and not any('avatar_url' in item for item in data[:3]):
                 raise Exception("RPC missing avatar_url")
-                
+
         except:
             # Fallback: implement aggregation in Python using existing tables
             try:
-                # 1) find game_type id by slug
-                gt_res = supabase.table('game_types').select('id, slug, name').eq('slug', game_slug).single().execute()
-                if not gt_res.data:
-                    return jsonify([])
-                gt_id = gt_res.data['id']
-
-                # 2) get categories for this game type
-                cats_res = supabase.table('categories').select('id').eq('game_type_id', gt_id).execute()
+                empty = build_page([], 'total_score_for_game', page_size) if paged else []
+
+                # 1-2) get categories for this game type, filtering on the
+                # game type slug through the embedded join (one round trip)
+                cats_res = supabase.table('categories').select('id, game_types!inner(slug)').eq('game_types.slug', game_slug).execute()
                 cat_ids = [c['id'] for c in (cats_res.data or [])]
                 if not cat_ids:
-                    return jsonify([])
+                    return jsonify(empty)
 
                 # 3) fetch user_level_progress rows for these categories
                 progress_res = supabase.table('user_level_progress').select('user_id, score').in_('category_id', cat_ids).execute()
@@ -140,34 +192,96 @@ def get_game_leaderboard(game_slug):
                     totals[uid] = totals.get(uid, 0) + s
 
                 if not totals:
-                    return jsonify([])
+                    return jsonify(empty)
 
-                # 5) fetch profiles for these users
-                user_ids = list(totals.keys())
-                profiles_res = supabase.table('profiles').select('id, username, avatar_url').in_('id', user_ids).execute()
-                profiles = {p['id']: p for p in (profiles_res.data or [])}
+                # 5) sort and limit before fetching profiles, so only the
+                # visible page is joined with profile data
+                ranked = [{'id': uid, 'total_score_for_game': int(score)} for uid, score in totals.items()]
+                if paged:
+                    ranked = keyset_slice(ranked, 'total_score_for_game', cursor, page_size)
+                else:
+                    ranked.sort(key=lambda x: x['total_score_for_game'], reverse=True)
+                    ranked = ranked[:50]
 
-                # 6) build leaderboard list
+                # 6) fetch profiles for these users
+                profiles = get_profile_loader().get_many([r['id'] for r in ranked])
+
+                # 7) build leaderboard list
                 result = []
-                for uid, score in totals.items():
-                    prof = profiles.get(uid, {})
+                for r in ranked:
+                    prof = profiles.get(r['id'], {})
                     result.append({
-                        'id': uid,
+                        'id': r['id'],
                         'username': prof.get('username') or None,
                         'avatar_url': prof.get('avatar_url') or None,
-                        'total_score_for_game': int(score)
+                        'total_score_for_game': r['total_score_for_game']
                     })
-
-                # sort and limit
-                result.sort(key=lambda x: x['total_score_for_game'], reverse=True)
-                result = result[:50]
                 data = result
             except Exception as e:
                 return jsonify(error=str(e)), 500
-            
+
         # sanitize
         for item in data:
             item.setdefault('avatar_url', None)
+        with_avatar_variants(data)
+        if paged:
+            return jsonify(build_page(data, 'total_score_for_game', page_size))
         return jsonify(data)
     except Exception as e:
-        return jsonify(error=str(e)), 500
\ No newline at end of file
+        return jsonify(error=str(e)), 500
+
+
+def _windowed_leaderboard(period='week', days=None):
+    """Veritabanındaki gün kovalarından top-K listesi oluşturur ve profil bilgileriyle birleştirir."""
+    game = request.args.get('game')
+    paged, page_size, cursor = page_params(request.args)
+    if not paged:
+        page_size = max(1, min(request.args.get('limit', 50, type=int) or 50, 100))
+    top = score_buckets.page(cursor, page_size, game=game, period=period, days=days)
+    if not paged:
+        top = top[:page_size]
+
+    result = []
+    if top:
+        profiles = get_profile_loader().get_many([r['user_id'] for r in top])
+
+        for r in top:
+            prof = profiles.get(r['user_id'], {})
+            result.append({
+                'id': r['user_id'],
+                'username': prof.get('username'),
+                'avatar_url': prof.get('avatar_url'),
+                'score': int(r.get('score') or 0)
+            })
+    with_avatar_variants(result)
+    if paged:
+        return build_page(result, 'score', page_size)
+    return result
+
+
+@leaderboard_bp.route('/daily')
+def get_daily_leaderboard():
+    """Bugünün liderlik tablosu (?game=<slug> ile oyun bazlı)."""
+    try:
+        return jsonify(_windowed_leaderboard(period='day'))
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+
+@leaderboard_bp.route('/weekly')
+def get_weekly_leaderboard():
+    """Bu haftanın (pazartesi başlangıçlı) liderlik tablosu."""
+    try:
+        return jsonify(_windowed_leaderboard(period='week'))
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+
+@leaderboard_bp.route('/window')
+def get_rolling_window_leaderboard():
+    """Son N günün kayan pencere liderlik tablosu (?days=7 varsayılan)."""
+    try:
+        days = request.args.get('days', 7, type=int) or 7
+        return jsonify(_windowed_leaderboard(days=days))
+    except Exception as e:
+        return jsonify(error=str(e)), 500
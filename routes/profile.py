@@ -1,20 +1,19 @@
-from flask import Blueprint, jsonify, request
-from extensions import supabase
-from supabase import create_client
 import os
-import traceback
 import uuid
-
-def get_user_from_request(request):
-    """Extracts user from JWT in Authorization header, returns (user, error_response)"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or 'Bearer ' not in auth_header:
-        return None, (jsonify(error="Authorization header is missing or malformed"), 401)
-    jwt = auth_header.split(" ")[1]
-    user_res = supabase.auth.get_user(jwt)
-    if user_res.user is None:
-        return None, (jsonify(error="Invalid or expired token"), 401)
-    return user_res.user, None
+from flask import Blueprint, jsonify, request, send_from_directory
+from extensions import supabase
+import traceback
+from utils.auth import get_user_from_request, extract_token, verify_token
+from utils.profiles import invalidate_profile, get_full_profile, get_cached_full_profile
+from utils.fanout import gather
+from utils.usernames import username_index
+from utils.storage import (
+    AVATAR_MAX_BYTES, AVATAR_ALLOWED_TYPES, AVATAR_STORAGE, DIRECT_UPLOADS_ENABLED, IMAGE_EXTENSIONS,
+    MULTIPART_OVERHEAD_BYTES,
+    UploadTooLarge, UnsupportedImageType, InvalidUploadTicket, avatar_storage, create_avatar_upload,
+    iter_file, iter_limited, open_image_stream, sniff_image_type, spool_stream, verify_upload_ticket,
+)
+from utils.thumbnails import thumbnail_pipeline
 
 profile_bp = Blueprint('profile_bp', __name__, url_prefix='/api/profile')
 
@@ -22,29 +21,19 @@ profile_bp = Blueprint('profile_bp', __name__, url_prefix='/api/profile')
 @profile_bp.route('/', methods=['GET'])
 def get_user_profile():
     """Giriş yapmış kullanıcının kendi tam profilini getirir."""
+    user, err = get_user_from_request(request)
+    if err: return err
+
     try:
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or 'Bearer ' not in auth_header:
-            return jsonify(error="Authorization header is missing or malformed"), 401
-        
-        jwt = auth_header.split(" ")[1]
-        user_res = supabase.auth.get_user(jwt)
+        user_id = user.id
         
-        if user_res.user is None:
-            return jsonify(error="Invalid or expired token"), 401
-        
-        user_id = user_res.user.id
-        
-        # 2. Veritabanı fonksiyonunu çağır
-        response = supabase.rpc('get_full_profile_by_id', {'p_user_id': user_id}).execute()
-
-        # Supabase RPC'leri liste içinde tek bir dict döndürür
-        if not response.data or not response.data[0]:
+        # 2. Veritabanı fonksiyonunu çağır (kendi profili önbellekten okunmaz)
+        full_profile = get_full_profile(user_id, fresh=True)
+        if not full_profile:
             return jsonify(error="Profile not found or data incomplete for current user"), 404
-        
-        # RPC'den dönen veriyi doğrudan JSON olarak gönder
+
         # Bu, profile, game_scores ve achievements'ı içeren bir JSON objesi olacaktır.
-        return jsonify(response.data[0])
+        return jsonify(full_profile)
         
     except Exception as e:
         print(f"Error in get_user_profile: {e}")
@@ -52,26 +41,34 @@ def get_user_profile():
         traceback.print_exc()
         return jsonify(error="An internal server error occurred"), 500
 
+def _is_own_profile(user_id):
+    """İstek token'ı varsa ve `user_id`'ye aitse True (token zorunlu değildir)."""
+    token = extract_token(request)
+    if not token:
+        return False
+    try:
+        viewer = verify_token(token)
+    except Exception:
+        return False
+    return bool(viewer) and str(viewer.id) == str(user_id)
+
+
 # HERKESE AÇIK PROFİL (LİDERLİK TABLOSU İÇİN)
 @profile_bp.route('/<username>', methods=['GET'])
 def get_public_profile(username):
     """Username'e göre bir kullanıcının herkese açık tam profilini getirir."""
     try:
-        # 1. Önce username'den user_id'yi bul
-        user_id_res = supabase.table('profiles').select('id').eq('username', username).single().execute()
-        if not user_id_res.data:
+        # 1. Önce username'den user_id'yi bul (indeksli username kolonundan)
+        user_id = username_index.resolve(username)
+        if not user_id:
             return jsonify(error=f"Profile not found for username: {username}"), 404
         
-        user_id = user_id_res.data['id']
-        
-        # 2. Veritabanı fonksiyonunu çağır
-        response = supabase.rpc('get_full_profile_by_id', {'p_user_id': user_id}).execute()
-
-        if not response.data or not response.data[0]:
+        # 2. Veritabanı fonksiyonunu çağır (önbellekte yoksa; kullanıcı kendi profiline bakıyorsa her zaman)
+        full_profile = get_full_profile(user_id, fresh=_is_own_profile(user_id))
+        if not full_profile:
             return jsonify(error="Profile data incomplete for user"), 404
 
-        # RPC'den dönen veriyi doğrudan JSON olarak gönder
-        return jsonify(response.data[0])
+        return jsonify(full_profile)
     except Exception as e:
         print(f"Error in get_public_profile: {e}")
         import traceback
@@ -79,6 +76,84 @@ def get_public_profile(username):
         return jsonify(error="An internal server error occurred"), 500
     
 
+# Tek istekte istenebilecek en fazla profil sayısı
+PROFILE_BATCH_MAX = int(os.environ.get('PROFILE_BATCH_MAX', 50))
+# Bir toplu istekte aynı anda çalışan get_full_profile_by_id RPC'si sayısı
+PROFILE_BATCH_CONCURRENCY = int(os.environ.get('PROFILE_BATCH_CONCURRENCY', 8))
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+# TOPLU HERKESE AÇIK PROFİL (liderlik tablosu / düello ekranları için)
+@profile_bp.route('/batch', methods=['POST', 'OPTIONS'])
+def get_public_profiles_batch():
+    """{"usernames": [...], "ids": [...]} için tam profilleri tek yanıtta döndürür.
+
+    Username'ler tek bir indeksli sorguyla, profiller önbellekten çözülür;
+    önbellekte olmayanlar için RPC'ler paralel thread'lerde (en fazla
+    PROFILE_BATCH_CONCURRENCY tanesi aynı anda) çalışır. UUID olmayan
+    id'ler sorgulanmadan not_found'a yazılır.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    body = request.get_json(silent=True) or {}
+    usernames = [str(u) for u in body.get('usernames') or [] if u]
+    ids = [str(i) for i in body.get('ids') or [] if i]
+    if not usernames and not ids:
+        return jsonify(error="usernames or ids is required"), 400
+    if len(usernames) + len(ids) > PROFILE_BATCH_MAX:
+        return jsonify(error=f"At most {PROFILE_BATCH_MAX} profiles can be requested at once"), 400
+
+    try:
+        requested = {i: i for i in ids if _is_uuid(i)}
+        if usernames:
+            requested.update(username_index.resolve_many(usernames))
+
+        full_profiles = {}
+        missing = []
+        for user_id in dict.fromkeys(requested.values()):
+            cached = get_cached_full_profile(user_id)
+            if cached is None:
+                missing.append(user_id)
+            else:
+                full_profiles[user_id] = cached
+        if missing:
+            fetched = gather(*[lambda uid=uid: get_full_profile(uid) for uid in missing],
+                             limit=PROFILE_BATCH_CONCURRENCY)
+            full_profiles.update(zip(missing, fetched))
+
+        profiles, not_found = {}, []
+        for key in usernames + ids:
+            full_profile = full_profiles.get(requested.get(key))
+            if full_profile:
+                profiles[key] = full_profile
+            else:
+                not_found.append(key)
+        return jsonify(profiles=profiles, not_found=not_found)
+    except Exception as e:
+        print(f"Error in get_public_profiles_batch: {e}")
+        traceback.print_exc()
+        return jsonify(error="An internal server error occurred"), 500
+
+
+def _stream_size(stream):
+    """Geri sarılabilen akışın boyutunu okumadan ölçer (ölçülemezse None)."""
+    try:
+        stream.seek(0, 2)
+        size = stream.tell()
+        stream.seek(0)
+        return size
+    except Exception:
+        return None
+
+
 # YENİ: Avatar URL'ini güncelleyen endpoint
 # Compatibility route for older frontend upload path
 @profile_bp.route('/upload-avatar', methods=['POST', 'OPTIONS'])
@@ -88,49 +163,11 @@ def upload_avatar():
     if request.method == 'OPTIONS':
         return jsonify({}), 200
 
-    # --- Debug: incoming request metadata (temporary; remove in prod if noisy) ---
-    try:
-        print("---- upload-avatar request start ----")
-        print("Content-Type:", request.content_type)
-        print("Headers:", dict(request.headers))
-        print("Form keys:", list(request.form.keys()))
-        print("Files keys:", list(request.files.keys()))
-        print("Has JSON:", request.is_json)
-        print("JSON (silent):", request.get_json(silent=True))
-        print("---- upload-avatar request end ----")
-    except Exception as _:
-        # swallow debug print errors
-        pass
-
     # Auth header required
-    auth_header = request.headers.get('Authorization') or request.headers.get('authorization')
-    if not auth_header or 'Bearer ' not in auth_header:
-        return jsonify(error="Authorization header is missing or malformed"), 401
-    jwt = auth_header.split(' ')[1]
-
-    # Validate token and get user id (robust to supabase client return shapes)
-    try:
-        user_res = supabase.auth.get_user(jwt)
-        # supabase-py versions differ; try to pull user id from known shapes
-        user_id = None
-        # shape: result.data.user
-        try:
-            user_id = (user_res.get('data') or {}).get('user', {}).get('id')
-        except Exception:
-            pass
-        # fallback shape: user_res.user.id
-        if not user_id:
-            try:
-                user_obj = getattr(user_res, 'user', None) or getattr(user_res, 'data', {}).get('user', None)
-                user_id = getattr(user_obj, 'id', None) if user_obj else None
-            except Exception:
-                user_id = None
-        if not user_id:
-            return jsonify(error="Invalid or expired token, or user ID not found"), 401
-    except Exception as e:
-        print(f"Token validation error: {e}")
-        traceback.print_exc()
-        return jsonify(error="Token validation failed"), 401
+    user, err = get_user_from_request(request)
+    if err: return err
+    user_id = user.id
+    jwt = extract_token(request)
 
     # 1) JSON path: placeholder/external URL update
     if request.is_json:
@@ -141,13 +178,23 @@ def upload_avatar():
                 return jsonify(error="avatar_url is empty"), 400
             try:
                 supabase.table('profiles').update({'avatar_url': new_avatar_url}).eq('id', user_id).execute()
+                invalidate_profile(user_id)
                 return jsonify(avatar_url=new_avatar_url), 200
             except Exception as e:
                 print(f"Update avatar_url from static URL failed: {e}")
                 traceback.print_exc()
                 return jsonify(error="Failed to update avatar URL"), 500
 
-    # 2) Multipart/form-data path: uploaded file
+    # Gövde okunmadan önce beyan edilen boyutu kontrol et
+    if request.content_length and request.content_length > AVATAR_MAX_BYTES + MULTIPART_OVERHEAD_BYTES:
+        return jsonify(error=f"Avatar must be at most {AVATAR_MAX_BYTES} bytes"), 413
+
+    # 2) Raw body path: Content-Type: image/* ile gövde doğrudan dosyadır,
+    # istek akışı parça parça storage'a aktarılır
+    if request.mimetype in AVATAR_ALLOWED_TYPES:
+        return _store_avatar(user_id, jwt, request.stream, request.content_length)
+
+    # 3) Multipart/form-data path: uploaded file
     # Accept several possible field names
     file_field = None
     for candidate in ('file', 'avatar', 'image', 'upload'):
@@ -159,81 +206,162 @@ def upload_avatar():
         file = request.files.get(file_field)
         if not file or file.filename == '':
             return jsonify(error="No file selected"), 400
+        # İstemcinin beyan ettiği tip izinli değilse içeriği hiç okumadan reddet
+        if file.mimetype and file.mimetype != 'application/octet-stream' and file.mimetype not in AVATAR_ALLOWED_TYPES:
+            return jsonify(error=f"Unsupported image type: {file.mimetype}"), 415
+        size = _stream_size(file.stream)
+        if size is not None and size > AVATAR_MAX_BYTES:
+            return jsonify(error=f"Avatar must be at most {AVATAR_MAX_BYTES} bytes"), 413
+        return _store_avatar(user_id, jwt, file.stream, size)
 
-        try:
-            # Normalize filename / extension
-            ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else 'png'
-            # Build path in storage (do NOT duplicate bucket name)
-            # When using supabase.storage.from_('avatars'), the upload path should be relative to the bucket.
-            storage_path = f"{user_id}/{uuid.uuid4().hex}.{ext}"
+    # No JSON avatar_url and no files
+    return jsonify(error="No avatar_url or file provided"), 400
 
-            # Ensure stream at start and read bytes
-            try:
-                file.stream.seek(0)
-            except Exception:
-                pass
-            file_bytes = file.read()
-            content_type = file.mimetype or 'application/octet-stream'
-
-            # Upload to Supabase Storage - do the upload as the authenticated user
-            # Create a user-scoped client and set the Authorization header so RLS policies see the correct user
-            try:
-                user_supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
-                # Set Authorization header for storage requests to the user's JWT
-                try:
-                    user_supabase.storage._client.headers["Authorization"] = f"Bearer {jwt}"
-                except Exception:
-                    # older/newer client shapes
-                    try:
-                        user_supabase.postgrest._client.headers["Authorization"] = f"Bearer {jwt}"
-                    except Exception:
-                        pass
-
-                upload_res = user_supabase.storage.from_('avatars').upload(
-                    storage_path,
-                    file_bytes,
-                    file_options={'content-type': content_type, 'x-upsert': 'true'}
-                )
-            except Exception as upload_exc:
-                print("Supabase upload failed:", upload_exc)
-                raise
-            print("Supabase upload response:", upload_res)
-
-            # Get public URL - return shape varies by supabase-py version
-            public_url_res = supabase.storage.from_('avatars').get_public_url(storage_path)
-            avatar_url = None
-            # normalize common shapes
-            try:
-                if isinstance(public_url_res, dict):
-                    avatar_url = public_url_res.get('publicUrl') or public_url_res.get('public_url') or public_url_res.get('url')
-                else:
-                    # Some client versions return an object with .get('publicUrl') or a simple string
-                    avatar_url = str(public_url_res)
-            except Exception:
-                avatar_url = str(public_url_res)
-
-            if not avatar_url:
-                # Last resort: try to construct URL from known bucket base (if you host under a fixed domain)
-                # WARNING: adjust this to match your Supabase project if needed, or prefer explicit get_public_url result.
-                try:
-                    supabase_base = supabase.storage.base_url if hasattr(supabase.storage, 'base_url') else None
-                    if supabase_base:
-                        avatar_url = f"{supabase_base}/object/public/avatars/{storage_path}"
-                except Exception:
-                    avatar_url = None
-
-            if not avatar_url:
-                print("Warning: could not determine public avatar URL from supabase response:", public_url_res)
-
-            # Update profile table
-            supabase.table('profiles').update({'avatar_url': avatar_url}).eq('id', user_id).execute()
-
-            return jsonify(avatar_url=avatar_url), 200
-
-        except Exception as e:
-            traceback.print_exc()
-            print(f"File upload and avatar update error: {e}")
-            return jsonify(error="An internal server error occurred during avatar upload"), 500
 
-    # No JSON avatar_url and no files
-    return jsonify(error="No avatar_url or file provided"), 400
\ No newline at end of file
+def _store_avatar(user_id, jwt, stream, length):
+    """Akışı doğrulayıp storage'a yükler ve profilin avatar_url'ini günceller."""
+    try:
+        content_type, chunks = open_image_stream(stream)
+    except UnsupportedImageType as e:
+        return jsonify(error=f"Unsupported image type: {e}"), 415
+
+    try:
+        # Akış geçici dosyaya alınırken içerik hash'i hesaplanır; aynı görsel
+        # aynı yola yazılır ve küçük görselleri bir kez üretilir
+        spool, content_hash, size = spool_stream(chunks)
+    except UploadTooLarge:
+        return jsonify(error=f"Avatar must be at most {AVATAR_MAX_BYTES} bytes"), 413
+
+    # Build path in storage (relative to the bucket); extension follows the sniffed type
+    storage_path = f"{user_id}/{content_hash}.{IMAGE_EXTENSIONS[content_type]}"
+    try:
+        # Upload as the authenticated user so RLS policies see the correct user
+        avatar_storage.upload(storage_path, iter_file(spool), content_type, token=jwt, length=size)
+    except Exception as e:
+        spool.close()
+        traceback.print_exc()
+        print(f"Avatar upload failed: {e}")
+        return jsonify(error="An internal server error occurred during avatar upload"), 500
+    # Küçük görseller arka planda üretilir; spool'u iş kapatır
+    thumbnail_pipeline.submit(content_hash, spool)
+
+    try:
+        avatar_url = avatar_storage.public_url(storage_path)
+        supabase.table('profiles').update({'avatar_url': avatar_url}).eq('id', user_id).execute()
+        invalidate_profile(user_id)
+        return jsonify(avatar_url=avatar_url), 200
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Avatar update error: {e}")
+        return jsonify(error="An internal server error occurred during avatar upload"), 500
+
+
+# --- Doğrudan storage'a yükleme ---
+# 1) POST /avatar/upload-url -> kısa ömürlü yükleme URL'i + upload_id
+# 2) İstemci dosyayı bu URL'e PUT eder (API katmanından geçmez)
+# 3) POST /avatar/complete {upload_id} -> nesne doğrulanır, avatar_url güncellenir
+# AVATAR_UPLOAD_SECRET tanımlı değilse bu route'lar 503 döner; istemci
+# multipart yüklemeye (POST /avatar) düşer.
+
+def _direct_uploads_disabled():
+    return jsonify(error="Direct avatar uploads are disabled; upload the file to /api/profile/avatar instead"), 503
+
+
+@profile_bp.route('/avatar/upload-url', methods=['POST', 'OPTIONS'])
+def create_avatar_upload_url():
+    """Kullanıcının `{user_id}/` önekine doğrudan yükleme URL'i üretir."""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    user, err = get_user_from_request(request)
+    if err: return err
+    if not DIRECT_UPLOADS_ENABLED:
+        return _direct_uploads_disabled()
+
+    body = request.get_json(silent=True) or {}
+    content_type = body.get('content_type') or body.get('contentType')
+    if content_type not in AVATAR_ALLOWED_TYPES:
+        return jsonify(error=f"Unsupported image type: {content_type}", allowed_types=list(AVATAR_ALLOWED_TYPES)), 415
+    size = body.get('size')
+    if isinstance(size, int) and size > AVATAR_MAX_BYTES:
+        return jsonify(error=f"Avatar must be at most {AVATAR_MAX_BYTES} bytes"), 413
+
+    try:
+        return jsonify(create_avatar_upload(user.id, content_type)), 200
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Creating avatar upload URL failed: {e}")
+        return jsonify(error="Failed to create upload URL"), 500
+
+
+@profile_bp.route('/avatar/complete', methods=['POST', 'OPTIONS'])
+def complete_avatar_upload():
+    """Doğrudan yüklenen nesneyi doğrular ve profilin avatar_url'ini günceller."""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    user, err = get_user_from_request(request)
+    if err: return err
+    if not DIRECT_UPLOADS_ENABLED:
+        return _direct_uploads_disabled()
+
+    body = request.get_json(silent=True) or {}
+    try:
+        ticket = verify_upload_ticket(body.get('upload_id') or body.get('uploadId'))
+    except InvalidUploadTicket as e:
+        return jsonify(error=f"Invalid upload_id: {e}"), 400
+    path = ticket['path']
+    if ticket['user_id'] != str(user.id) or not path.startswith(f"{user.id}/"):
+        return jsonify(error="Upload does not belong to this user"), 403
+
+    try:
+        info = avatar_storage.stat(path)
+        if info is None:
+            return jsonify(error="Uploaded object not found"), 404
+        if info['size'] > AVATAR_MAX_BYTES:
+            avatar_storage.remove([path])
+            return jsonify(error=f"Avatar must be at most {AVATAR_MAX_BYTES} bytes"), 413
+        content_type = sniff_image_type(avatar_storage.read_head(path, 16))
+        if content_type not in AVATAR_ALLOWED_TYPES:
+            avatar_storage.remove([path])
+            return jsonify(error=f"Unsupported image type: {content_type or 'unknown'}"), 415
+
+        # Yükleme yolu rastgele ve tek kullanımlık olduğundan olduğu gibi kalıcı
+        # URL olur; nesne istek sırasında indirilmez, küçük görseller arka planda üretilir
+        avatar_url = avatar_storage.public_url(path)
+        supabase.table('profiles').update({'avatar_url': avatar_url}).eq('id', user.id).execute()
+        invalidate_profile(user.id)
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Completing avatar upload failed: {e}")
+        return jsonify(error="An internal server error occurred during avatar upload"), 500
+
+    thumbnail_pipeline.adopt(path)
+    return jsonify(avatar_url=avatar_url), 200
+
+
+# --- Yerel storage (AVATAR_STORAGE=local) ---
+
+@profile_bp.route('/avatar/local-upload/<path:object_path>', methods=['PUT'])
+def local_avatar_upload(object_path):
+    """Yerel depoda imzalı yükleme URL'inin karşılığı (Supabase PUT'unu taklit eder)."""
+    if AVATAR_STORAGE != 'local':
+        return jsonify(error="Not found"), 404
+    if not DIRECT_UPLOADS_ENABLED:
+        return _direct_uploads_disabled()
+    try:
+        ticket = verify_upload_ticket(request.args.get('token'))
+    except InvalidUploadTicket as e:
+        return jsonify(error=f"Invalid token: {e}"), 400
+    if ticket['path'] != object_path:
+        return jsonify(error="Token does not match path"), 403
+    try:
+        avatar_storage.upload(object_path, iter_limited(request.stream))
+    except UploadTooLarge:
+        return jsonify(error=f"Avatar must be at most {AVATAR_MAX_BYTES} bytes"), 413
+    return jsonify(Key=object_path), 200
+
+
+@profile_bp.route('/avatar/local/<path:object_path>', methods=['GET'])
+def local_avatar_file(object_path):
+    if AVATAR_STORAGE != 'local':
+        return jsonify(error="Not found"), 404
+    return send_from_directory(avatar_storage.root, object_path)
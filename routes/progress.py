@@ -1,51 +1,200 @@
 import os
 from flask import Blueprint, jsonify, request
-from supabase import create_client, Client
-
-# Inline a small helper so we don't depend on utils.auth_helper import path
-def get_user_from_request(current_request):
-    auth_header = current_request.headers.get('Authorization')
-    if not auth_header or ' ' not in auth_header:
-        return None, (jsonify(error="Authorization header missing or malformed"), 401)
-    token = auth_header.split(' ', 1)[1]
-    token = token.strip()
-    # tolerate JSON blob token
-    if token.startswith('{'):
+from utils.score_buckets import score_buckets, bucket_day
+from utils.score_queue import ScoreWriteBehind, BatchApplyError
+from utils.achievements import achievement_evaluator
+from utils.reconciler import PeriodicReconciler
+from utils import metrics
+from utils.idempotency import run_idempotent
+from extensions import supabase, service_supabase, get_user_client
+from utils.auth import get_user_from_request, extract_token
+from utils.profiles import invalidate_full_profile
+
+progress_bp = Blueprint('progress_bp', __name__, url_prefix='/api/progress')
+
+# Skor artışlarını hemen yanıtlayıp arka planda toplu yazmak için (0 ile kapatılır)
+SCORE_WRITE_BEHIND = os.environ.get('SCORE_WRITE_BEHIND', '1') == '1'
+# Kabul edilen seviye ve tek gönderimdeki puan aralıkları; dışındaki değerler 202
+# ile kuyruğa alınıp flush'ta reddedilmek yerine hemen 400 döner
+SCORE_MAX_LEVEL = int(os.environ.get('SCORE_MAX_LEVEL', 10000))
+SCORE_MAX_POINTS = int(os.environ.get('SCORE_MAX_POINTS', 1000))
+
+# Kategori slug -> id eşlemesi nadiren değişir; süreç boyunca önbellekte tutulur
+_category_ids = {}
+
+
+def get_category_id(category_slug):
+    category_id = _category_ids.get(category_slug)
+    if category_id is None:
+        cat_res = supabase.table('categories').select('id').eq('slug', category_slug).single().execute()
+        if not cat_res.data:
+            return None
+        category_id = int(cat_res.data['id'])
+        _category_ids[category_slug] = category_id
+    return category_id
+
+
+def get_category_ids(category_slugs):
+    """Birden çok slug'ı tek sorguda çözer; bulunamayanlar sonuçta yer almaz."""
+    missing = [slug for slug in set(category_slugs) if slug not in _category_ids]
+    if missing:
+        cat_res = supabase.table('categories').select('id, slug').in_('slug', missing).execute()
+        for c in cat_res.data or []:
+            _category_ids[c['slug']] = int(c['id'])
+    return {slug: _category_ids[slug] for slug in category_slugs if slug in _category_ids}
+
+
+# sql/upsert_level_progress_with_total.sql yüklü değilse eski yola (upsert + recalculate) düşülür.
+# Bu RPC'ler sadece service_role'e açıktır; SUPABASE_SERVICE_ROLE_KEY yoksa hiç denenmez.
+_incremental_total = {'available': service_supabase is not None}
+# sql/upsert_level_progress_batch.sql yüklü değilse satır satır yazılır
+_bulk_upsert = {'available': service_supabase is not None}
+
+
+def _is_missing_function_error(e):
+    message = str(e)
+    return 'PGRST202' in message or 'Could not find the function' in message
+
+
+def _is_permission_error(e):
+    # 42501: sunucu anahtarının rolü fonksiyonu çalıştırma yetkisine sahip değil
+    return '42501' in str(e)
+
+
+def _score_store_error(e, where):
+    """Skor yazımı hatasını JSON yanıta çevirir; yetki hatası 503 olarak ayrılır."""
+    print(f"Error in {where}: {e}")
+    if _is_permission_error(e):
+        return jsonify(error="Scores cannot be saved right now: the server is not authorized to write scores."), 503
+    import traceback
+    traceback.print_exc()
+    return jsonify(error="An internal server error occurred."), 500
+
+
+def _score_range_error(level, points):
+    """Seviye/puan aralık dışındaysa hata mesajı, değilse None döndürür."""
+    if not 1 <= level <= SCORE_MAX_LEVEL:
+        return f"level must be between 1 and {SCORE_MAX_LEVEL}"
+    if not 0 <= points <= SCORE_MAX_POINTS:
+        return f"points must be between 0 and {SCORE_MAX_POINTS}"
+    return None
+
+
+def apply_level_progress_batch(rows):
+    """Birleştirilmiş seviye artışlarını veritabanına yazar.
+
+    Mümkünse seviye skoru, profiles.total_score ve liderlik tablosu gün
+    kovaları aynı RPC içinde artırılır, böylece her artışın maliyeti
+    kullanıcının ilerleme satırı sayısından bağımsızdır. Toplu RPC yüklüyse
+    tüm satırlar tek çağrıda (tek işlemde) yazılır; çağrı başarısız olursa
+    hiçbir satır yazılmamıştır ve satırlar tek tek denenir, böylece bozuk
+    bir satır diğerlerini bekletmez. Tek tek yazılamayan satırlar
+    BatchApplyError ile bildirilir; diğerleri yazılmıştır.
+    """
+    if _bulk_upsert['available'] and len(rows) > 1:
         try:
-            import json
-            parsed = json.loads(token)
-            token = parsed.get('access_token') or parsed.get('accessToken') or parsed.get('token') or (parsed.get('data') or {}).get('access_token')
-        except Exception:
-            pass
-    try:
-        # Validate token with Supabase and get real user
-        user_resp = supabase.auth.get_user(token)
-        user = None
-        if hasattr(user_resp, 'user'):
-            user = user_resp.user
-        elif isinstance(user_resp, dict):
-            user = user_resp.get('user') or (user_resp.get('data') and user_resp['data'].get('user'))
-        
-        if not user:
-            return None, (jsonify(error="Invalid or expired token"), 401)
-        
-        return user, None
-    except Exception as e:
-        print(f"Auth validation error: {e}")
-        return None, (jsonify(error="Failed to validate token"), 401)
+            service_supabase.rpc('upsert_level_progress_batch', {'p_rows': rows}).execute()
+            score_buckets.prune()
+            return
+        except Exception as e:
+            if _is_missing_function_error(e) or _is_permission_error(e):
+                print(f"[progress] upsert_level_progress_batch unavailable ({e}), writing rows one by one")
+                _bulk_upsert['available'] = False
+            else:
+                print(f"[progress] upsert_level_progress_batch failed for {len(rows)} rows ({e}), retrying rows one by one")
+    unbucketed = []
+    failed = []
+    error = None
+    for row in rows:
+        try:
+            bucketed = _apply_level_progress_row(row)
+        except Exception as e:
+            failed.append(row)
+            error = error or e
+            continue
+        if not bucketed:
+            unbucketed.append({'user_id': row['user_id'], 'game': row.get('game'),
+                               'bucket_start': row.get('bucket_start'), 'points': row['score_increment']})
+    if unbucketed:
+        # Seviye skorları yazıldı; kova hatası satırların tekrar uygulanmasına yol açmamalı
+        try:
+            score_buckets.add(unbucketed)
+        except Exception as e:
+            print(f"[progress] score bucket write failed for {len(unbucketed)} rows: {e}")
+    elif not failed:
+        score_buckets.prune()
+    if failed:
+        raise BatchApplyError(failed, error)
 
-# Supabase client (reads env vars)
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
 
-progress_bp = Blueprint('progress_bp', __name__, url_prefix='/api/progress')
+def _apply_level_progress_row(row):
+    """Tek satırı yazar; gün kovaları da aynı RPC'de artırıldıysa True döndürür."""
+    params = {
+        'p_user_id': row['user_id'],
+        'p_category_id': row['category_id'],
+        'p_language_code': row['language_code'],
+        'p_level': row['level'],
+        'p_score_increment': row['score_increment']
+    }
+    if _incremental_total['available']:
+        try:
+            service_supabase.rpc('upsert_level_progress_with_total', dict(
+                params, p_game=row.get('game'), p_bucket_start=row.get('bucket_start'))).execute()
+            return True
+        except Exception as e:
+            if not (_is_missing_function_error(e) or _is_permission_error(e)):
+                raise
+            print(f"[progress] upsert_level_progress_with_total unavailable ({e}), falling back to recalculation")
+            _incremental_total['available'] = False
+    supabase.rpc('upsert_level_progress', params).execute()
+    return False
+
+
+def after_user_flush(user_id, points):
+    """Bir flush'ta skoru değişen her kullanıcı için bir kez çalışır."""
+    if _incremental_total['available']:
+        # Toplam skor zaten artırıldı; sapmalar periyodik olarak kontrol edilir
+        total_score_reconciler.mark(user_id)
+    else:
+        supabase.rpc('recalculate_total_score_for_user', {'p_user_id': user_id}).execute()
+    invalidate_full_profile(user_id)
+    # Eşik bazlı madalyalar skor RPC'sindeki trigger ile verildi; diğerlerinin
+    # kontrolü ertelenir ve kullanıcı başına birleştirilir
+    achievement_evaluator.notify(user_id)
+
+
+def total_score_drift(user_id):
+    """profiles.total_score ile ilerleme satırlarının toplamı arasındaki farkı döndürür."""
+    rows_res = supabase.table('user_level_progress').select('score').eq('user_id', user_id).execute()
+    expected = sum(int(r.get('score') or 0) for r in (rows_res.data or []))
+    prof_res = supabase.table('profiles').select('total_score').eq('id', user_id).execute()
+    stored = int(((prof_res.data or [{}])[0]).get('total_score') or 0)
+    return expected - stored
+
+
+def repair_total_score(user_id):
+    supabase.rpc('recalculate_total_score_for_user', {'p_user_id': user_id}).execute()
+
+
+total_score_reconciler = PeriodicReconciler('total-score-reconciler', total_score_drift, repair_total_score)
+metrics.register('total_score_reconciler', total_score_reconciler.stats)
+
+
+score_queue = ScoreWriteBehind(apply_level_progress_batch, after_user_flush)
+metrics.register('score_queue', score_queue.stats)
+if SCORE_WRITE_BEHIND:
+    # Ölü worker'ların spool'ları ilk skor gönderimini beklemeden geri yüklenir
+    score_queue.start()
 
 @progress_bp.route('/submit-score', methods=['POST'])
 def submit_score():
     user, err = get_user_from_request(request)
     if err: return err
+    # Zaman aşımında tekrar gönderilen istekler puanı iki kez saymasın
+    return run_idempotent(user.id, 'submit-score', lambda: _submit_score(user))
+
 
+def _submit_score(user):
     try:
         data = request.get_json() or {}
         print(f"[submit_score] Received payload: {data}")
@@ -64,38 +213,124 @@ def submit_score():
             print(f"[submit_score] Missing fields: {missing}")
             return jsonify(error=f"Missing required fields: {', '.join(missing)}"), 400
 
-        cat_res = supabase.table('categories').select('id').eq('slug', category_slug).single().execute()
-        if not cat_res.data:
+        try:
+            level, points_to_add = int(level), int(points_to_add)
+        except (TypeError, ValueError):
+            return jsonify(error="level and points must be integers"), 400
+        range_error = _score_range_error(level, points_to_add)
+        if range_error:
+            return jsonify(error=range_error), 400
+
+        category_id = get_category_id(category_slug)
+        if category_id is None:
             return jsonify(error=f"Category with slug '{category_slug}' not found."), 404
-        category_id = cat_res.data['id']
-
-        # 1. Seviye bazlı skoru güncelle
-        supabase.rpc('upsert_level_progress', {
-            'p_user_id': user.id,
-            'p_category_id': int(category_id),
-            'p_language_code': language_code,
-            'p_level': int(level),
-            'p_score_increment': int(points_to_add)
-        }).execute()
-
-        # 2. Toplam skoru yeniden hesapla (SADECE KULLANICI ID'si gönderiliyor)
-        # `profiles.total_score` INTEGER olduğu için dil bazlı parametreye gerek yok.
-        supabase.rpc('recalculate_total_score_for_user', {
-            'p_user_id': user.id
-        }).execute()
-
-        # 3. Madalyaları kontrol et
-        # Eğer `check_and_award_achievements_for_user` fonksiyonunuz varsa, bu çağrı kalabilir.
-         # 3. YENİ: Achievement'ları kontrol et ve ver
-        print(f"[submit_score] Calling check_and_award_achievements for user {user.id}")
-        supabase.rpc('check_and_award_achievements', {'p_user_id': user.id}).execute()
+
+        if SCORE_WRITE_BEHIND:
+            # Artış kuyruğa alınır; seviye skoru, toplam skor, liderlik kovaları
+            # ve madalyalar arka plandaki flush sırasında kullanıcı başına bir kez işlenir.
+            score_queue.enqueue(user.id, category_id, language_code, level, points_to_add,
+                                game=game_slug, day=bucket_day())
+            return jsonify(message="Score accepted", queued=True), 202
+
+        # 1. Seviye bazlı skoru (ve mümkünse toplam skoru) güncelle
+        apply_level_progress_batch([{
+            'user_id': user.id,
+            'category_id': int(category_id),
+            'language_code': language_code,
+            'level': level,
+            'game': game_slug,
+            'bucket_start': bucket_day(),
+            'score_increment': points_to_add
+        }])
+
+        # 2. Toplam skoru güncelle, 3. madalya kontrolünü planla
+        print(f"[submit_score] Updating total for user {user.id}")
+        after_user_flush(user.id, points_to_add)
         return jsonify(message="Score updated successfully"), 200
 
     except Exception as e:
-        print(f"Error in submit_score: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify(error="An internal server error occurred."), 500
+        return _score_store_error(e, 'submit_score')
+
+MAX_BATCH_RESULTS = 200
+
+
+@progress_bp.route('/submit-scores', methods=['POST'])
+def submit_scores_batch():
+    """Bir turun tüm sonuçlarını tek istekte kaydeder.
+
+    Gövde: {"results": [{"categorySlug", "language", "level", "points", "gameSlug"}, ...]}
+    (veya doğrudan bu liste). Kategoriler tek sorguda çözülür, artışlar
+    birleştirilip toplu yazılır; toplam skor ve madalyalar batch başına bir kez işlenir.
+    """
+    user, err = get_user_from_request(request)
+    if err: return err
+    return run_idempotent(user.id, 'submit-scores', lambda: _submit_scores_batch(user))
+
+
+def _submit_scores_batch(user):
+    try:
+        data = request.get_json() or {}
+        results = data.get('results') if isinstance(data, dict) else data
+        if not isinstance(results, list) or not results:
+            return jsonify(error="results must be a non-empty list"), 400
+        if len(results) > MAX_BATCH_RESULTS:
+            return jsonify(error=f"At most {MAX_BATCH_RESULTS} results per batch"), 400
+
+        parsed = []
+        for i, item in enumerate(results):
+            if not isinstance(item, dict):
+                return jsonify(error=f"results[{i}] must be an object"), 400
+            level = item.get('level')
+            category_slug = item.get('categorySlug') or item.get('category')
+            if level is None or not category_slug:
+                return jsonify(error=f"results[{i}] is missing level or categorySlug"), 400
+            try:
+                parsed.append({
+                    'category_slug': category_slug,
+                    'game_slug': item.get('gameSlug') or item.get('game') or item.get('gameType'),
+                    'language_code': item.get('language') or item.get('lang') or 'en',
+                    'level': int(level),
+                    'points': int(item.get('points', 5)),
+                })
+            except (TypeError, ValueError):
+                return jsonify(error=f"results[{i}] has a non-integer level or points"), 400
+            range_error = _score_range_error(parsed[-1]['level'], parsed[-1]['points'])
+            if range_error:
+                return jsonify(error=f"results[{i}]: {range_error}"), 400
+
+        category_ids = get_category_ids([p['category_slug'] for p in parsed])
+        unknown = sorted({p['category_slug'] for p in parsed if p['category_slug'] not in category_ids})
+        if unknown:
+            return jsonify(error=f"Categories not found: {', '.join(unknown)}"), 404
+
+        # Aynı (kategori, dil, seviye, oyun) için gelen artışları birleştir
+        merged = {}
+        total_points = 0
+        day = bucket_day()
+        for p in parsed:
+            key = (category_ids[p['category_slug']], p['language_code'], p['level'], p['game_slug'])
+            merged[key] = merged.get(key, 0) + p['points']
+            total_points += p['points']
+
+        if SCORE_WRITE_BEHIND:
+            for (category_id, language_code, level, game_slug), points in merged.items():
+                score_queue.enqueue(user.id, category_id, language_code, level, points, game=game_slug, day=day)
+            return jsonify(message="Scores accepted", queued=True, count=len(parsed)), 202
+
+        apply_level_progress_batch([{
+            'user_id': user.id,
+            'category_id': category_id,
+            'language_code': language_code,
+            'level': level,
+            'game': game_slug,
+            'bucket_start': day,
+            'score_increment': points
+        } for (category_id, language_code, level, game_slug), points in merged.items()])
+        after_user_flush(user.id, total_points)
+        return jsonify(message="Scores updated successfully", count=len(parsed)), 200
+
+    except Exception as e:
+        return _score_store_error(e, 'submit_scores_batch')
 
 @progress_bp.route('/submit-mixed-rush-score', methods=['POST'])
 def submit_mixed_rush_score():
@@ -104,7 +339,10 @@ def submit_mixed_rush_score():
     if err: 
         print(f"[submit_mixed_rush_score] User auth failed: {err}")
         return err
+    return run_idempotent(user.id, 'submit-mixed-rush-score', lambda: _submit_mixed_rush_score(user))
+
 
+def _submit_mixed_rush_score(user):
     data = request.get_json()
     print(f"[submit_mixed_rush_score] Received data: {data}")
     
@@ -123,20 +361,11 @@ def submit_mixed_rush_score():
         print(f"[submit_mixed_rush_score] User ID: {user_id} (type: {type(user_id)})")
         print(f"[submit_mixed_rush_score] About to call update_mixed_rush_highscore RPC")
         
-        # Eğer bu kısımda problem yaşanıyorsa, `user_supabase` yerine global `supabase` client kullanmayı deneyebiliriz.
-        # Ancak RLS politikaları nedeniyle `user_supabase` ile devam etmek genellikle daha güvenlidir.
-        auth_header = request.headers.get('Authorization')
-        token = auth_header.split(' ', 1)[1].strip()
-        if token.startswith('{'):
-            try:
-                import json
-                parsed = json.loads(token)
-                token = parsed.get('access_token') or parsed.get('accessToken') or parsed.get('token') or (parsed.get('data') or {}).get('access_token')
-            except Exception:
-                pass
-        
-        user_supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
-        user_supabase.auth.session = {'access_token': token, 'refresh_token': '', 'user': user}
+        # RLS politikaları nedeniyle `user_supabase` (kullanıcının JWT'si ile) kullanılır.
+        token = extract_token(request)
+
+        # Token'a ait önbellekteki istemci kullanılır; her istekte yeni client kurulmaz
+        user_supabase = get_user_client(token)
         
         try:
             mixed_rush_result = user_supabase.rpc('update_mixed_rush_highscore', {
@@ -147,9 +376,14 @@ def submit_mixed_rush_score():
             
             print(f"[submit_mixed_rush_score] RPC update_mixed_rush_highscore completed successfully")
             print(f"[submit_mixed_rush_score] Mixed rush result: {mixed_rush_result.data}")
+            try:
+                score_buckets.add_max(user_id, 'mixed-rush', int(final_score))
+            except Exception as bucket_error:
+                # Rekor kaydedildi; sadece günlük/haftalık tablo güncellenemedi
+                print(f"[submit_mixed_rush_score] score bucket update failed: {bucket_error}")
+            invalidate_full_profile(user_id)
 
-            print(f"[submit_mixed_rush_score] Calling check_and_award_achievements for user {user_id}")
-            supabase.rpc('check_and_award_achievements', {'p_user_id': user_id}).execute()
+            achievement_evaluator.notify(user_id)
             
             # Doğrulama için profiles tablosundan `mixed_rush_highscore` değerini çek
             profile_check = user_supabase.table('profiles').select('mixed_rush_highscore').eq('id', user_id).execute()
@@ -1,52 +1,183 @@
 from flask import Blueprint, jsonify, request
-from extensions import supabase
+from extensions import supabase, get_user_client
+from utils.auth import get_user_from_request, extract_token
+from utils.fanout import gather
+from utils.profiles import PROFILE_FIELDS, get_profile_loader
+from utils.usernames import username_index
+from utils.thumbnails import with_avatar_variants
+from utils.social_graph import social_graph
+from utils.suggestions import friend_suggestions
+from utils.pagination import page_params, apply_keyset, build_page, keyset_rpc_params
 
 social_bp = Blueprint('social_bp', __name__, url_prefix='/api/social')
 
-# --- YARDIMCI FONKSİYON: Kullanıcıyı Token ile Doğrulama ---
-def get_user_from_request(current_request):
-    auth_header = current_request.headers.get('Authorization')
-    if not auth_header or 'Bearer ' not in auth_header:
-        return None, (jsonify(error="Authorization header missing or malformed"), 401)
-    
-    jwt = auth_header.split(" ")[1]
+def _create_friend_request(user_id, receiver_id):
+    """İki route'un ortak yolu: kendine istek kontrolü ve tek bir koşullu upsert."""
+    if str(user_id) == str(receiver_id):
+        return jsonify(error="Cannot send friend request to yourself."), 400
     try:
-        user_response = supabase.auth.get_user(jwt)
-        if user_response.user:
-            return user_response.user, None
-        else:
-            return None, (jsonify(error="Invalid or expired token"), 401)
+        created, existing = social_graph.request(user_id, receiver_id)
+        if not created:
+            if existing.get('status') == 'accepted':
+                return jsonify(error="You are already friends."), 409
+            return jsonify(error="A friend request already exists."), 409
+        return jsonify(message="Friend request sent successfully!"), 201
     except Exception as e:
-        return None, (jsonify(error=f"Token validation failed: {e}"), 401)
+        error_message = str(e)
+        # 23503: receiver_id profiles tablosunda yok (foreign key)
+        if '23503' in error_message:
+            return jsonify(error="User not found"), 404
+        if "custom postgres error" in error_message:
+            details = error_message.split('"message":"')[-1].split('"')[0]
+            return jsonify(error=details), 409
+        print(f"!!! CRITICAL Error in create_friend_request: {e}")
+        return jsonify(error=f"An internal server error occurred: {e}"), 500
+
+FRIEND_LISTS = ('friends', 'incoming_requests', 'sent_requests')
+
+# sql/friend_list_pages.sql yüklü değilse listeler bellekteki komşuluk listesinden okunur
+_friend_list_rpc = {'available': True}
+
+
+def _is_missing_function_error(e):
+    message = str(e)
+    return 'PGRST202' in message or 'Could not find the function' in message
+
+
+def _friend_list_entries(user_id):
+    """Komşuluk listesinden profil yüklemeden {liste: [{id, friendship_id?}]} çıkarır."""
+    user_id = str(user_id)
+    entries = {name: [] for name in FRIEND_LISTS}
+    for f in social_graph.rows(user_id):
+        requester, receiver = str(f['user1_id']), str(f['user2_id'])
+        other = receiver if requester == user_id else requester
+        entry = {'id': other}
+        if f['status'] == 'accepted':
+            entries['friends'].append(entry)
+        elif f['status'] == 'pending':
+            if receiver == user_id:
+                entry['friendship_id'] = f['id']
+                entries['incoming_requests'].append(entry)
+            else:
+                entries['sent_requests'].append(entry)
+    return entries
+
+
+def _friend_list_counts(user_id, client):
+    """{liste: uzunluk}; sayfalı yanıtlardaki total ile aynı kaynaktan gelir."""
+    if _friend_list_rpc['available']:
+        try:
+            rows = client.rpc('get_friend_list_counts', {}).execute().data or [{}]
+            return {name: int(rows[0].get(name) or 0) for name in FRIEND_LISTS}
+        except Exception as e:
+            if not _is_missing_function_error(e):
+                raise
+            print("[social] get_friend_list_counts not found, using the in-memory friend graph")
+            _friend_list_rpc['available'] = False
+    return {name: len(rows) for name, rows in _friend_list_entries(user_id).items()}
+
+
+def _friend_list_pages(user_id, client, names, cursor, page_size):
+    """Listelerin sayfalarını (last_active_at desc, id asc) okur.
+
+    Her liste `get_friend_list_page` ile SQL'de sayfalanır (sadece sayfadaki
+    satırlar döner), total'ler `get_friend_list_counts`'tan gelir; hepsi tek
+    bir paralel turda. Fonksiyonlar yüklü değilse _friend_list_pages_from_graph.
+    """
+    if _friend_list_rpc['available']:
+        try:
+            results = gather(
+                lambda: client.rpc('get_friend_list_counts', {}).execute(),
+                *[lambda name=name: client.rpc('get_friend_list_page', dict(
+                    keyset_rpc_params(cursor, page_size), p_list=name)).execute()
+                  for name in names],
+            )
+        except Exception as e:
+            if not _is_missing_function_error(e):
+                raise
+            print("[social] get_friend_list_page not found, using the in-memory friend graph")
+            _friend_list_rpc['available'] = False
+        else:
+            counts = (results[0].data or [{}])[0]
+            pages = {}
+            for name, res in zip(names, results[1:]):
+                rows = res.data or []
+                for row in rows:
+                    if row.get('friendship_id') is None:
+                        row.pop('friendship_id', None)
+                get_profile_loader().prime(rows)
+                page = build_page(rows, 'last_active_at', page_size)
+                page['items'] = with_avatar_variants(page['items'])
+                page['total'] = int(counts.get(name) or 0)
+                pages[name] = page
+            return pages
+    return _friend_list_pages_from_graph(user_id, names, cursor, page_size)
+
+
+def _friend_list_pages_from_graph(user_id, names, cursor, page_size):
+    # Eski yol: liste bellekteki komşuluktan, sıralama/keyset profiles üzerinde
+    entries = _friend_list_entries(user_id)
+    pages = {name: {'items': [], 'next_cursor': None, 'total': 0} for name in names}
+    queried = [name for name in names if entries[name]]
+    select = f'{PROFILE_FIELDS}, last_active_at'
+    results = gather(*[lambda name=name: apply_keyset(
+        supabase.table('profiles').select(select).in_('id', [e['id'] for e in entries[name]]),
+        'last_active_at', cursor, page_size).execute() for name in queried])
+    for name, res in zip(queried, results):
+        by_id = {e['id']: e for e in entries[name]}
+        rows = [dict(row, **by_id[row['id']]) for row in res.data or [] if row['id'] in by_id]
+        get_profile_loader().prime(rows)
+        page = build_page(rows, 'last_active_at', page_size)
+        page['items'] = with_avatar_variants(page['items'])
+        page['total'] = len(entries[name])
+        pages[name] = page
+    return pages
 
 # --- API ENDPOINTS ---
 
 @social_bp.route('/friends', methods=['GET'])
 def get_friends_and_requests():
-    """Kullanıcının arkadaşlarını, gelen ve gönderilen isteklerini listeler."""
+    """Kullanıcının arkadaşlarını, gelen ve gönderilen isteklerini listeler.
+
+    ?counts_only=1 sadece liste uzunluklarını döndürür (rozetler için).
+    ?page_size=N ve/veya ?cursor=... verildiğinde listeler en son aktif olan
+    önce (profiles.last_active_at desc, id asc) sayfalanır ve sadece sayfadaki
+    profiller yüklenir: ?list=friends|incoming_requests|sent_requests ile tek
+    listenin sayfası, list verilmezse her listenin ilk sayfası döner.
+    last_active_at sayfalar arasında değişebildiği için arada aktif olan bir
+    kullanıcı listede yer değiştirip tekrar görünebilir veya atlanabilir.
+    Parametresiz çağrılar eski formatı korur.
+    """
     user, err = get_user_from_request(request)
     if err: return err
     
     try:
-        # 1. Kullanıcının dahil olduğu tüm arkadaşlık ilişkilerini çek
-        friendships_res = supabase.table('friendships').select('*').or_(f'user1_id.eq.{user.id},user2_id.eq.{user.id}').execute()
-        
-        if not friendships_res.data:
+        if request.args.get('counts_only') in ('1', 'true'):
+            return jsonify(_friend_list_counts(user.id, get_user_client(extract_token(request))))
+
+        paged, page_size, cursor = page_params(request.args, default_size=20)
+        if paged:
+            only = request.args.get('list')
+            if only is not None and only not in FRIEND_LISTS:
+                return jsonify(error=f"list must be one of: {', '.join(FRIEND_LISTS)}"), 400
+            if cursor and only is None:
+                return jsonify(error="list is required when a cursor is given"), 400
+            pages = _friend_list_pages(user.id, get_user_client(extract_token(request)),
+                                       (only,) if only else FRIEND_LISTS, cursor, page_size)
+            return jsonify(pages[only] if only else pages)
+
+        # 1. Kullanıcının dahil olduğu tüm arkadaşlık ilişkilerini bellekteki
+        # komşuluk listesinden al (ilk erişimde tek sorguyla yüklenir)
+        friendships = social_graph.rows(user.id)
+
+        if not friendships:
             return jsonify({ "friends": [], "incoming_requests": [], "sent_requests": [] })
 
         # 2. Bu ilişkilerdeki diğer tüm kullanıcıların ID'lerini topla
-        other_user_ids = set()
-        for f in friendships_res.data:
-            if f['user1_id'] == user.id:
-                other_user_ids.add(f['user2_id'])
-            else:
-                other_user_ids.add(f['user1_id'])
+        other_user_ids = social_graph.related_ids(user.id)
         
-        # 3. Bu ID'lere ait profil bilgilerini tek seferde, verimli bir şekilde çek
-        profiles_map = {}
-        if other_user_ids:
-            profiles_res = supabase.table('profiles').select('id, username, avatar_url').in_('id', list(other_user_ids)).execute()
-            profiles_map = {p['id']: p for p in profiles_res.data}
+        # 3. Bu ID'lere ait profil bilgilerini istek bazlı loader ile tek seferde çek
+        profiles_map = get_profile_loader().get_many(list(other_user_ids))
 
         # 4. Gelen veriyi frontend'in beklediği formata Python içinde dönüştür
         result = {
@@ -54,7 +185,7 @@ def get_friends_and_requests():
             "incoming_requests": [],
             "sent_requests": []
         }
-        for f in friendships_res.data:
+        for f in friendships:
             if f['status'] == 'accepted':
                 friend_id = f['user2_id'] if f['user1_id'] == user.id else f['user1_id']
                 if friend_id in profiles_map:
@@ -71,12 +202,30 @@ def get_friends_and_requests():
                     if f['user2_id'] in profiles_map:
                         result['sent_requests'].append(profiles_map[f['user2_id']])
 
+        for rows in result.values():
+            with_avatar_variants(rows)
         return jsonify(result)
 
     except Exception as e:
         print(f"!!! CRITICAL Error in get_friends_and_requests: {e}")
         return jsonify(error="An internal server error occurred while fetching friends data."), 500
 
+@social_bp.route('/friends/suggestions', methods=['GET', 'OPTIONS'])
+def get_friend_suggestions():
+    """Ortak arkadaş sayısı ve skor yakınlığına göre arkadaş önerileri."""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    user, err = get_user_from_request(request)
+    if err: return err
+
+    limit = max(1, min(request.args.get('limit', 10, type=int) or 10, 30))
+    try:
+        return jsonify(with_avatar_variants(friend_suggestions.suggest(user.id, limit=limit))), 200
+    except Exception as e:
+        print(f"get_friend_suggestions error: {e}")
+        return jsonify(error="An internal server error occurred while building suggestions."), 500
+
 @social_bp.route('/friends/request', methods=['POST', 'OPTIONS'])
 def send_friend_request():
     """Bir kullanıcıya arkadaşlık isteği gönderir."""
@@ -91,18 +240,7 @@ def send_friend_request():
     if not receiver_id:
         return jsonify(error="Receiver ID is required"), 400
 
-    try:
-        # Veritabanındaki 'create_friend_request' fonksiyonunu çağıralım.
-        # Bu fonksiyon kendi içinde güvenlik kontrollerini (kendine istek atma, mevcut ilişki) yapar.
-        supabase.rpc('create_friend_request', {'p_receiver_id': receiver_id}).execute()
-        return jsonify(message="Friend request sent successfully!"), 201
-    except Exception as e:
-        # Veritabanından gelen özel hata mesajlarını yakala
-        error_message = str(e)
-        if "custom postgres error" in error_message:
-            details = error_message.split('"message":"')[-1].split('"')[0]
-            return jsonify(error=details), 409 # 409 Conflict daha uygun
-        return jsonify(error=f"An internal server error occurred: {e}"), 500
+    return _create_friend_request(user.id, receiver_id)
 
 @social_bp.route('/friends/accept', methods=['POST', 'OPTIONS'])
 def accept_friend_request():
@@ -128,7 +266,10 @@ def accept_friend_request():
 
     try:
         # RLS politikası, sadece isteği alanın (user2_id) bu güncellemeyi yapabilmesini sağlar.
-        supabase.table('friendships').update({'status': 'accepted'}).eq('id', friendship_id).eq('user2_id', user.id).execute()
+        res = supabase.table('friendships').update({'status': 'accepted'}).eq('id', friendship_id).eq('user2_id', user.id).execute()
+        social_graph.apply(res.data)
+        if not res.data:
+            social_graph.invalidate(user.id)
         return jsonify(message="Friend request accepted."), 200
     except Exception as e:
         return jsonify(error=f"An internal server error occurred: {e}"), 500
@@ -154,7 +295,10 @@ def reject_friend_request():
     
     try:
         # RLS politikası, sadece ilgili kullanıcıların bu satırı silebilmesini sağlar.
-        supabase.table('friendships').delete().eq('id', friendship_id).execute()
+        res = supabase.table('friendships').delete().eq('id', friendship_id).execute()
+        social_graph.apply(res.data, deleted=True)
+        if not res.data:
+            social_graph.invalidate(user.id)
         return jsonify(message="Friendship rejected or removed."), 200
     except Exception as e:
         return jsonify(error=f"An internal server error occurred: {e}"), 500
@@ -183,19 +327,25 @@ def users_search():
         return jsonify([]), 200
 
     try:
-        # get all profiles matching the query (limit a bit higher then filter)
-        search_res = supabase.table('profiles').select('id, username, avatar_url').ilike('username', f'%{query}%').limit(20).execute()
+        # Önce bellekteki username indeksi (önek + trigram) denenir; sonuçlar
+        # sıralı gelir ve arkadaşlar/bekleyen istekler zaten elenmiştir
+        if username_index.ready:
+            exclude_ids = social_graph.related_ids(user.id) | {user.id}
+            matches = username_index.search(query, limit=10, exclude=exclude_ids) or []
+            profiles = get_profile_loader().get_many([m['id'] for m in matches])
+            results = [profiles.get(m['id']) or dict(m, avatar_url=None) for m in matches]
+            return jsonify(with_avatar_variants(results)), 200
+
+        # İndeks henüz yüklenmediyse veritabanında ara
+        # (profile search and the social graph load run in parallel threads)
+        search_res, related_ids = gather(
+            lambda: supabase.table('profiles').select('id, username, avatar_url').ilike('username', f'%{query}%').limit(20).execute(),
+            lambda: social_graph.related_ids(user.id),
+        )
         candidates = search_res.data or []
+        get_profile_loader().prime(candidates)
 
-        # get existing friendship ids to exclude
-        friendships_res = supabase.table('friendships').select('user1_id, user2_id').or_(f'user1_id.eq.{user.id},user2_id.eq.{user.id}').execute()
-        exclude_ids = {user.id}
-        if friendships_res and getattr(friendships_res, 'data', None):
-            for fr in friendships_res.data:
-                if fr.get('user1_id'):
-                    exclude_ids.add(fr['user1_id'])
-                if fr.get('user2_id'):
-                    exclude_ids.add(fr['user2_id'])
+        exclude_ids = related_ids | {user.id}
 
         results = []
         for p in candidates:
@@ -206,7 +356,7 @@ def users_search():
             if len(results) >= 10:
                 break
 
-        return jsonify(results), 200
+        return jsonify(with_avatar_variants(results)), 200
     except Exception as e:
         print(f"users_search error: {e}")
         return jsonify([]), 200
@@ -230,63 +380,16 @@ def friends_add_compat():
     if not receiver_id:
         return jsonify(error="Receiver ID or username is required"), 400
 
-    try:
-        # Check if receiver_id looks like a UUID (contains hyphens) or is a username
-        if '-' not in str(receiver_id) or len(str(receiver_id)) < 32:
-            # This looks like a username, convert to ID
-            print(f"Converting username '{receiver_id}' to ID...")
-            profile_res = supabase.table('profiles').select('id').eq('username', receiver_id).single().execute()
-            if not profile_res.data:
-                return jsonify(error="User not found"), 404
-            receiver_id = profile_res.data['id']
-            print(f"Found user ID: {receiver_id}")
-
-        # Prevent sending request to self
-        if str(user.id) == str(receiver_id):
-            return jsonify(error="Cannot send friend request to yourself."), 400
-
-        # Check for an existing friendship in either direction between these two IDs
-        existing_res1 = supabase.table('friendships').select('id, user1_id, user2_id, status')
-        existing_res1 = existing_res1.eq('user1_id', user.id).eq('user2_id', receiver_id).execute()
-
-        existing_res2 = supabase.table('friendships').select('id, user1_id, user2_id, status')
-        existing_res2 = existing_res2.eq('user1_id', receiver_id).eq('user2_id', user.id).execute()
-
-        existing_rows = []
-        if getattr(existing_res1, 'data', None):
-            existing_rows.extend(existing_res1.data)
-        if getattr(existing_res2, 'data', None):
-            existing_rows.extend(existing_res2.data)
-
-        if existing_rows:
-            # If a row exists that contains both IDs (in some order), return conflict
-            for row in existing_rows:
-                ids = {str(row.get('user1_id')), str(row.get('user2_id'))}
-                if {str(user.id), str(receiver_id)} == ids:
-                    status = row.get('status')
-                    if status == 'accepted':
-                        return jsonify(error="You are already friends."), 409
-                    else:
-                        return jsonify(error="A friend request already exists."), 409
-
-        # Insert the pending friendship row directly (server-side action)
-        print(f"Inserting friendship from {user.id} to {receiver_id}")
-        insert_res = supabase.table('friendships').insert({
-            'user1_id': user.id,
-            'user2_id': receiver_id,
-            'status': 'pending'
-        }).execute()
-
-        # If insert returned errors, surface them
-        if getattr(insert_res, 'error', None):
-            raise Exception(insert_res.error)
-
-        return jsonify(message="Friend request sent successfully!"), 201
-        
-    except Exception as e:
-        error_message = str(e)
-        if "custom postgres error" in error_message:
-            details = error_message.split('"message":"')[-1].split('"')[0]
-            return jsonify(error=details), 409
-        print(f"!!! CRITICAL Error in friends_add_compat: {e}")
-        return jsonify(error=f"An internal server error occurred: {e}"), 500
\ No newline at end of file
+    # Check if receiver_id looks like a UUID (contains hyphens) or is a username
+    if '-' not in str(receiver_id) or len(str(receiver_id)) < 32:
+        # This looks like a username, convert to ID (indexed lookup in the database)
+        try:
+            resolved_id = username_index.resolve(receiver_id)
+        except Exception as e:
+            print(f"!!! CRITICAL Error in friends_add_compat: {e}")
+            return jsonify(error=f"An internal server error occurred: {e}"), 500
+        if not resolved_id:
+            return jsonify(error="User not found"), 404
+        receiver_id = resolved_id
+
+    return _create_friend_request(user.id, receiver_id)
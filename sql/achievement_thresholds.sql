@@ -0,0 +1,54 @@
+-- Eşik bazlı madalyalar veritabanında, skoru değiştiren işlemin içinde verilir.
+-- achievements.metric/threshold madalyanın hangi profil değerine ve eşiğe
+-- bağlı olduğunu tanımlar; profiles.total_score veya mixed_rush_highscore
+-- arttığında trigger eşiği geçilen madalyaları user_achievements'a ekler.
+-- Eşiği olmayan madalyalar için check_and_award_achievements RPC'si
+-- (utils/achievements.py) kullanılmaya devam eder.
+-- "Yeni" işareti user_achievements.seen_at'tir: /api/achievements/ okunana kadar null.
+
+alter table public.achievements
+    add column if not exists metric text not null default 'total_score',
+    add column if not exists threshold bigint;
+
+alter table public.achievements
+    drop constraint if exists achievements_metric_check,
+    add constraint achievements_metric_check check (metric in ('total_score', 'mixed_rush_highscore'));
+
+alter table public.user_achievements
+    add column if not exists seen_at timestamptz;
+
+-- Migration öncesi kazanılmış madalyalar görülmüş sayılır
+update public.user_achievements set seen_at = coalesce(earned_at, now()) where seen_at is null;
+
+create unique index if not exists user_achievements_user_achievement_key
+    on public.user_achievements (user_id, achievement_id);
+
+create or replace function public.award_threshold_achievements()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into user_achievements (user_id, achievement_id)
+    select new.id, a.id
+      from achievements a
+     where a.threshold is not null
+       and (
+            (a.metric = 'total_score' and coalesce(new.total_score, 0) >= a.threshold)
+         or (a.metric = 'mixed_rush_highscore' and coalesce(new.mixed_rush_highscore, 0) >= a.threshold)
+       )
+    on conflict (user_id, achievement_id) do nothing;
+    return new;
+end;
+$$;
+
+drop trigger if exists profiles_award_threshold_achievements on public.profiles;
+create trigger profiles_award_threshold_achievements
+    after update of total_score, mixed_rush_highscore on public.profiles
+    for each row
+    when (new.total_score is distinct from old.total_score
+          or new.mixed_rush_highscore is distinct from old.mixed_rush_highscore)
+    execute function public.award_threshold_achievements();
+
+revoke execute on function public.award_threshold_achievements() from public, anon, authenticated;
@@ -0,0 +1,64 @@
+-- Arkadaş listelerinin sayfalı okuması ve sayıları (GET /api/social/friends).
+-- Liste, sıralama (profiles.last_active_at desc, id asc), keyset ve limit tek
+-- sorguda uygulanır; uygulama ne tüm listeyi çeker ne de id'leri URL'e koyar.
+-- Sayılar aynı birleştirmeden (profili olan ilişkiler) gelir, böylece
+-- ?counts_only ile sayfalı yanıtlardaki total her zaman aynıdır.
+-- Kullanıcı auth.uid()'den alınır; fonksiyonlar kullanıcının JWT'siyle çağrılır.
+-- Gerektirir: sql/profiles_last_active_at.sql
+
+create index if not exists friendships_user1_status_idx on public.friendships (user1_id, status);
+create index if not exists friendships_user2_status_idx on public.friendships (user2_id, status);
+
+-- p_list: 'friends' | 'incoming_requests' | 'sent_requests'
+-- friendship_id sadece gelen isteklerde doludur; jsonb olarak kolonun kendi tipini korur
+create or replace function public.get_friend_list_page(
+    p_list text, p_after_score bigint default null, p_after_id uuid default null, p_limit integer default 21)
+returns table (id uuid, username text, avatar_url text, last_active_at bigint, friendship_id jsonb)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    with rel as (
+        select f.id as friendship_id, f.user2_id as other_id
+          from friendships f
+         where f.user1_id = auth.uid()
+           and ((p_list = 'friends' and f.status = 'accepted')
+                or (p_list = 'sent_requests' and f.status = 'pending'))
+        union all
+        select f.id, f.user1_id
+          from friendships f
+         where f.user2_id = auth.uid()
+           and ((p_list = 'friends' and f.status = 'accepted')
+                or (p_list = 'incoming_requests' and f.status = 'pending'))
+    )
+    select p.id, p.username::text, p.avatar_url::text, p.last_active_at,
+           case when p_list = 'incoming_requests' then to_jsonb(rel.friendship_id) end
+      from rel
+      join profiles p on p.id = rel.other_id
+     where p_after_score is null
+        or p.last_active_at < p_after_score
+        or (p.last_active_at = p_after_score and p.id > p_after_id)
+     order by p.last_active_at desc, p.id
+     limit least(greatest(p_limit, 1), 101);
+$$;
+
+create or replace function public.get_friend_list_counts()
+returns table (friends bigint, incoming_requests bigint, sent_requests bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select count(*) filter (where f.status = 'accepted'),
+           count(*) filter (where f.status = 'pending' and f.user2_id = auth.uid()),
+           count(*) filter (where f.status = 'pending' and f.user1_id = auth.uid())
+      from friendships f
+      join profiles p on p.id = case when f.user1_id = auth.uid() then f.user2_id else f.user1_id end
+     where f.user1_id = auth.uid() or f.user2_id = auth.uid();
+$$;
+
+revoke execute on function public.get_friend_list_page(text, bigint, uuid, integer) from public, anon;
+revoke execute on function public.get_friend_list_counts() from public, anon;
+grant execute on function public.get_friend_list_page(text, bigint, uuid, integer) to authenticated;
+grant execute on function public.get_friend_list_counts() to authenticated;
@@ -0,0 +1,32 @@
+-- Arkadaşlıklar için yönden bağımsız (küçük id, büyük id) anahtarı.
+-- İki kullanıcı arasında, hangi yönde olursa olsun, tek bir satır olabilir;
+-- utils/social_graph.py istekleri bu kısıta dayanan tek bir koşullu upsert ile
+-- oluşturur (on_conflict=user_low,user_high, ignore_duplicates).
+-- Yüklü değilse uygulama eski kontrol + insert yoluna düşer.
+
+-- Aynı çift için birden fazla satır varsa kabul edilmiş olanı, yoksa en eskisini tut
+delete from friendships
+ where id in (
+       select id
+         from (
+               select id,
+                      row_number() over (
+                          partition by least(user1_id, user2_id), greatest(user1_id, user2_id)
+                          order by (status = 'accepted') desc, id
+                      ) as rn
+                 from friendships
+              ) ranked
+        where rn > 1
+       );
+
+alter table friendships
+    add column if not exists user_low uuid generated always as (least(user1_id, user2_id)) stored,
+    add column if not exists user_high uuid generated always as (greatest(user1_id, user2_id)) stored;
+
+alter table friendships
+    drop constraint if exists friendships_no_self,
+    add constraint friendships_no_self check (user1_id <> user2_id);
+
+alter table friendships
+    drop constraint if exists friendships_pair_key,
+    add constraint friendships_pair_key unique (user_low, user_high);
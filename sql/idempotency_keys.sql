@@ -0,0 +1,34 @@
+-- Skor ve düello gönderimleri için idempotency anahtarları (utils/idempotency.py).
+-- (user_id, scope, key) birincil anahtarı, hangi worker'a düşerse düşsün aynı
+-- isteğin yalnızca bir kez işlenmesini sağlar. request_hash isteğin gövdesinin
+-- özetidir; aynı anahtar farklı bir gövdeyle gelirse istek reddedilir.
+create table if not exists public.idempotency_keys (
+    user_id uuid not null,
+    scope text not null,
+    key text not null,
+    request_hash text not null,
+    status text not null default 'in_progress' check (status in ('in_progress', 'done')),
+    response_status integer,
+    response_body text,
+    response_mimetype text,
+    locked_at timestamptz not null default now(),
+    created_at timestamptz not null default now(),
+    primary key (user_id, scope, key)
+);
+
+create index if not exists idempotency_keys_created_at_idx on public.idempotency_keys (created_at);
+
+-- Sadece sunucu (service_role) okur/yazar
+alter table public.idempotency_keys enable row level security;
+
+create or replace function public.prune_idempotency_keys(p_keep_seconds integer default 86400)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    delete from idempotency_keys where created_at < now() - make_interval(secs => p_keep_seconds);
+$$;
+
+revoke execute on function public.prune_idempotency_keys(integer) from public, anon, authenticated;
+grant execute on function public.prune_idempotency_keys(integer) to service_role;
@@ -0,0 +1,117 @@
+-- Liderlik tablolarının sayfalı okumaları (?page_size / ?cursor).
+-- Keyset filtresi, sıralama ve limit fonksiyonun içinde uygulanır; set döndüren
+-- RPC'nin üstüne PostgREST filtresi eklemekten farklı olarak Postgres tüm listeyi
+-- değil sadece istenen sayfayı üretir. Sıralama (skor desc, id asc), NULL skor 0
+-- sayılır (coalesce), böylece NULL'lar en üste çıkmaz. p_after_score/p_after_id
+-- önceki sayfanın son satırıdır (ilk sayfada null); p_limit, sonraki sayfa olup
+-- olmadığını anlamak için page_size + 1 olarak gönderilir (utils/pagination.keyset_rpc_params).
+
+-- Toplam skor ve mixed-rush: indeks aralık taraması, sayfa başına O(p_limit)
+create index if not exists profiles_total_score_keyset_idx
+    on public.profiles ((coalesce(total_score, 0)) desc, id);
+create index if not exists profiles_mixed_rush_keyset_idx
+    on public.profiles ((coalesce(mixed_rush_highscore, 0)) desc, id);
+
+-- Oyun ve pencere tabloları kullanıcı başına toplamdır; toplama indeksten
+-- (index-only) yapılır, sıralama/limit ve profil birleştirmesi sadece sayfa için
+create index if not exists user_level_progress_category_user_idx
+    on public.user_level_progress (category_id, user_id) include (score);
+create index if not exists leaderboard_score_buckets_window_cover_idx
+    on public.leaderboard_score_buckets (game, bucket_start) include (user_id, score);
+
+create or replace function public.get_leaderboard_total_score_page(
+    p_after_score bigint default null, p_after_id uuid default null, p_limit integer default 51)
+returns table (id uuid, username text, avatar_url text, total_score bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select p.id, p.username::text, p.avatar_url::text, coalesce(p.total_score, 0)::bigint
+      from profiles p
+     where p_after_score is null
+        or (coalesce(p.total_score, 0) <= p_after_score
+            and (coalesce(p.total_score, 0) < p_after_score or p.id > p_after_id))
+     order by coalesce(p.total_score, 0) desc, p.id
+     limit least(greatest(p_limit, 1), 101);
+$$;
+
+create or replace function public.get_leaderboard_mixed_rush_page(
+    p_after_score bigint default null, p_after_id uuid default null, p_limit integer default 51)
+returns table (id uuid, username text, avatar_url text, mixed_rush_highscore bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select p.id, p.username::text, p.avatar_url::text, coalesce(p.mixed_rush_highscore, 0)::bigint
+      from profiles p
+     where p_after_score is null
+        or (coalesce(p.mixed_rush_highscore, 0) <= p_after_score
+            and (coalesce(p.mixed_rush_highscore, 0) < p_after_score or p.id > p_after_id))
+     order by coalesce(p.mixed_rush_highscore, 0) desc, p.id
+     limit least(greatest(p_limit, 1), 101);
+$$;
+
+create or replace function public.get_leaderboard_for_game_page(
+    p_game_slug text, p_after_score bigint default null, p_after_id uuid default null, p_limit integer default 51)
+returns table (id uuid, username text, avatar_url text, total_score_for_game bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    with totals as (
+        select ulp.user_id, sum(coalesce(ulp.score, 0))::bigint as score
+          from user_level_progress ulp
+          join categories c on c.id = ulp.category_id
+          join game_types g on g.id = c.game_type_id
+         where g.slug = p_game_slug
+         group by ulp.user_id
+    ), page as (
+        select t.user_id, t.score
+          from totals t
+         where p_after_score is null
+            or t.score < p_after_score
+            or (t.score = p_after_score and t.user_id > p_after_id)
+         order by t.score desc, t.user_id
+         limit least(greatest(p_limit, 1), 101)
+    )
+    select page.user_id, p.username::text, p.avatar_url::text, page.score
+      from page
+      left join profiles p on p.id = page.user_id
+     order by page.score desc, page.user_id;
+$$;
+
+-- get_windowed_leaderboard'un sayfalı hali (sql/leaderboard_score_buckets.sql)
+create or replace function public.get_windowed_leaderboard_page(
+    p_game text, p_from date, p_to date, p_agg text default 'sum',
+    p_after_score bigint default null, p_after_id uuid default null, p_limit integer default 51)
+returns table (user_id uuid, score bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    with totals as (
+        select b.user_id,
+               case when p_agg = 'max' then max(b.score) else sum(b.score) end::bigint as score
+          from leaderboard_score_buckets b
+         where b.game = p_game
+           and b.bucket_start between p_from and p_to
+         group by b.user_id
+    )
+    select t.user_id, t.score
+      from totals t
+     where p_after_score is null
+        or t.score < p_after_score
+        or (t.score = p_after_score and t.user_id > p_after_id)
+     order by t.score desc, t.user_id
+     limit least(greatest(p_limit, 1), 101);
+$$;
+
+grant execute on function public.get_leaderboard_total_score_page(bigint, uuid, integer) to anon, authenticated, service_role;
+grant execute on function public.get_leaderboard_mixed_rush_page(bigint, uuid, integer) to anon, authenticated, service_role;
+grant execute on function public.get_leaderboard_for_game_page(text, bigint, uuid, integer) to anon, authenticated, service_role;
+grant execute on function public.get_windowed_leaderboard_page(text, date, date, text, bigint, uuid, integer)
+    to anon, authenticated, service_role;
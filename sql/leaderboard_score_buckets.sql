@@ -0,0 +1,74 @@
+-- Günlük/haftalık/kayan pencere liderlik tabloları için gün kovaları.
+-- Her satır bir kullanıcının bir oyundaki (veya '_all' toplamındaki) o günkü
+-- skorudur. Toplama oyunlarında skorlar toplanır, rekor bazlı oyunlarda
+-- (mixed-rush) günün en yükseği tutulur. Kovalar upsert_level_progress_*
+-- RPC'leri içinde, seviye skoruyla aynı işlemde güncellenir.
+create table if not exists public.leaderboard_score_buckets (
+    user_id uuid not null references public.profiles (id) on delete cascade,
+    game text not null,
+    bucket_start date not null,
+    score bigint not null default 0,
+    primary key (user_id, game, bucket_start)
+);
+
+create index if not exists leaderboard_score_buckets_window_idx
+    on public.leaderboard_score_buckets (game, bucket_start);
+
+alter table public.leaderboard_score_buckets enable row level security;
+
+-- p_rows: [{"user_id", "game", "bucket_start", "points"}, ...]
+-- p_mode: 'sum' puanları toplar, 'max' günün en yüksek değerini tutar
+create or replace function public.add_score_buckets(p_rows jsonb, p_mode text default 'sum')
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into leaderboard_score_buckets (user_id, game, bucket_start, score)
+    select (r->>'user_id')::uuid,
+           r->>'game',
+           coalesce((r->>'bucket_start')::date, current_date),
+           case when p_mode = 'max' then max((r->>'points')::bigint) else sum((r->>'points')::bigint) end
+      from jsonb_array_elements(p_rows) as r
+     where r->>'game' is not null
+     group by 1, 2, 3
+    on conflict (user_id, game, bucket_start)
+    do update set score = case when p_mode = 'max'
+                               then greatest(leaderboard_score_buckets.score, excluded.score)
+                               else leaderboard_score_buckets.score + excluded.score end;
+end;
+$$;
+
+-- [p_from, p_to] aralığındaki kovaları kullanıcı başına toplar (p_agg='max' ise en yükseğini alır).
+-- Sayfalı okumalar sql/leaderboard_keyset.sql'deki get_windowed_leaderboard_page ile yapılır.
+create or replace function public.get_windowed_leaderboard(p_game text, p_from date, p_to date, p_agg text default 'sum')
+returns table (user_id uuid, score bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select b.user_id,
+           case when p_agg = 'max' then max(b.score) else sum(b.score) end::bigint as score
+      from leaderboard_score_buckets b
+     where b.game = p_game
+       and b.bucket_start between p_from and p_to
+     group by b.user_id;
+$$;
+
+-- Saklama süresini geçen kovaları siler (günlük bir zamanlanmış işten çağrılır)
+create or replace function public.prune_score_buckets(p_keep_days integer default 35)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    delete from leaderboard_score_buckets where bucket_start < current_date - p_keep_days;
+$$;
+
+revoke execute on function public.add_score_buckets(jsonb, text) from public, anon, authenticated;
+revoke execute on function public.prune_score_buckets(integer) from public, anon, authenticated;
+grant execute on function public.add_score_buckets(jsonb, text) to service_role;
+grant execute on function public.prune_score_buckets(integer) to service_role;
+grant execute on function public.get_windowed_leaderboard(text, date, date, text) to anon, authenticated, service_role;
@@ -0,0 +1,28 @@
+-- Arkadaş listelerinin "en son aktif olan önce" sıralaması için kalıcı etkinlik zamanı.
+-- Değer unix saniyesidir (utils/pagination'daki tamsayı keyset cursor'ıyla aynı);
+-- hiç görülmemiş kullanıcılar 0'dır ve sona düşer. utils/activity.py yazımları
+-- kullanıcı başına ACTIVITY_PERSIST_SECONDS'ta bir olacak şekilde toplu yapar.
+alter table public.profiles
+    add column if not exists last_active_at bigint not null default 0;
+
+create index if not exists profiles_last_active_at_idx
+    on public.profiles (last_active_at desc, id);
+
+-- p_rows: [{"user_id", "last_active_at"}, ...]; değer sadece ileri gider
+create or replace function public.touch_last_active(p_rows jsonb)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update profiles p
+       set last_active_at = r.last_active_at
+      from (select (x->>'user_id')::uuid as user_id, max((x->>'last_active_at')::bigint) as last_active_at
+              from jsonb_array_elements(p_rows) as x
+             group by 1) r
+     where p.id = r.user_id
+       and p.last_active_at < r.last_active_at;
+$$;
+
+revoke execute on function public.touch_last_active(jsonb) from public, anon, authenticated;
+grant execute on function public.touch_last_active(jsonb) to service_role;
@@ -0,0 +1,8 @@
+-- Username çözümlemesi (utils/usernames.py) her istekte veritabanına sorar.
+-- Birebir eşleşme btree indeksi, büyük/küçük harf duyarsız eşleşme (ilike)
+-- ve /api/social/users/search'ün veritabanı yolu trigram indeksi kullanır.
+create index if not exists profiles_username_idx on public.profiles (username);
+
+create extension if not exists pg_trgm;
+create index if not exists profiles_username_trgm_idx
+    on public.profiles using gin (username gin_trgm_ops);
@@ -0,0 +1,53 @@
+-- Birden çok seviye artışını tek çağrıda uygular ve her kullanıcının
+-- profiles.total_score'unu toplam artış kadar günceller.
+-- Liderlik tablosu gün kovaları da aynı işlemde güncellenir
+-- (önce sql/leaderboard_score_buckets.sql yüklenmelidir).
+-- p_rows: [{"user_id", "category_id", "language_code", "level", "score_increment",
+--           "game" (opsiyonel), "bucket_start" (opsiyonel, YYYY-MM-DD)}, ...]
+create or replace function public.upsert_level_progress_batch(p_rows jsonb)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into user_level_progress (user_id, category_id, language_code, level, score)
+    select (r->>'user_id')::uuid,
+           (r->>'category_id')::bigint,
+           r->>'language_code',
+           (r->>'level')::integer,
+           sum((r->>'score_increment')::integer)
+      from jsonb_array_elements(p_rows) as r
+     group by 1, 2, 3, 4
+    on conflict (user_id, category_id, language_code, level)
+    do update set score = user_level_progress.score + excluded.score;
+
+    update profiles p
+       set total_score = coalesce(p.total_score, 0) + t.increment
+      from (
+            select (r->>'user_id')::uuid as user_id,
+                   sum((r->>'score_increment')::integer) as increment
+              from jsonb_array_elements(p_rows) as r
+             group by 1
+           ) t
+     where p.id = t.user_id;
+
+    -- Her artış '_all' toplamına, oyunu varsa o oyunun kovasına da eklenir
+    insert into leaderboard_score_buckets (user_id, game, bucket_start, score)
+    select (r->>'user_id')::uuid,
+           g.game,
+           coalesce((r->>'bucket_start')::date, current_date),
+           sum((r->>'score_increment')::bigint)
+      from jsonb_array_elements(p_rows) as r
+     cross join lateral (values ('_all'), (nullif(r->>'game', ''))) as g(game)
+     where g.game is not null
+     group by 1, 2, 3
+    on conflict (user_id, game, bucket_start)
+    do update set score = leaderboard_score_buckets.score + excluded.score;
+end;
+$$;
+
+-- security definer ve satırlardaki user_id dışarıdan geldiği için sadece sunucu
+-- (service_role) çağırabilir
+revoke execute on function public.upsert_level_progress_batch(jsonb) from public, anon, authenticated;
+grant execute on function public.upsert_level_progress_batch(jsonb) to service_role;
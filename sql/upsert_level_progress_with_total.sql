@@ -0,0 +1,47 @@
+-- Seviye skorunu artırır ve profiles.total_score'u aynı işlemde aynı miktarda artırır.
+-- recalculate_total_score_for_user yerine kullanılır; olası sapmalar
+-- routes/progress.py içindeki periyodik uzlaştırma işiyle düzeltilir.
+-- Liderlik tablosu gün kovaları da aynı işlemde güncellenir
+-- (önce sql/leaderboard_score_buckets.sql yüklenmelidir).
+drop function if exists public.upsert_level_progress_with_total(uuid, bigint, text, integer, integer);
+
+create or replace function public.upsert_level_progress_with_total(
+    p_user_id uuid,
+    p_category_id bigint,
+    p_language_code text,
+    p_level integer,
+    p_score_increment integer,
+    p_game text default null,
+    p_bucket_start date default null
+)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into user_level_progress (user_id, category_id, language_code, level, score)
+    values (p_user_id, p_category_id, p_language_code, p_level, p_score_increment)
+    on conflict (user_id, category_id, language_code, level)
+    do update set score = user_level_progress.score + excluded.score;
+
+    update profiles
+       set total_score = coalesce(total_score, 0) + p_score_increment
+     where id = p_user_id;
+
+    -- Artış '_all' toplamına, oyun verilmişse o oyunun kovasına da eklenir
+    insert into leaderboard_score_buckets (user_id, game, bucket_start, score)
+    select distinct p_user_id, g.game, coalesce(p_bucket_start, current_date), p_score_increment::bigint
+      from (values ('_all'), (nullif(p_game, ''))) as g(game)
+     where g.game is not null
+    on conflict (user_id, game, bucket_start)
+    do update set score = leaderboard_score_buckets.score + excluded.score;
+end;
+$$;
+
+-- security definer ve p_user_id dışarıdan geldiği için sadece sunucu (service_role)
+-- çağırabilir; aksi halde her istemci rpc/ ile herhangi bir kullanıcının skorunu artırabilir
+revoke execute on function public.upsert_level_progress_with_total(uuid, bigint, text, integer, integer, text, date)
+    from public, anon, authenticated;
+grant execute on function public.upsert_level_progress_with_total(uuid, bigint, text, integer, integer, text, date)
+    to service_role;
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modüller import sırasında bu ayarları okur; testler gerçek Supabase'e hiç gitmez
+os.environ.setdefault('SUPABASE_URL', 'https://test.supabase.co')
+os.environ.setdefault('SUPABASE_KEY', 'test-anon-key')
+os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'test-service-key')
+os.environ.setdefault('SUPABASE_JWT_SECRET', 'test-jwt-secret-for-hs256-signing-key')
+os.environ.setdefault('AVATAR_UPLOAD_SECRET', 'test-upload-secret')
+os.environ.setdefault('AUTH_REMOTE_RECHECK_SECONDS', '0')
+os.environ.setdefault('SCORE_WRITE_BEHIND', '0')
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Tüm Supabase HTTP isteklerini `handler(request) -> httpx.Response`'a yönlendirir."""
+    import httpx
+
+    routes = {'handler': None, 'requests': []}
+
+    def handle_request(self, request):
+        request.read()
+        routes['requests'].append(request)
+        return routes['handler'](request)
+
+    monkeypatch.setattr(httpx.HTTPTransport, 'handle_request', handle_request)
+    return routes
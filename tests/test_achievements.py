@@ -0,0 +1,18 @@
+from utils import achievements
+from utils.achievements import AchievementEvaluator
+
+
+def test_notify_deadline_is_capped_from_the_first_pending_event(monkeypatch):
+    clock = {'now': 1000.0}
+    monkeypatch.setattr(achievements.time, 'time', lambda: clock['now'])
+    evaluator = AchievementEvaluator(None, debounce=3, max_delay=10)
+    monkeypatch.setattr(evaluator, '_ensure_started', lambda: None)
+
+    evaluator.notify('user-1')
+    assert evaluator._due['user-1'] == 1003.0
+
+    # Her 2 saniyede bir gelen olay kontrolü ilk olaydan 10 saniye sonrasına kadar iter
+    for _ in range(10):
+        clock['now'] += 2
+        evaluator.notify('user-1')
+    assert evaluator._due['user-1'] == 1010.0
@@ -0,0 +1,121 @@
+import json
+from urllib.parse import parse_qsl
+
+import httpx
+import pytest
+from flask import Flask, jsonify, request
+
+from utils import idempotency
+
+
+class FakeKeysTable:
+    """PostgREST'in idempotency_keys için kullanılan alt kümesi (upsert/select/update/delete)."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def __call__(self, request):
+        params = dict(parse_qsl(request.url.query.decode()))
+        filters = {k: v[3:] for k, v in params.items() if v.startswith('eq.')}
+        if request.method == 'POST':
+            row = json.loads(request.content)
+            pk = (row['user_id'], row['scope'], row['key'])
+            if pk in self.rows:
+                return self._json(request, [])
+            self.rows[pk] = dict(row, status='in_progress', locked_at='2099-01-01T00:00:00+00:00')
+            return self._json(request, [self.rows[pk]])
+        matched = [(pk, row) for pk, row in self.rows.items()
+                   if all(str(row.get(k)) == v for k, v in filters.items())]
+        if request.method == 'GET':
+            return self._json(request, [row for _, row in matched])
+        if request.method == 'PATCH':
+            for _, row in matched:
+                row.update(json.loads(request.content))
+            return self._json(request, [row for _, row in matched])
+        if request.method == 'DELETE':
+            for pk, _ in matched:
+                del self.rows[pk]
+            return self._json(request, [])
+        raise AssertionError(request.method)
+
+    @staticmethod
+    def _json(request, body):
+        return httpx.Response(200, json=body, request=request)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setitem(idempotency._store, 'available', True)
+    monkeypatch.setitem(idempotency._store, 'last_prune', float('inf'))
+    idempotency._results.clear()
+    calls = []
+    app = Flask(__name__)
+
+    @app.route('/score', methods=['POST'])
+    def score():
+        def handler():
+            calls.append(request.get_json())
+            return jsonify(applied=len(calls)), 201
+        return idempotency.run_idempotent('user-1', 'score', handler)
+
+    app.calls = calls
+    return app
+
+
+def post(client, body, key='key-1'):
+    return client.post('/score', json=body, headers={'Idempotency-Key': key})
+
+
+def test_replay_returns_stored_response_without_rerunning(app, transport):
+    transport['handler'] = table = FakeKeysTable()
+    client = app.test_client()
+
+    first = post(client, {'points': 5})
+    idempotency._results.clear()   # tekrarı başka bir worker karşılıyormuş gibi
+    second = post(client, {'points': 5})
+
+    assert first.status_code == second.status_code == 201
+    assert second.get_json() == first.get_json() == {'applied': 1}
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert len(app.calls) == 1
+    assert next(iter(table.rows.values()))['status'] == 'done'
+
+
+def test_same_key_with_different_body_is_rejected(app, transport):
+    transport['handler'] = FakeKeysTable()
+    client = app.test_client()
+
+    assert post(client, {'points': 5}).status_code == 201
+    assert post(client, {'points': 50}).status_code == 422
+    idempotency._results.clear()
+    assert post(client, {'points': 50}).status_code == 422
+    assert len(app.calls) == 1
+
+
+def test_permission_error_falls_back_to_in_process_keys(app, transport):
+    transport['handler'] = lambda request: httpx.Response(
+        403, json={'code': '42501', 'message': 'permission denied for table idempotency_keys'}, request=request)
+    client = app.test_client()
+
+    first = post(client, {'points': 5})
+    second = post(client, {'points': 5})
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert len(app.calls) == 1
+    assert idempotency._store['available'] is False
+
+
+def test_handler_errors_are_not_swallowed(app, transport):
+    transport['handler'] = table = FakeKeysTable()
+
+    @app.route('/boom', methods=['POST'])
+    def boom():
+        def handler():
+            raise RuntimeError('boom')
+        return idempotency.run_idempotent('user-1', 'boom', handler)
+
+    app.testing = True
+    with pytest.raises(RuntimeError):
+        app.test_client().post('/boom', json={}, headers={'Idempotency-Key': 'k'})
+    assert table.rows == {}   # anahtar serbest bırakıldı, istemci yeniden deneyebilir
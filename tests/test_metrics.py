@@ -0,0 +1,22 @@
+import app as app_module
+
+
+def _get(headers=None, remote_addr='127.0.0.1'):
+    client = app_module.app.test_client()
+    return client.get('/api/metrics', headers=headers or {}, environ_base={'REMOTE_ADDR': remote_addr})
+
+
+def test_without_token_only_loopback_is_allowed(monkeypatch):
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', None)
+
+    assert _get().status_code == 200
+    assert _get(remote_addr='203.0.113.7').status_code == 403
+
+
+def test_token_is_required_when_configured(monkeypatch):
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 'metrics-secret')
+
+    assert _get().status_code == 403
+    assert _get({'Authorization': 'Bearer wrong'}).status_code == 403
+    assert _get({'Authorization': 'Bearer metrics-secret'}, remote_addr='203.0.113.7').status_code == 200
+    assert _get({'X-Metrics-Token': 'metrics-secret'}, remote_addr='203.0.113.7').status_code == 200
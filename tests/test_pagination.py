@@ -0,0 +1,74 @@
+import json
+
+import httpx
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from utils.pagination import (
+    MAX_PAGE_SIZE, build_page, decode_cursor, encode_cursor, keyset_rpc_params, keyset_slice, page_params,
+)
+
+UUID = '0b5c6a1e-3f7d-4c2b-9a8e-1d2c3b4a5f60'
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1200, UUID)) == (1200, UUID)
+    assert decode_cursor(encode_cursor(0, 'abc-1')) == (0, 'abc-1')
+
+
+@pytest.mark.parametrize('cursor', [None, '', 'not base64!', encode_cursor('x', UUID),
+                                    encode_cursor(5, 'a,b'), encode_cursor(5, "a)or(id.gt.0")])
+def test_invalid_cursors_decode_to_none(cursor):
+    assert decode_cursor(cursor) is None
+
+
+def test_page_params():
+    assert page_params(MultiDict()) == (False, 50, None)
+    assert page_params(MultiDict({'page_size': '1000'}))[:2] == (True, MAX_PAGE_SIZE)
+    assert page_params(MultiDict({'cursor': encode_cursor(3, UUID)})) == (True, 50, (3, UUID))
+
+
+def test_keyset_rpc_params():
+    assert keyset_rpc_params(None, 20) == {'p_after_score': None, 'p_after_id': None, 'p_limit': 21}
+    assert keyset_rpc_params((7, UUID), 20) == {'p_after_score': 7, 'p_after_id': UUID, 'p_limit': 21}
+
+
+def test_keyset_slice_walks_every_row_once_with_ties():
+    rows = [{'id': f'id-{i:02d}', 'score': i % 4} for i in range(23)]
+    seen, cursor = [], None
+    while True:
+        page = build_page(keyset_slice(rows, 'score', cursor, 5), 'score', 5)
+        seen.extend(r['id'] for r in page['items'])
+        if not page['next_cursor']:
+            break
+        cursor = decode_cursor(page['next_cursor'])
+    expected = [r['id'] for r in sorted(rows, key=lambda r: (-r['score'], r['id']))]
+    assert seen == expected
+
+
+def test_leaderboard_pages_through_sql_keyset(transport):
+    from app import app
+
+    profiles = sorted(({'id': f'00000000-0000-0000-0000-0000000000{i:02d}', 'username': f'u{i}',
+                        'avatar_url': None, 'total_score': (i * 7) % 5} for i in range(12)),
+                      key=lambda r: (-r['total_score'], r['id']))
+
+    def handler(request):
+        assert request.url.path.endswith('/rpc/get_leaderboard_total_score_page')
+        params = json.loads(request.content)
+        rows = profiles
+        if params['p_after_score'] is not None:
+            boundary = (-params['p_after_score'], params['p_after_id'])
+            rows = [r for r in rows if (-r['total_score'], r['id']) > boundary]
+        return httpx.Response(200, json=rows[:params['p_limit']], request=request)
+    transport['handler'] = handler
+
+    client = app.test_client()
+    seen, url = [], '/api/leaderboard/total-score?page_size=5'
+    while url:
+        page = client.get(url).get_json()
+        seen.extend(item['id'] for item in page['items'])
+        url = page['next_cursor'] and f"/api/leaderboard/total-score?page_size=5&cursor={page['next_cursor']}"
+
+    assert seen == [r['id'] for r in profiles]
+    assert [json.loads(r.content)['p_limit'] for r in transport['requests']] == [6, 6, 6]
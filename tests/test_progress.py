@@ -0,0 +1,60 @@
+import json
+
+import httpx
+import pytest
+
+from routes import progress
+from utils.score_queue import BatchApplyError
+
+
+def row(user_id, points=5):
+    return {'user_id': user_id, 'category_id': 1, 'language_code': 'en', 'level': 1,
+            'game': 'quiz', 'bucket_start': '2026-10-19', 'score_increment': points}
+
+
+@pytest.fixture(autouse=True)
+def rpc_paths(monkeypatch):
+    monkeypatch.setitem(progress._bulk_upsert, 'available', True)
+    monkeypatch.setitem(progress._incremental_total, 'available', True)
+
+
+def test_failed_bulk_call_is_retried_per_row_and_reports_only_bad_rows(transport):
+    def handler(request):
+        path = request.url.path
+        if path.endswith('/upsert_level_progress_batch'):
+            return httpx.Response(400, json={'code': '22003', 'message': 'integer out of range'}, request=request)
+        if path.endswith('/upsert_level_progress_with_total') and json.loads(request.content)['p_user_id'] == 'bad':
+            return httpx.Response(400, json={'code': '23503', 'message': 'foreign key violation'}, request=request)
+        return httpx.Response(200, json=[], request=request)
+    transport['handler'] = handler
+
+    with pytest.raises(BatchApplyError) as excinfo:
+        progress.apply_level_progress_batch([row('good'), row('bad'), row('also-good')])
+
+    assert [r['user_id'] for r in excinfo.value.failed] == ['bad']
+    written = [json.loads(r.content)['p_user_id'] for r in transport['requests']
+               if r.url.path.endswith('/upsert_level_progress_with_total')]
+    assert written == ['good', 'bad', 'also-good']
+    # Geçici bir hata toplu yolu kalıcı olarak kapatmaz
+    assert progress._bulk_upsert['available'] is True
+
+
+def test_permission_error_uses_legacy_path(transport):
+    def handler(request):
+        if 'with_total' in request.url.path or 'batch' in request.url.path:
+            return httpx.Response(403, json={'code': '42501', 'message': 'permission denied'}, request=request)
+        return httpx.Response(200, json=[], request=request)
+    transport['handler'] = handler
+
+    progress.apply_level_progress_batch([row('u1')])
+
+    paths = [r.url.path.rsplit('/', 1)[-1] for r in transport['requests']]
+    assert paths[:2] == ['upsert_level_progress_with_total', 'upsert_level_progress']
+    assert progress._incremental_total['available'] is False
+
+
+def test_score_range_error():
+    assert progress._score_range_error(1, 5) is None
+    assert progress._score_range_error(0, 5)
+    assert progress._score_range_error(1, -1)
+    assert progress._score_range_error(1, progress.SCORE_MAX_POINTS + 1)
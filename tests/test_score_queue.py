@@ -0,0 +1,118 @@
+import json
+import os
+
+import pytest
+
+from utils import score_queue as sq
+from utils.score_queue import BatchApplyError, ScoreWriteBehind
+
+
+class Recorder:
+    """apply_batch yerine geçer; `bad` kullanıcıların satırlarını yazamaz."""
+
+    def __init__(self, bad=(), partial=True):
+        self.bad = set(bad)
+        self.partial = partial
+        self.applied = []
+        self.calls = 0
+
+    def __call__(self, rows):
+        self.calls += 1
+        failed = [r for r in rows if r['user_id'] in self.bad]
+        if failed and not self.partial:
+            raise RuntimeError('batch rejected')
+        self.applied.extend(r for r in rows if r['user_id'] not in self.bad)
+        if failed:
+            raise BatchApplyError(failed, RuntimeError('bad row'))
+
+
+def make_queue(tmp_path, apply_batch, after=None):
+    queue = ScoreWriteBehind(apply_batch, after, interval=3600, spool_dir=str(tmp_path))
+    # Flush thread'i başlatmadan spool'u açar; testler flush'ı kendisi çağırır
+    queue._ensure_started = lambda: None
+    queue._pid, queue._token = os.getpid(), 'test'
+    queue._rewrite_spool(create=True)
+    return queue
+
+
+def spool_rows(queue):
+    with open(queue._spool_path(), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_flush_merges_increments_and_calls_after_once_per_user(tmp_path):
+    apply_batch, after = Recorder(), []
+    queue = make_queue(tmp_path, apply_batch, lambda user_id, points: after.append((user_id, points)))
+    queue.enqueue('u1', 1, 'en', 3, 5, game='quiz', day='2026-10-19')
+    queue.enqueue('u1', 1, 'en', 3, 7, game='quiz', day='2026-10-19')
+    queue.enqueue('u1', 2, 'en', 1, 1, game='quiz', day='2026-10-19')
+
+    queue.flush()
+
+    assert sorted((r['category_id'], r['score_increment']) for r in apply_batch.applied) == [(1, 12), (2, 1)]
+    assert after == [('u1', 13)]
+    assert spool_rows(queue) == []
+
+
+def test_partial_failure_requeues_only_failed_rows(tmp_path):
+    apply_batch, after = Recorder(bad={'bad'}), []
+    queue = make_queue(tmp_path, apply_batch, lambda user_id, points: after.append(user_id))
+    queue.enqueue('good', 1, 'en', 1, 5)
+    queue.enqueue('bad', 1, 'en', 1, 5)
+
+    queue.flush()
+    apply_batch.bad.clear()
+    queue.flush()
+
+    assert [r['user_id'] for r in apply_batch.applied] == ['good', 'bad']
+    assert after == ['good', 'bad']
+    assert queue.stats()['failed_rows_total'] == 1
+
+
+def test_whole_chunk_failure_requeues_chunk(tmp_path):
+    apply_batch = Recorder(bad={'bad'}, partial=False)
+    queue = make_queue(tmp_path, apply_batch)
+    queue.enqueue('good', 1, 'en', 1, 5)
+    queue.enqueue('bad', 1, 'en', 1, 5)
+
+    queue.flush()
+
+    assert apply_batch.applied == []
+    assert sorted(row[0] for row in spool_rows(queue)) == ['bad', 'good']
+
+
+def test_row_is_dead_lettered_after_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(sq, 'SCORE_MAX_ATTEMPTS', 3)
+    apply_batch = Recorder(bad={'bad'})
+    queue = make_queue(tmp_path, apply_batch)
+    queue.enqueue('bad', 1, 'en', 1, 5)
+
+    for _ in range(3):
+        queue.flush()
+    queue.flush()
+
+    assert apply_batch.calls == 3
+    assert spool_rows(queue) == []
+    with open(tmp_path / sq.SCORE_DEAD_LETTER_FILE, encoding='utf-8') as f:
+        dead = [json.loads(line) for line in f]
+    assert dead[0]['user_id'] == 'bad' and dead[0]['score_increment'] == 5 and dead[0]['attempts'] == 3
+    assert queue.stats()['dead_lettered_rows_total'] == 1
+
+
+@pytest.mark.skipif(sq.fcntl is None, reason='spool ownership uses flock')
+def test_dead_worker_spool_is_recovered_once(tmp_path):
+    # Ölü bir worker'ın kilitsiz spool'u (eski 4 alanlı satır biçimi dahil)
+    (tmp_path / 'score-spool-999999-dead.jsonl').write_text(
+        json.dumps(['u1', 1, 'en', 2, 'quiz', '2026-10-18', 4]) + '\n' +
+        json.dumps(['u2', 1, 'en', 1, 3]) + '\n', encoding='utf-8')
+    apply_batch = Recorder()
+    queue = make_queue(tmp_path, apply_batch)
+
+    with queue._lock:
+        assert queue._recover_spools()
+        assert not queue._recover_spools()
+    queue.flush()
+
+    assert sorted((r['user_id'], r['score_increment'], r['game']) for r in apply_batch.applied) == \
+        [('u1', 4, 'quiz'), ('u2', 3, None)]
+    assert sorted(os.listdir(tmp_path)) == ['score-spool-%d-test.jsonl' % os.getpid()]
@@ -0,0 +1,59 @@
+import json
+import os
+import time
+
+import httpx
+import jwt
+import pytest
+
+from routes import social
+
+USER_ID = '00000000-0000-0000-0000-000000000001'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from app import app
+    monkeypatch.setitem(social._friend_list_rpc, 'available', True)
+    token = jwt.encode({'sub': USER_ID, 'aud': 'authenticated', 'exp': int(time.time()) + 3600},
+                       os.environ['SUPABASE_JWT_SECRET'], algorithm='HS256')
+    test_client = app.test_client()
+    test_client.headers = {'Authorization': f'Bearer {token}'}
+    return test_client
+
+
+def friend(i, active):
+    return {'id': f'00000000-0000-0000-0000-0000000001{i:02d}', 'username': f'f{i}',
+            'avatar_url': None, 'last_active_at': active, 'friendship_id': None}
+
+
+def test_friend_pages_and_counts_come_from_sql(client, transport):
+    friends = [friend(i, 100 - i) for i in range(5)]
+    counts = [{'friends': 5, 'incoming_requests': 1, 'sent_requests': 0}]
+
+    def handler(request):
+        name = request.url.path.rsplit('/', 1)[-1]
+        if name == 'get_friend_list_counts':
+            return httpx.Response(200, json=counts, request=request)
+        assert name == 'get_friend_list_page'
+        params = json.loads(request.content)
+        rows = friends if params['p_list'] == 'friends' else []
+        if params['p_after_score'] is not None:
+            rows = [r for r in rows if (-r['last_active_at'], r['id']) > (-params['p_after_score'], params['p_after_id'])]
+        return httpx.Response(200, json=rows[:params['p_limit']], request=request)
+    transport['handler'] = handler
+
+    seen, url = [], '/api/social/friends?list=friends&page_size=2'
+    while url:
+        page = client.get(url, headers=client.headers).get_json()
+        assert page['total'] == 5
+        seen.extend(item['id'] for item in page['items'])
+        assert all('friendship_id' not in item for item in page['items'])
+        url = page['next_cursor'] and f"/api/social/friends?list=friends&page_size=2&cursor={page['next_cursor']}"
+    badge = client.get('/api/social/friends?counts_only=1', headers=client.headers).get_json()
+
+    assert seen == [f['id'] for f in friends]
+    assert badge == counts[0]
+    # Liste id'leri URL'e konmaz; RPC'ler kullanıcının JWT'siyle çağrılır
+    assert all('in.' not in str(r.url) for r in transport['requests'])
+    assert all(r.headers['authorization'] == client.headers['Authorization'] for r in transport['requests'])
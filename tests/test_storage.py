@@ -0,0 +1,90 @@
+import base64
+import json
+
+import httpx
+import pytest
+
+from utils import storage, thumbnails
+from utils.storage import InvalidUploadTicket, sign_upload_ticket, verify_upload_ticket
+
+
+def _reencode(ticket, **changes):
+    payload, signature = ticket.rsplit('.', 1)
+    data = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    data.update(changes)
+    forged = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+    return f"{forged}.{signature}"
+
+
+def test_ticket_round_trip():
+    ticket = sign_upload_ticket('user-1', 'user-1/' + 'a' * 32 + '.png')
+    data = verify_upload_ticket(ticket)
+    assert data['user_id'] == 'user-1'
+    assert data['path'] == 'user-1/' + 'a' * 32 + '.png'
+
+
+def test_expired_ticket_is_rejected():
+    with pytest.raises(InvalidUploadTicket, match='expired'):
+        verify_upload_ticket(sign_upload_ticket('user-1', 'user-1/a.png', ttl=-1))
+
+
+@pytest.mark.parametrize('changes', [{'p': 'user-2/a.png'}, {'u': 'user-2'}, {'e': 2 ** 40}])
+def test_tampered_payload_is_rejected(changes):
+    ticket = _reencode(sign_upload_ticket('user-1', 'user-1/a.png'), **changes)
+    with pytest.raises(InvalidUploadTicket, match='signature'):
+        verify_upload_ticket(ticket)
+
+
+def test_tampered_signature_and_garbage_are_rejected():
+    ticket = sign_upload_ticket('user-1', 'user-1/a.png')
+    with pytest.raises(InvalidUploadTicket):
+        verify_upload_ticket(ticket[:-1] + ('0' if ticket[-1] != '0' else '1'))
+    for garbage in (None, '', 'no-dot', 'a.b.c'):
+        with pytest.raises(InvalidUploadTicket):
+            verify_upload_ticket(garbage)
+
+
+def test_signed_unsafe_path_is_rejected():
+    with pytest.raises(InvalidUploadTicket, match='path'):
+        verify_upload_ticket(sign_upload_ticket('user-1', 'user-1/../user-2/a.png'))
+
+
+def test_tickets_are_refused_when_direct_uploads_are_disabled(monkeypatch):
+    ticket = sign_upload_ticket('user-1', 'user-1/a.png')
+    monkeypatch.setattr(storage, 'DIRECT_UPLOADS_ENABLED', False)
+    with pytest.raises(InvalidUploadTicket, match='disabled'):
+        verify_upload_ticket(ticket)
+
+
+def test_storage_management_uses_service_key(transport):
+    transport['handler'] = lambda request: httpx.Response(
+        200, headers={'content-length': '10', 'content-type': 'image/png'}, request=request)
+
+    info = storage.SupabaseStorage().stat('user-1/a.png')
+
+    assert info == {'size': 10, 'content_type': 'image/png'}
+    request = transport['requests'][0]
+    assert request.headers['apikey'] == 'test-service-key'
+    assert request.headers['authorization'] == 'Bearer test-service-key'
+
+
+def test_adopt_does_not_download_in_the_caller(monkeypatch):
+    class Storage:
+        def download(self, path):
+            raise AssertionError('adopt must not download synchronously')
+
+    submitted = []
+
+    class Pool:
+        def submit(self, fn, *args):
+            submitted.append((fn.__name__, args))
+
+    pipeline = thumbnails.ThumbnailPipeline(Storage())
+    monkeypatch.setattr(pipeline, '_pool', lambda: Pool())
+    monkeypatch.setattr(thumbnails, 'Image', object())
+    stem = 'b' * 32
+
+    pipeline.adopt(f'user-1/{stem}.png')
+    pipeline.adopt(f'user-1/{stem}.png')
+
+    assert submitted == [('_check', (stem, f'user-1/{stem}.png'))]
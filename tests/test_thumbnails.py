@@ -0,0 +1,53 @@
+import io
+
+import pytest
+
+from utils import thumbnails
+
+Image = pytest.importorskip('PIL.Image')
+
+
+class RecordingStorage:
+    def __init__(self):
+        self.uploads = []
+
+    def upload(self, path, chunks, content_type, length=None):
+        self.uploads.append(path)
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (10, 20, 30)).save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+def test_generate_writes_every_size():
+    storage = RecordingStorage()
+    pipeline = thumbnails.ThumbnailPipeline(storage, sizes=(16, 32))
+
+    pipeline._generate('c' * 64, png(100, 60))
+
+    assert storage.uploads == [pipeline._thumb_path('c' * 64, 16), pipeline._thumb_path('c' * 64, 32)]
+
+
+def test_oversized_image_is_rejected_before_decoding(monkeypatch):
+    monkeypatch.setattr(thumbnails, 'AVATAR_MAX_PIXELS', 50 * 50)
+    storage = RecordingStorage()
+    pipeline = thumbnails.ThumbnailPipeline(storage, sizes=(16,))
+
+    with pytest.raises(thumbnails.ImageTooLarge):
+        pipeline._generate('d' * 64, png(100, 100))
+
+    assert storage.uploads == []
+    assert pipeline.stats()['rejected_too_large_total'] == 1
+
+
+def test_ready_set_is_bounded(monkeypatch):
+    monkeypatch.setattr(thumbnails, 'AVATAR_THUMBNAIL_READY_CACHE_SIZE', 3)
+    pipeline = thumbnails.ThumbnailPipeline(RecordingStorage(), sizes=(16,))
+    for i in range(10):
+        assert pipeline._claim(f'{i:064x}')
+        pipeline._finish(f'{i:064x}', True)
+
+    assert pipeline.stats()['ready'] <= 3
@@ -0,0 +1,37 @@
+import httpx
+
+from utils.usernames import UsernameIndex
+from extensions import supabase
+
+
+def test_exact_hits_come_from_the_index(transport):
+    transport['handler'] = lambda request: httpx.Response(200, json=[], request=request)
+    index = UsernameIndex(supabase)
+    index.observe([{'id': 'id-1', 'username': 'Alice'}])
+
+    assert index.resolve('Alice') == 'id-1'
+    assert index.resolve_many(['Alice']) == {'Alice': 'id-1'}
+    assert transport['requests'] == []
+
+
+def test_miss_costs_one_query_and_prefers_the_exact_match(transport):
+    rows = [{'id': 'id-1', 'username': 'BOB'}, {'id': 'id-2', 'username': 'bob'}]
+    transport['handler'] = lambda request: httpx.Response(200, json=rows, request=request)
+    index = UsernameIndex(supabase)
+
+    assert index.resolve('bob') == 'id-2'
+    assert len(transport['requests']) == 1
+    assert 'ilike' in str(transport['requests'][0].url)
+    # Sonuç haritaya işlendi; tekrar sorulmaz
+    assert index.resolve('bob') == 'id-2'
+    assert len(transport['requests']) == 1
+
+
+def test_ambiguous_case_insensitive_match_resolves_to_none(transport):
+    rows = [{'id': 'id-1', 'username': 'BOB'}, {'id': 'id-2', 'username': 'Bob'}]
+    transport['handler'] = lambda request: httpx.Response(200, json=rows, request=request)
+    index = UsernameIndex(supabase)
+
+    assert index.resolve('bob') is None
+    assert index.resolve('bob') is None
+    assert len(transport['requests']) == 1   # negatif önbellek
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+import traceback
+
+from extensions import supabase
+from utils import metrics
+from utils.profiles import invalidate_full_profile
+
+ACHIEVEMENT_DEBOUNCE_SECONDS = float(os.environ.get('ACHIEVEMENT_DEBOUNCE_SECONDS', 3.0))
+# Sürekli skor gönderen bir kullanıcının kontrolü ilk bekleyen olaydan en fazla bu kadar ertelenir
+ACHIEVEMENT_MAX_DELAY_SECONDS = float(os.environ.get('ACHIEVEMENT_MAX_DELAY_SECONDS', 15.0))
+ACHIEVEMENT_DEFINITIONS_TTL = float(os.environ.get('ACHIEVEMENT_DEFINITIONS_TTL', 600))
+
+
+class AchievementEvaluator:
+    """Eşiği olmayan madalyaların kontrolünü istek yolundan çıkarıp kullanıcı başına erteler.
+
+    Eşik bazlı madalyalar (achievements.threshold dolu olanlar) veritabanında,
+    profiles skorunu değiştiren işlemin içindeki trigger ile verilir
+    (sql/achievement_thresholds.sql); bu yüzden worker'lar arasında dağılan
+    skor gönderimleri de veritabanındaki toplamla değerlendirilir. Eşiği
+    olmayan bir madalya tanımlıysa `check_and_award_achievements` RPC'si
+    ACHIEVEMENT_DEBOUNCE_SECONDS içinde gelen olaylar için bir kez çağrılır.
+    Her olay kontrolü ileri iter, ama ilk bekleyen olaydan itibaren
+    ACHIEVEMENT_MAX_DELAY_SECONDS'ı geçmez.
+    """
+
+    def __init__(self, client, debounce=ACHIEVEMENT_DEBOUNCE_SECONDS, max_delay=ACHIEVEMENT_MAX_DELAY_SECONDS):
+        self.client = client
+        self.debounce = debounce
+        self.max_delay = max(max_delay, debounce)
+        self._lock = threading.Lock()
+        self._due = {}        # user_id -> zamanı gelen kontrol
+        self._first = {}      # user_id -> ilk bekleyen olayın zamanı
+        self._needs_rpc = None
+        self._definitions_at = 0
+        self._thread = None
+        self._pid = None
+        self._stats = {'events_total': 0, 'evaluations_total': 0, 'rpc_calls_total': 0, 'skipped_total': 0}
+
+    def notify(self, user_id):
+        """Bir skor olayını kaydeder ve kullanıcının kontrolünü erteler."""
+        self._ensure_started()
+        user_id = str(user_id)
+        now = time.time()
+        with self._lock:
+            first = self._first.setdefault(user_id, now)
+            self._due[user_id] = min(now + self.debounce, first + self.max_delay)
+            self._stats['events_total'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, scheduled_users=len(self._due), rpc_required=self._needs_rpc)
+
+    # --- internals ---
+
+    def _ensure_started(self):
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='achievement-evaluator', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(min(0.25, self.debounce))
+            now = time.time()
+            with self._lock:
+                ready = [uid for uid, due in self._due.items() if due <= now]
+                for uid in ready:
+                    del self._due[uid]
+                    del self._first[uid]
+            for user_id in ready:
+                try:
+                    self._evaluate(user_id)
+                except Exception as e:
+                    print(f"[achievements] evaluation failed for user {user_id}: {e}")
+                    traceback.print_exc()
+
+    def _evaluate(self, user_id):
+        with self._lock:
+            self._stats['evaluations_total'] += 1
+        if not self._rpc_required():
+            with self._lock:
+                self._stats['skipped_total'] += 1
+            return
+        self.client.rpc('check_and_award_achievements', {'p_user_id': user_id}).execute()
+        with self._lock:
+            self._stats['rpc_calls_total'] += 1
+        invalidate_full_profile(user_id)
+
+    def _rpc_required(self):
+        """Eşiği tanımlanmamış (trigger'ın kapsamadığı) bir madalya varsa True."""
+        now = time.time()
+        if self._definitions_at and now - self._definitions_at < ACHIEVEMENT_DEFINITIONS_TTL:
+            return self._needs_rpc
+        try:
+            res = self.client.table('achievements').select('id').is_('threshold', 'null').limit(1).execute()
+            needs_rpc = bool(res.data)
+        except Exception as e:
+            # Migration yüklü değilse (threshold kolonu yok) eski RPC yoluna düşülür
+            print(f"[achievements] could not read achievement thresholds: {e}")
+            needs_rpc = True
+        self._needs_rpc = needs_rpc
+        self._definitions_at = now
+        return needs_rpc
+
+
+achievement_evaluator = AchievementEvaluator(supabase)
+metrics.register('achievements', achievement_evaluator.stats)
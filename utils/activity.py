@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+from extensions import service_supabase
+from utils import metrics
+from utils.cache import TTLCache
+
+# Son etkinlik zamanlarının tutulduğu en fazla kullanıcı ve tutulma süresi
+ACTIVITY_CACHE_SIZE = int(os.environ.get('ACTIVITY_CACHE_SIZE', 200000))
+ACTIVITY_TTL_SECONDS = float(os.environ.get('ACTIVITY_TTL_SECONDS', 7 * 24 * 3600))
+# Aynı kullanıcı için bu süreden sık gelen istekler kaydı yenilemez
+ACTIVITY_RESOLUTION_SECONDS = int(os.environ.get('ACTIVITY_RESOLUTION_SECONDS', 60))
+# profiles.last_active_at bir kullanıcı için en fazla bu aralıkla yazılır
+ACTIVITY_PERSIST_SECONDS = int(os.environ.get('ACTIVITY_PERSIST_SECONDS', 300))
+# Bekleyen yazımların toplu gönderilme aralığı
+ACTIVITY_FLUSH_SECONDS = float(os.environ.get('ACTIVITY_FLUSH_SECONDS', 5))
+
+# touch_last_active sadece service_role'e açıktır; service key yoksa veya
+# sql/profiles_last_active_at.sql yüklü değilse yazım yapılmaz
+_persist = {'available': service_supabase is not None}
+
+
+def _is_missing_function_error(e):
+    message = str(e)
+    return 'PGRST202' in message or '42883' in message or 'Could not find the function' in message
+
+
+def _is_permission_error(e):
+    return '42501' in str(e)
+
+
+class ActivityTracker:
+    """Kullanıcıların "en son ne zaman aktifti" zamanını profiles.last_active_at'e yazar.
+
+    Doğrulanan her istek `touch` eder. Worker kullanıcının zamanını en fazla
+    ACTIVITY_PERSIST_SECONDS'ta bir `touch_last_active` RPC'sine kuyruklar;
+    kuyruk arka planda ACTIVITY_FLUSH_SECONDS'ta bir tek çağrıyla gönderilir.
+    Arkadaş listeleri veritabanındaki bu kolona göre sıralanır, bu yüzden tüm
+    worker'lar aynı sırayı görür.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._seen = TTLCache(ACTIVITY_CACHE_SIZE, ACTIVITY_TTL_SECONDS)
+        self._persisted = TTLCache(ACTIVITY_CACHE_SIZE, ACTIVITY_PERSIST_SECONDS)
+        self._dirty = {}    # user_id -> yazılacak zaman
+        self._thread = None
+        self._pid = None
+        self._stats = {'touches_total': 0, 'flushes_total': 0, 'rows_written_total': 0, 'write_errors_total': 0}
+
+    def touch(self, user_id, now=None):
+        now = int(now or time.time())
+        user_id = str(user_id)
+        last = self._seen.get(user_id)
+        if last is not None and now - last < ACTIVITY_RESOLUTION_SECONDS:
+            return
+        self._seen.set(user_id, now)
+        with self._lock:
+            self._stats['touches_total'] += 1
+        if not _persist['available'] or self._persisted.get(user_id) is not None:
+            return
+        self._persisted.set(user_id, now)
+        self._ensure_started()
+        with self._lock:
+            self._dirty[user_id] = now
+
+    def flush(self):
+        """Bekleyen zamanları tek RPC ile yazar; hata olursa sonraki tura bırakır."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        rows = [{'user_id': user_id, 'last_active_at': ts} for user_id, ts in dirty.items()]
+        try:
+            self.client.rpc('touch_last_active', {'p_rows': rows}).execute()
+        except Exception as e:
+            if _is_missing_function_error(e) or _is_permission_error(e):
+                print(f"[activity] touch_last_active unavailable ({e}), last_active_at will not be persisted")
+                _persist['available'] = False
+                return
+            print(f"[activity] persisting last_active_at failed: {e}")
+            with self._lock:
+                self._stats['write_errors_total'] += 1
+                for user_id, ts in dirty.items():
+                    self._dirty[user_id] = max(ts, self._dirty.get(user_id, 0))
+            return
+        with self._lock:
+            self._stats['flushes_total'] += 1
+            self._stats['rows_written_total'] += len(rows)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._dirty), persistent=_persist['available'],
+                        cache=self._seen.stats())
+
+    # --- internals ---
+
+    def _ensure_started(self):
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._dirty = {}
+            self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while _persist['available']:
+            time.sleep(ACTIVITY_FLUSH_SECONDS)
+            self.flush()
+
+
+activity_tracker = ActivityTracker(service_supabase)
+metrics.register('activity', activity_tracker.stats)
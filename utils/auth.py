@@ -0,0 +1,278 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from flask import g, jsonify
+
+from extensions import supabase, url
+from utils import metrics
+from utils.activity import activity_tracker
+from utils.cache import TTLCache
+
+try:
+    import jwt as pyjwt
+except ImportError:  # PyJWT yoksa her doğrulama Supabase'e gider
+    pyjwt = None
+
+# HS256 ile imzalanmış token'lar için Supabase projesinin JWT secret'ı
+SUPABASE_JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET')
+SUPABASE_JWT_AUDIENCE = os.environ.get('SUPABASE_JWT_AUDIENCE', 'authenticated')
+# Asimetrik anahtarlı projeler için JWKS (0 ile kapatılır)
+SUPABASE_JWKS_ENABLED = os.environ.get('SUPABASE_JWKS_ENABLED', '1') == '1'
+# Yerel doğrulanan bir oturumun, iptal (logout/ban) kontrolü için Supabase'e
+# tekrar sorulma aralığı. 0: hiç sorulmaz.
+AUTH_REMOTE_RECHECK_SECONDS = float(os.environ.get('AUTH_REMOTE_RECHECK_SECONDS', 300))
+# Supabase'e doğrulatılan token'ların önbelleği: geçerli token'lar exp'e kadar,
+# geçersizler kısa süre tutulur
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_MAX_TTL = float(os.environ.get('AUTH_TOKEN_CACHE_MAX_TTL', 3600))
+AUTH_NEGATIVE_CACHE_SECONDS = float(os.environ.get('AUTH_NEGATIVE_CACHE_SECONDS', 30))
+
+_jwks_client = None
+_rechecked_sessions = TTLCache(50000, AUTH_REMOTE_RECHECK_SECONDS or 1)
+_verified_tokens = TTLCache(AUTH_TOKEN_CACHE_SIZE, AUTH_NEGATIVE_CACHE_SECONDS)
+_stats_lock = threading.Lock()
+_stats = {'local_ok': 0, 'local_rejected': 0, 'remote_calls': 0, 'remote_rejected': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class AuthUser:
+    """İstek boyunca `flask.g.user` olarak tutulan doğrulanmış kullanıcı.
+
+    Eski kodla uyum için hem `user.id` hem `user.get('id')` çalışır.
+    """
+
+    def __init__(self, id, email=None, role=None, claims=None):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.claims = claims or {}
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __repr__(self):
+        return f"AuthUser(id={self.id!r})"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def extract_token(current_request):
+    """Authorization başlığından bearer token'ı çıkarır.
+
+    Bazı istemciler token yerine Supabase oturum JSON'ını gönderir; bu da desteklenir.
+    """
+    auth_header = current_request.headers.get('Authorization')
+    if not auth_header or ' ' not in auth_header:
+        return None
+    token = auth_header.split(' ', 1)[1].strip()
+    if token.startswith('{'):
+        try:
+            parsed = json.loads(token)
+            token = parsed.get('access_token') or parsed.get('accessToken') or parsed.get('token') or (parsed.get('data') or {}).get('access_token')
+        except Exception:
+            pass
+    return token or None
+
+
+def get_user_from_request(current_request):
+    """İstekteki token'ı doğrular ve (user, error_response) döndürür.
+
+    Başarılı doğrulamada kullanıcı `flask.g.user` içine de yazılır.
+    """
+    token = extract_token(current_request)
+    if not token:
+        return None, (jsonify(error="Authorization header missing or malformed"), 401)
+    try:
+        user = verify_token(token)
+    except Exception as e:
+        print(f"Auth validation error: {e}")
+        return None, (jsonify(error="Failed to validate token"), 401)
+    if not user:
+        return None, (jsonify(error="Invalid or expired token"), 401)
+    g.user = user
+    activity_tracker.touch(user.id)
+    return user, None
+
+
+def current_user():
+    """Bu istekte doğrulanmış kullanıcıyı döndürür (yoksa None)."""
+    return g.get('user')
+
+
+def verify_token(token):
+    """Token'ı doğrular; geçerliyse AuthUser, değilse None döndürür.
+
+    Önce imza, süre ve audience yerel olarak kontrol edilir. Yerel doğrulama
+    yapılamıyorsa (PyJWT/anahtar yok) Supabase'e sorulur. Yerel olarak geçerli
+    oturumlar iptal edilmiş olabilecekleri için AUTH_REMOTE_RECHECK_SECONDS'ta
+    bir Supabase'e tekrar doğrulatılır.
+    """
+    try:
+        claims = _verify_locally(token)
+    except InvalidToken as e:
+        _count('local_rejected')
+        print(f"Rejected token locally: {e}")
+        return None
+
+    if claims is None:
+        return _verify_remotely_cached(token)
+
+    _count('local_ok')
+    user = AuthUser(claims.get('sub'), email=claims.get('email'), role=claims.get('role'), claims=claims)
+    if not user.id:
+        return None
+
+    if AUTH_REMOTE_RECHECK_SECONDS > 0:
+        session_key = claims.get('session_id') or _token_hash(token)
+        if _rechecked_sessions.get(session_key) is None:
+            try:
+                # İptal kontrolü önbelleği atlar, sonucu önbelleğe yazar
+                if _verify_remotely_cached(token, refresh=True) is None:
+                    return None
+                _rechecked_sessions.set(session_key, True)
+            except Exception as e:
+                # Supabase'e ulaşılamıyorsa yerel doğrulamaya güvenilir; sonraki istekte tekrar denenir
+                print(f"Remote token recheck failed, using local verification: {e}")
+    return user
+
+
+def _verify_locally(token):
+    """Yerel doğrulama yapılabiliyorsa claims döndürür, yapılamıyorsa None.
+
+    Token geçersizse (imza, süre, audience) InvalidToken fırlatır.
+    """
+    if pyjwt is None:
+        return None
+    try:
+        header = pyjwt.get_unverified_header(token)
+    except pyjwt.PyJWTError as e:
+        raise InvalidToken(str(e))
+
+    # İzin verilen algoritma başlıktan değil anahtardan gelir: paylaşılan
+    # secret sadece HS256, JWKS anahtarı sadece kendi algoritmasıyla kullanılır
+    if header.get('alg') == 'HS256':
+        if not SUPABASE_JWT_SECRET:
+            return None
+        signing_key = SUPABASE_JWT_SECRET
+        algorithm = 'HS256'
+    else:
+        jwks_client = _get_jwks_client()
+        if jwks_client is None:
+            return None
+        try:
+            jwk = jwks_client.get_signing_key_from_jwt(token)
+        except pyjwt.PyJWKClientError as e:
+            print(f"JWKS lookup failed, falling back to remote validation: {e}")
+            return None
+        signing_key = jwk.key
+        algorithm = jwk.algorithm_name
+        if header.get('alg') != algorithm:
+            raise InvalidToken(f"token alg {header.get('alg')!r} does not match key alg {algorithm!r}")
+
+    try:
+        return pyjwt.decode(
+            token,
+            signing_key,
+            algorithms=[algorithm],
+            audience=SUPABASE_JWT_AUDIENCE,
+            options={'require': ['exp', 'sub']},
+        )
+    except pyjwt.PyJWTError as e:
+        raise InvalidToken(str(e))
+
+
+def _get_jwks_client():
+    global _jwks_client
+    if not SUPABASE_JWKS_ENABLED or not url:
+        return None
+    if _jwks_client is None:
+        _jwks_client = pyjwt.PyJWKClient(f"{url}/auth/v1/.well-known/jwks.json", cache_keys=True, lifespan=3600)
+    return _jwks_client
+
+
+def _is_rejection(e):
+    """Supabase Auth'un token'ı reddettiği hataları ağ hatalarından ayırır."""
+    return getattr(e, 'status', None) in (400, 401, 403, 404)
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _unverified_exp(token):
+    """Token payload'ındaki exp değerini imza kontrolü yapmadan okur."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload.encode()))['exp'])
+    except Exception:
+        return None
+
+
+def _verify_remotely_cached(token, refresh=False):
+    """Supabase doğrulamasını token hash'i ile önbelleğe alır.
+
+    Geçerli token'lar exp'e kadar (en fazla AUTH_TOKEN_CACHE_MAX_TTL),
+    reddedilenler AUTH_NEGATIVE_CACHE_SECONDS boyunca tutulur. Ağ hataları
+    önbelleğe yazılmaz.
+    """
+    cache_key = _token_hash(token)
+    if not refresh:
+        cached = _verified_tokens.get(cache_key)
+        if cached is not None:
+            return cached or None
+
+    try:
+        user = _verify_remotely(token)
+    except Exception as e:
+        if not _is_rejection(e):
+            raise
+        _count('remote_rejected')
+        user = None
+
+    if user is None:
+        _verified_tokens.set(cache_key, False, ttl=AUTH_NEGATIVE_CACHE_SECONDS)
+        return None
+    exp = _unverified_exp(token)
+    ttl = min(exp - time.time(), AUTH_TOKEN_CACHE_MAX_TTL) if exp else AUTH_NEGATIVE_CACHE_SECONDS
+    _verified_tokens.set(cache_key, user, ttl=ttl)
+    return user
+
+
+def _verify_remotely(token):
+    _count('remote_calls')
+    user_resp = supabase.auth.get_user(token)
+    user = None
+    if hasattr(user_resp, 'user'):
+        user = user_resp.user
+    elif isinstance(user_resp, dict):
+        user = user_resp.get('user') or (user_resp.get('data') and user_resp['data'].get('user'))
+    if not user:
+        _count('remote_rejected')
+        return None
+    if isinstance(user, dict):
+        return AuthUser(user.get('id'), email=user.get('email'), role=user.get('role'))
+    return AuthUser(user.id, email=getattr(user, 'email', None), role=getattr(user, 'role', None))
+
+
+def _auth_stats():
+    with _stats_lock:
+        counters = dict(_stats)
+    return dict(
+        counters,
+        token_cache=_verified_tokens.stats(),
+        rechecked_sessions=_rechecked_sessions.stats(),
+    )
+
+
+metrics.register('auth', _auth_stats)
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Boyutu sınırlı, süresi dolan kayıtları silen, thread-safe LRU önbellek.
+
+    Her kayıt kendi bitiş zamanını taşır (varsayılan `ttl`, `set(..., ttl=)`
+    ile değiştirilebilir). Kapasite dolduğunda en uzun süre kullanılmayan kayıt atılır.
+    `on_evict(key, value)` verilirse atılan, süresi dolan ve üzerine yazılan
+    kayıtlar için kilit dışında çağrılır (ör. kaynak kapatmak için).
+    """
+
+    def __init__(self, maxsize, ttl, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self._stats['misses'] += 1
+                return default
+            expires_at, value = entry
+            if expires_at > now:
+                self._data.move_to_end(key)
+                self._stats['hits'] += 1
+                return value
+            del self._data[key]
+            self._stats['expired'] += 1
+            self._stats['misses'] += 1
+        self._evicted([(key, value)])
+        return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        evicted = []
+        with self._lock:
+            previous = self._data.pop(key, _MISSING)
+            if previous is not _MISSING and previous[1] is not value:
+                evicted.append((key, previous[1]))
+            self._data[key] = (time.monotonic() + ttl, value)
+            while len(self._data) > self.maxsize:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+                self._stats['evictions'] += 1
+        self._evicted(evicted)
+
+    def _evicted(self, entries):
+        if not self.on_evict:
+            return
+        for key, value in entries:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                print(f"[cache] on_evict failed for {key!r}: {e}")
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                size=len(self._data),
+                maxsize=self.maxsize,
+                hit_rate=round(self._stats['hits'] / lookups, 4) if lookups else None,
+            )
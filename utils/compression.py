@@ -0,0 +1,89 @@
+import gzip
+import os
+import threading
+
+from flask import request
+
+from utils import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli yoksa sadece gzip sunulur
+    brotli = None
+
+# Bu boyutun altındaki yanıtlar sıkıştırılmaz (başlık ve CPU maliyeti kazançtan büyük)
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+_lock = threading.Lock()
+_stats = {'compressed_total': 0, 'skipped_small_total': 0, 'bytes_in_total': 0, 'bytes_out_total': 0,
+          'gzip_total': 0, 'br_total': 0}
+
+
+def choose_encoding(accept_encodings):
+    """İstemcinin kabul ettiği en iyi kodlamayı seçer (br > gzip), yoksa None."""
+    br = accept_encodings.quality('br') if brotli is not None else 0
+    gz = accept_encodings.quality('gzip')
+    if br > 0 and br >= gz:
+        return 'br'
+    if gz > 0:
+        return 'gzip'
+    return None
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+def compress_response(response):
+    """after_request: büyük metin/JSON yanıtlarını Accept-Encoding'e göre sıkıştırır.
+
+    Dosya/stream yanıtları, zaten kodlanmış ve gövdesiz yanıtlar olduğu gibi
+    bırakılır. İdempotent yanıt önbelleği sıkıştırmadan önceki gövdeyi tutar.
+    """
+    if not COMPRESS_ENABLED or request.method == 'HEAD':
+        return response
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        with _lock:
+            _stats['skipped_small_total'] += 1
+        return response
+
+    compressed = compress_body(body, encoding)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    with _lock:
+        _stats['compressed_total'] += 1
+        _stats[f'{encoding}_total'] += 1
+        _stats['bytes_in_total'] += len(body)
+        _stats['bytes_out_total'] += len(compressed)
+    return response
+
+
+def stats():
+    with _lock:
+        return dict(
+            _stats,
+            min_bytes=COMPRESS_MIN_BYTES,
+            brotli=brotli is not None,
+            ratio=round(_stats['bytes_out_total'] / _stats['bytes_in_total'], 3) if _stats['bytes_in_total'] else None,
+        )
+
+
+metrics.register('compression', stats)
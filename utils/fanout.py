@@ -0,0 +1,57 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Bağımsız upstream çağrılarını paralel çalıştıran thread havuzunun boyutu (süreç başına)
+FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', 16))
+# 0 ile çağrılar sırayla çalışır (sorun giderme / karşılaştırma için)
+FANOUT_ENABLED = os.environ.get('FANOUT_ENABLED', '1') == '1'
+
+_executor = {'pool': None, 'pid': None}
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    if _executor['pool'] is None or _executor['pid'] != os.getpid():
+        with _executor_lock:
+            if _executor['pool'] is None or _executor['pid'] != os.getpid():
+                _executor['pool'] = ThreadPoolExecutor(FANOUT_MAX_WORKERS, thread_name_prefix='fanout')
+                _executor['pid'] = os.getpid()
+    return _executor['pool']
+
+
+def gather(*calls, limit=None):
+    """Birbirinden bağımsız senkron çağrıları thread'lerde paralel çalıştırır.
+
+    Bu bir async I/O değil, thread fan-out'tur: ilk çağrı istek thread'inde,
+    diğerleri süreç başına paylaşılan thread havuzunda çalışır; paylaşılan
+    HTTP bağlantı havuzu sayesinde istekler aynı anda uçuşta olur. Sonuçlar
+    çağrı sırasıyla döner, ilk hata yukarı fırlatılır. `limit` verilirse
+    aynı anda en fazla o kadar çağrı çalışır (kalanlar sırayla bekler).
+    """
+    if limit and len(calls) > limit:
+        return _gather_limited(calls, limit)
+    if not FANOUT_ENABLED or len(calls) < 2:
+        return [call() for call in calls]
+    futures = [_pool().submit(call) for call in calls[1:]]
+    first = calls[0]()
+    return [first] + [future.result() for future in futures]
+
+
+def _gather_limited(calls, limit):
+    # `limit` adet şerit çağrıları sırayla paylaşır; havuzda en fazla limit-1 thread tutulur
+    results = [None] * len(calls)
+    pending = iter(enumerate(calls))
+    lock = threading.Lock()
+
+    def lane():
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            index, call = item
+            results[index] = call()
+
+    gather(*([lane] * limit))
+    return results
@@ -0,0 +1,278 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import Response, make_response, request
+
+from extensions import service_supabase
+from utils import metrics
+from utils.cache import TTLCache
+
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', 20000))
+# Aynı anahtarla eşzamanlı gelen tekrar isteğin ilk isteği bekleme süresi
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+# Bu süreden uzun 'in_progress' kalan anahtarın sahibi ölmüş sayılır ve devralınabilir
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+IDEMPOTENCY_POLL_SECONDS = 0.2
+
+# Tamamlanan yanıtların süreç içi kopyası; tekrarlarda veritabanı turunu atlar
+_results = TTLCache(IDEMPOTENCY_MAX_ENTRIES, min(IDEMPOTENCY_TTL_SECONDS, 900))
+# idempotency_keys RLS'li ve politikasızdır, sadece service_role erişir. Service key
+# yoksa veya sql/idempotency_keys.sql yüklü değilse sadece süreç içi koruma yapılır
+_db = service_supabase
+_store = {'available': _db is not None, 'last_prune': 0}
+_inflight = {}
+_inflight_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'claims_total': 0, 'replays_total': 0, 'conflicts_total': 0, 'takeovers_total': 0,
+          'store_errors_total': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats, persistent=_store['available'], local=_results.stats())
+
+
+metrics.register('idempotency', stats)
+
+
+class _PayloadMismatch(Exception):
+    pass
+
+
+class _StoreError(Exception):
+    """idempotency_keys tablosuna erişilemedi (handler'ın kendi hatalarından ayrı tutulur)."""
+
+
+def _execute(query):
+    try:
+        return query.execute().data
+    except Exception as e:
+        raise _StoreError(e) from e
+
+
+def get_request_key(current_request):
+    """İstemcinin gönderdiği idempotency anahtarını döndürür (yoksa None)."""
+    key = current_request.headers.get('Idempotency-Key') or current_request.headers.get('X-Request-Id')
+    if not key:
+        body = current_request.get_json(silent=True)
+        if isinstance(body, dict):
+            key = body.get('request_id') or body.get('requestId')
+    key = str(key).strip() if key else None
+    return key[:200] if key else None
+
+
+def request_hash(current_request):
+    """Anahtarın bağlandığı istek özeti: yol + ham gövde."""
+    digest = hashlib.sha256(current_request.path.encode())
+    digest.update(b'\n')
+    digest.update(current_request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def run_idempotent(user_id, scope, handler):
+    """`handler()`'ı kullanıcı + scope + istek anahtarı başına bir kez çalıştırır.
+
+    Anahtar yoksa handler doğrudan çalışır. Anahtar `idempotency_keys`
+    tablosunda (user_id, scope, key) birincil anahtarıyla sahiplenilir, bu
+    yüzden tekrar deneme başka bir worker'a düşse de işlem bir kez uygulanır
+    ve saklanan yanıt döndürülür. Anahtar isteğin gövdesine bağlıdır; aynı
+    anahtar farklı gövdeyle gelirse 422 döner. 5xx yanıtlar saklanmaz,
+    anahtar serbest bırakılır ki istemci gerçekten yeniden deneyebilsin.
+    Tabloya handler çalışmadan önce erişilemezse istek süreç içi korumayla
+    işlenir; handler'ın kendi hataları olduğu gibi yukarı fırlatılır.
+    """
+    key = get_request_key(request)
+    if not key:
+        return handler()
+    payload_hash = request_hash(request)
+    cache_key = (str(user_id), scope, key)
+
+    cached = _results.get(cache_key)
+    if cached is not None:
+        return _replay_or_reject(cached, payload_hash)
+
+    if _store['available']:
+        try:
+            return _run_persistent(cache_key, payload_hash, handler)
+        except _PayloadMismatch:
+            return _mismatch()
+        except _StoreError as e:
+            _count('store_errors_total')
+            if _is_missing_table_error(e) or _is_permission_error(e):
+                print(f"[idempotency] idempotency_keys unavailable ({e}), falling back to in-process keys")
+                _store['available'] = False
+            else:
+                print(f"[idempotency] idempotency_keys request failed ({e}), using in-process keys for this request")
+    return _run_local(cache_key, payload_hash, handler)
+
+
+# --- Postgres ---
+
+def _run_persistent(cache_key, payload_hash, handler):
+    user_id, scope, key = cache_key
+    _prune()
+
+    while True:
+        row = {'user_id': user_id, 'scope': scope, 'key': key, 'request_hash': payload_hash}
+        claimed = _execute(_db.table('idempotency_keys')
+                           .upsert(row, on_conflict='user_id,scope,key', ignore_duplicates=True))
+        if claimed:
+            break
+        outcome = _wait_for_owner(cache_key, payload_hash)
+        if outcome is None:
+            continue   # sahibi 5xx ile bıraktı: yeniden sahiplenmeyi dene
+        if outcome is True:
+            break      # sahibi ölmüş, anahtar devralındı
+        return outcome
+
+    _count('claims_total')
+    try:
+        response = make_response(handler())
+    except Exception:
+        _release(cache_key)
+        raise
+    if response.status_code >= 500:
+        _release(cache_key)
+        return response
+    data = response.get_data()
+    try:
+        _db.table('idempotency_keys').update({
+            'status': 'done',
+            'response_status': response.status_code,
+            'response_body': data.decode('utf-8', errors='replace'),
+            'response_mimetype': response.mimetype,
+        }).eq('user_id', user_id).eq('scope', scope).eq('key', key).execute()
+    except Exception as e:
+        # İşlem uygulandı; yanıt kaybolmasın, tekrarlar en azından bu worker'da karşılanır
+        _count('store_errors_total')
+        print(f"[idempotency] could not store response for key {key}: {e}")
+    _results.set(cache_key, (data, response.status_code, response.mimetype, payload_hash))
+    return response
+
+
+def _wait_for_owner(cache_key, payload_hash):
+    """Anahtarın sahibi bitirene kadar bekler.
+
+    Saklanan yanıtı (veya 409/422'yi), anahtar devralındıysa True, satır
+    silindiyse None döndürür.
+    """
+    deadline = time.time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        row = _load(cache_key)
+        if row is None:
+            return None
+        if row['request_hash'] != payload_hash:
+            raise _PayloadMismatch()
+        if row['status'] == 'done':
+            result = (row['response_body'].encode(), row['response_status'], row['response_mimetype'], payload_hash)
+            _results.set(cache_key, result)
+            return _replay_or_reject(result, payload_hash)
+        if _take_over_stale(cache_key, row):
+            return True
+        if time.time() >= deadline:
+            return make_response(({'error': 'A request with this idempotency key is still in progress'}, 409))
+        time.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+
+def _load(cache_key):
+    user_id, scope, key = cache_key
+    rows = _execute(_db.table('idempotency_keys')
+                    .select('request_hash, status, response_status, response_body, response_mimetype, locked_at')
+                    .eq('user_id', user_id).eq('scope', scope).eq('key', key).limit(1))
+    return rows[0] if rows else None
+
+
+def _take_over_stale(cache_key, row):
+    """Sahibi IDEMPOTENCY_LOCK_SECONDS'tan uzun süredir bitirmediyse anahtarı koşullu olarak devralır."""
+    locked_at = datetime.fromisoformat(row['locked_at'].replace('Z', '+00:00'))
+    if datetime.now(timezone.utc) - locked_at < timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS):
+        return False
+    user_id, scope, key = cache_key
+    taken = _execute(_db.table('idempotency_keys').update({'locked_at': datetime.now(timezone.utc).isoformat()})
+                     .eq('user_id', user_id).eq('scope', scope).eq('key', key)
+                     .eq('status', 'in_progress').eq('locked_at', row['locked_at']))
+    if taken:
+        _count('takeovers_total')
+    return bool(taken)
+
+
+def _release(cache_key):
+    user_id, scope, key = cache_key
+    try:
+        _db.table('idempotency_keys').delete() \
+            .eq('user_id', user_id).eq('scope', scope).eq('key', key).eq('status', 'in_progress').execute()
+    except Exception as e:
+        print(f"[idempotency] could not release key {key}: {e}")
+
+
+def _prune():
+    # Süresi dolan anahtarlar saatte bir silinir
+    now = time.time()
+    if now - _store['last_prune'] < 3600:
+        return
+    _store['last_prune'] = now
+    try:
+        _db.rpc('prune_idempotency_keys', {'p_keep_seconds': int(IDEMPOTENCY_TTL_SECONDS)}).execute()
+    except Exception as e:
+        print(f"[idempotency] prune failed: {e}")
+
+
+def _is_missing_table_error(e):
+    message = str(e)
+    return '42P01' in message or 'PGRST205' in message or 'Could not find the table' in message
+
+
+def _is_permission_error(e):
+    return '42501' in str(e)
+
+
+# --- süreç içi (migration yüklü değilse) ---
+
+def _run_local(cache_key, payload_hash, handler):
+    with _inflight_lock:
+        event = _inflight.get(cache_key)
+        owner = event is None
+        if owner:
+            event = _inflight[cache_key] = threading.Event()
+
+    if not owner:
+        # Aynı istek hâlâ işleniyor: bitmesini bekle ve sonucunu döndür
+        event.wait(IDEMPOTENCY_WAIT_SECONDS)
+        cached = _results.get(cache_key)
+        if cached is not None:
+            return _replay_or_reject(cached, payload_hash)
+        return make_response(({'error': 'A request with this idempotency key is still in progress'}, 409))
+
+    try:
+        response = make_response(handler())
+        if response.status_code < 500:
+            _results.set(cache_key, (response.get_data(), response.status_code, response.mimetype, payload_hash))
+        return response
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+        event.set()
+
+
+def _replay_or_reject(cached, payload_hash):
+    data, status, mimetype, stored_hash = cached
+    if stored_hash != payload_hash:
+        return _mismatch()
+    _count('replays_total')
+    response = Response(data, status=status, mimetype=mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _mismatch():
+    _count('conflicts_total')
+    return make_response(({'error': 'Idempotency key was already used with a different request body'}, 422))
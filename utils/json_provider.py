@@ -0,0 +1,47 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson yoksa Flask'ın varsayılan json kodlayıcısı kullanılır
+    orjson = None
+
+# Flask'ın varsayılanıyla aynı çıktı için tarihler `default` üzerinden
+# (HTTP date formatında) çevrilir
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """`jsonify` ve `request.get_json` için orjson kullanan JSON sağlayıcısı.
+
+    Çıktı anlamca Flask'ınkiyle aynıdır (sıralı anahtarlar, aynı `default`
+    dönüşümleri); fark ASCII dışı karakterlerin kaçışsız UTF-8 yazılmasıdır.
+    orjson'ın desteklemediği değerlerde (64 bitten büyük tam sayılar vb.)
+    varsayılan kodlayıcıya düşülür.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Girintili çıktı (debug) varsayılan kodlayıcıyla üretilir
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(obj)
+        try:
+            body = orjson.dumps(obj, default=self.default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return super().response(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+    def _options(self):
+        return ORJSON_OPTIONS | (orjson.OPT_SORT_KEYS if self.sort_keys else 0)
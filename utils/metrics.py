@@ -0,0 +1,24 @@
+import threading
+
+# İsim -> sıfır argümanlı fonksiyon; her fonksiyon JSON'a çevrilebilir bir dict döndürür
+_providers = {}
+_lock = threading.Lock()
+
+
+def register(name, provider):
+    """Bir metrik kaynağını /api/metrics çıktısına ekler."""
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot():
+    """Kayıtlı tüm metrik kaynaklarının anlık değerlerini toplar."""
+    with _lock:
+        providers = dict(_providers)
+    result = {}
+    for name, provider in providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {'error': str(e)}
+    return result
@@ -0,0 +1,89 @@
+import base64
+import json
+import re
+
+MAX_PAGE_SIZE = 100
+
+_SAFE_ID = re.compile(r'^[0-9A-Za-z-]+$')
+
+
+def encode_cursor(score, row_id):
+    """(score, id) çiftini URL'de taşınabilir opak bir cursor'a çevirir."""
+    raw = json.dumps([score, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Cursor'ı (score, id) olarak çözer; geçersizse None döner."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        score = int(score)
+        row_id = str(row_id)
+    except Exception:
+        return None
+    # id PostgREST filtresine gömüldüğü için sadece güvenli karakterlere izin ver
+    if not _SAFE_ID.match(row_id):
+        return None
+    return score, row_id
+
+
+def page_params(args, default_size=50):
+    """İstekten (paged, page_size, cursor) çıkarır.
+
+    `page_size` veya `cursor` parametresi varsa istek sayfalı moddadır.
+    """
+    paged = 'page_size' in args or 'cursor' in args
+    page_size = args.get('page_size', default_size, type=int) or default_size
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    return paged, page_size, decode_cursor(args.get('cursor'))
+
+
+def keyset_rpc_params(cursor, page_size):
+    """Keyset'i SQL içinde uygulayan *_page RPC'lerinin parametreleri (sql/leaderboard_keyset.sql).
+
+    Bir sonraki sayfa olup olmadığını anlamak için page_size + 1 satır ister.
+    """
+    score, last_id = cursor or (None, None)
+    return {'p_after_score': score, 'p_after_id': last_id, 'p_limit': page_size + 1}
+
+
+def apply_keyset(query, score_col, cursor, page_size, id_col='id'):
+    """Tablo sorgusuna (score desc, id asc) sıralı keyset filtresi uygular.
+
+    Set döndüren RPC'lerde filtre tüm sonuç üretildikten sonra uygulanır;
+    onlar için SQL'de sayfalayan *_page RPC'leri ve keyset_rpc_params
+    kullanılır. PostgREST ifadeyle sıralayamadığı için skoru NULL olan
+    satırlar burada sayfalara alınmaz. Bir sonraki sayfa olup olmadığını
+    anlamak için page_size + 1 satır ister.
+    """
+    query = query.not_.is_(score_col, 'null')
+    if cursor:
+        score, last_id = cursor
+        query = query.or_(f'{score_col}.lt.{score},and({score_col}.eq.{score},{id_col}.gt.{last_id})')
+    return query.order(score_col, desc=True).order(id_col).limit(page_size + 1)
+
+
+def keyset_slice(rows, score_col, cursor, page_size, id_col='id'):
+    """Bellekteki satırlara apply_keyset ile aynı sıralama ve filtreyi uygular."""
+    def sort_key(r):
+        return (-int(r.get(score_col) or 0), str(r.get(id_col)))
+
+    rows = sorted(rows, key=sort_key)
+    if cursor:
+        boundary = (-cursor[0], cursor[1])
+        rows = [r for r in rows if sort_key(r) > boundary]
+    return rows[:page_size + 1]
+
+
+def build_page(rows, score_col, page_size, id_col='id'):
+    """page_size + 1 satırdan {items, next_cursor} yanıtını oluşturur."""
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+    next_cursor = None
+    if has_more and items:
+        last = items[-1]
+        next_cursor = encode_cursor(int(last.get(score_col) or 0), last.get(id_col))
+    return {'items': items, 'next_cursor': next_cursor}
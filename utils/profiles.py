@@ -0,0 +1,137 @@
+import os
+
+from flask import g, has_app_context
+
+from extensions import supabase
+from utils import metrics
+from utils.cache import TTLCache
+from utils.usernames import username_index
+
+PROFILE_FIELDS = 'id, username, avatar_url'
+PROFILE_CACHE_TTL_SECONDS = float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', 60))
+PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', 20000))
+
+# get_full_profile_by_id sonuçları; skor, madalya ve avatar değişikliklerinde düşürülür.
+# Diğer worker'lardaki kopyalar en fazla bu süre kadar eski kalabilir.
+FULL_PROFILE_CACHE_TTL_SECONDS = float(os.environ.get('FULL_PROFILE_CACHE_TTL_SECONDS', 120))
+FULL_PROFILE_CACHE_SIZE = int(os.environ.get('FULL_PROFILE_CACHE_SIZE', 5000))
+
+# İstekler arası kısa ömürlü profil önbelleği (id -> {id, username, avatar_url})
+_profile_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL_SECONDS)
+metrics.register('profile_cache', _profile_cache.stats)
+
+_full_profile_cache = TTLCache(FULL_PROFILE_CACHE_SIZE, FULL_PROFILE_CACHE_TTL_SECONDS)
+metrics.register('full_profile_cache', _full_profile_cache.stats)
+
+
+class ProfileLoader:
+    """Bir istek boyunca istenen profil id'lerini toplayıp tek sorguda çözer.
+
+    `load(ids)` id'leri sıraya alır, `get_many(ids)` sıradaki tüm id'leri
+    önce istekler arası önbellekten, kalanları tek bir `in_` sorgusuyla çeker.
+    Aynı istekte tekrar istenen profiller için sorgu yapılmaz.
+    """
+
+    def __init__(self, client=supabase):
+        self.client = client
+        self._queued = set()
+        self._resolved = {}
+
+    def load(self, ids):
+        for user_id in ids:
+            if user_id and user_id not in self._resolved:
+                self._queued.add(user_id)
+
+    def get_many(self, ids):
+        """{id: profile} döndürür; bulunamayan id'ler sonuçta yer almaz."""
+        ids = [i for i in ids if i]
+        self.load(ids)
+        if self._queued:
+            self._resolve(self._queued)
+            self._queued = set()
+        # Çağıranlar sonucu değiştirebildiği için kopya döndür
+        return {i: dict(self._resolved[i]) for i in ids if self._resolved.get(i)}
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(user_id)
+
+    def prime(self, rows):
+        """Başka bir sorgudan gelen profil satırlarını önbelleğe ekler."""
+        for row in rows or []:
+            if row.get('id') and 'username' in row:
+                profile = {'id': row['id'], 'username': row.get('username'), 'avatar_url': row.get('avatar_url')}
+                self._resolved[row['id']] = profile
+                _profile_cache.set(row['id'], profile)
+        username_index.observe(rows)
+
+    def forget(self, user_id):
+        self._resolved.pop(user_id, None)
+
+    def _resolve(self, ids):
+        missing = []
+        for user_id in ids:
+            cached = _profile_cache.get(user_id)
+            if cached is not None:
+                self._resolved[user_id] = cached
+            else:
+                missing.append(user_id)
+        if not missing:
+            return
+        res = self.client.table('profiles').select(PROFILE_FIELDS).in_('id', missing).execute()
+        found = {p['id']: p for p in (res.data or [])}
+        username_index.observe(res.data)
+        for user_id in missing:
+            profile = found.get(user_id)
+            self._resolved[user_id] = profile
+            if profile:
+                _profile_cache.set(user_id, profile)
+
+
+def get_profile_loader():
+    """İsteğe ait ProfileLoader'ı döndürür (istek dışında yeni bir tane)."""
+    if not has_app_context():
+        return ProfileLoader()
+    loader = g.get('profile_loader')
+    if loader is None:
+        loader = g.profile_loader = ProfileLoader()
+    return loader
+
+
+def invalidate_profile(user_id):
+    """Avatar/username değiştiğinde profili (tam profil dahil) önbelleklerden düşürür."""
+    _profile_cache.pop(user_id)
+    invalidate_full_profile(user_id)
+    if has_app_context() and g.get('profile_loader') is not None:
+        g.profile_loader.forget(user_id)
+
+
+def get_full_profile(user_id, fresh=False):
+    """get_full_profile_by_id sonucunu (profile, game_scores, achievements) döndürür.
+
+    Sonuç kullanıcı başına önbelleğe alınır; bulunamazsa None döner.
+    `fresh=True` önbelleği okumadan veritabanına gider (sonucu yine yazar):
+    önbellek silmesi sadece yazımı yapan worker'da olduğu için kullanıcının
+    kendi profili her zaman böyle okunur, kendi yazdığını hemen görür.
+    """
+    if not fresh:
+        cached = _full_profile_cache.get(user_id)
+        if cached is not None:
+            return cached
+    response = supabase.rpc('get_full_profile_by_id', {'p_user_id': user_id}).execute()
+    if not response.data or not response.data[0]:
+        return None
+    payload = response.data[0]
+    _full_profile_cache.set(user_id, payload)
+    return payload
+
+
+def get_cached_full_profile(user_id):
+    """Önbellekteki tam profili döndürür; yoksa veritabanına gitmeden None."""
+    return _full_profile_cache.get(user_id)
+
+
+def invalidate_full_profile(user_id):
+    """Skor, madalya veya avatar değiştiğinde tam profili önbellekten düşürür."""
+    _full_profile_cache.pop(str(user_id))
+    _full_profile_cache.pop(user_id)
+
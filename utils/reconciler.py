@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+import traceback
+
+TOTAL_SCORE_RECONCILE_INTERVAL = float(os.environ.get('TOTAL_SCORE_RECONCILE_INTERVAL', 300))
+
+
+class PeriodicReconciler:
+    """Son aralıkta değişen kullanıcıları periyodik olarak kontrol eden iş.
+
+    `check(user_id)` beklenen ile saklanan değer arasındaki farkı (drift)
+    döndürür; fark sıfır değilse `repair(user_id)` çağrılır.
+    """
+
+    def __init__(self, name, check, repair, interval=TOTAL_SCORE_RECONCILE_INTERVAL):
+        self.name = name
+        self.check = check
+        self.repair = repair
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._thread = None
+        self._pid = None
+        self._stats = {'runs_total': 0, 'checked_total': 0, 'drift_total': 0, 'errors_total': 0, 'last_run_at': None}
+
+    def mark(self, user_id):
+        """Kullanıcıyı bir sonraki çalıştırmada kontrol edilmek üzere işaretler."""
+        self._ensure_started()
+        with self._lock:
+            self._dirty.add(str(user_id))
+
+    def run_once(self):
+        with self._lock:
+            users, self._dirty = self._dirty, set()
+        for user_id in users:
+            try:
+                drift = self.check(user_id)
+                if drift:
+                    print(f"[{self.name}] drift of {drift} for user {user_id}, repairing")
+                    self.repair(user_id)
+                with self._lock:
+                    self._stats['checked_total'] += 1
+                    if drift:
+                        self._stats['drift_total'] += 1
+            except Exception as e:
+                print(f"[{self.name}] reconcile failed for user {user_id}: {e}")
+                with self._lock:
+                    self._stats['errors_total'] += 1
+                    self._dirty.add(user_id)
+        with self._lock:
+            self._stats['runs_total'] += 1
+            self._stats['last_run_at'] = time.time()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, dirty_users=len(self._dirty))
+
+    def _ensure_started(self):
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[{self.name}] loop error: {e}")
+                traceback.print_exc()
@@ -0,0 +1,150 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from extensions import supabase, service_supabase
+from utils import metrics
+from utils.pagination import apply_keyset, keyset_rpc_params
+
+# Tüm oyunların toplamı bu anahtar altında tutulur
+ALL_GAMES = '_all'
+# Rekor bazlı oyunlar: kovada günün en yükseği tutulur, pencere de en yükseği alır
+MAX_GAMES = {'mixed-rush'}
+
+BUCKET_RETENTION_DAYS = int(os.environ.get('LEADERBOARD_BUCKET_RETENTION_DAYS', 35))
+
+# sql/leaderboard_keyset.sql yüklü değilse sayfalar get_windowed_leaderboard üzerinden okunur
+_paged_rpc = {'available': True}
+
+
+def _is_missing_function_error(e):
+    message = str(e)
+    return 'PGRST202' in message or 'Could not find the function' in message
+
+
+def bucket_day():
+    """Bir artışın yazılacağı gün kovası (UTC, YYYY-MM-DD)."""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+class ScoreBuckets:
+    """Postgres'teki günlük skor kovaları (sql/leaderboard_score_buckets.sql).
+
+    Toplama oyunlarının kovaları upsert_level_progress_* RPC'leri içinde,
+    seviye skoruyla aynı işlemde artırılır; burada sadece o yolu kullanmayan
+    yazımlar (rekor bazlı modlar, eski RPC'ye düşülen durumlar) ve okumalar
+    vardır. Günlük ve haftalık (pazartesi başlangıçlı) tablolar ile son N
+    gün, `get_windowed_leaderboard` ile gün kovalarının toplamıdır; böylece
+    tüm worker'lar aynı tabloyu görür ve yeniden başlatmalarda veri kaybolmaz.
+
+    Okuma RPC'si anon'a açıktır ve `client` ile yapılır; yazma ve silme
+    RPC'leri sadece service_role'e açık olduğundan `writer` ile yapılır.
+    `writer` yoksa (service key tanımlı değil) kova yazımları atlanır.
+    """
+
+    def __init__(self, client, writer=None, retention_days=BUCKET_RETENTION_DAYS):
+        self.client = client
+        self.writer = writer
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._last_prune = None
+        self._stats = {'writes_total': 0, 'write_errors_total': 0, 'writes_skipped_total': 0, 'prunes_total': 0}
+
+    def add(self, rows, mode='sum'):
+        """[{'user_id', 'game', 'points', 'bucket_start'?}] satırlarını kovalara yazar.
+
+        mode='sum' satırlar '_all' toplamına da eklenir; mode='max' (rekor
+        bazlı modlar) sadece oyunun kovasını günceller.
+        """
+        payload = []
+        for row in rows:
+            try:
+                points = int(row['points'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            day = row.get('bucket_start') or bucket_day()
+            games = [row.get('game')] if mode == 'max' else [ALL_GAMES, row.get('game')]
+            for game in dict.fromkeys(g for g in games if g):
+                payload.append({'user_id': str(row['user_id']), 'game': game, 'bucket_start': day, 'points': points})
+        if not payload:
+            return
+        if self.writer is None:
+            with self._lock:
+                self._stats['writes_skipped_total'] += 1
+            return
+        try:
+            self.writer.rpc('add_score_buckets', {'p_rows': payload, 'p_mode': mode}).execute()
+        except Exception:
+            with self._lock:
+                self._stats['write_errors_total'] += 1
+            raise
+        with self._lock:
+            self._stats['writes_total'] += 1
+        self.prune()
+
+    def add_max(self, user_id, game, points):
+        self.add([{'user_id': user_id, 'game': game, 'points': points}], mode='max')
+
+    def window(self, period='week', days=None, day=None):
+        """(from, to) tarih aralığı: `days` verilirse son N gün, yoksa bugün/bu hafta."""
+        day = day or datetime.now(timezone.utc).date()
+        if days:
+            days = max(1, min(int(days), self.retention_days))
+            return day - timedelta(days=days - 1), day
+        return (_week_start(day) if period == 'week' else day), day
+
+    def page(self, cursor, page_size, game=None, period='week', days=None):
+        """Pencerenin (score desc, user_id asc) sıralı bir sayfası; page_size + 1 satıra kadar döner.
+
+        Keyset ve limit `get_windowed_leaderboard_page` içinde uygulanır.
+        """
+        params = self._window_params(game, period, days)
+        if _paged_rpc['available']:
+            try:
+                return self.client.rpc('get_windowed_leaderboard_page',
+                                       dict(params, **keyset_rpc_params(cursor, page_size))).execute().data or []
+            except Exception as e:
+                if not _is_missing_function_error(e):
+                    raise
+                print("[score_buckets] get_windowed_leaderboard_page not found, paging get_windowed_leaderboard")
+                _paged_rpc['available'] = False
+        query = self.client.rpc('get_windowed_leaderboard', params)
+        return apply_keyset(query, 'score', cursor, page_size, id_col='user_id').execute().data or []
+
+    def _window_params(self, game, period, days):
+        game = game or ALL_GAMES
+        start, end = self.window(period=period, days=days)
+        return {
+            'p_game': game,
+            'p_from': start.isoformat(),
+            'p_to': end.isoformat(),
+            'p_agg': 'max' if game in MAX_GAMES else 'sum',
+        }
+
+    def prune(self):
+        """Saklama süresini geçen kovaları günde bir kez siler."""
+        if self.writer is None:
+            return
+        today = bucket_day()
+        with self._lock:
+            if self._last_prune == today:
+                return
+            self._last_prune = today
+        try:
+            self.writer.rpc('prune_score_buckets', {'p_keep_days': self.retention_days}).execute()
+            with self._lock:
+                self._stats['prunes_total'] += 1
+        except Exception as e:
+            print(f"[score_buckets] prune failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, retention_days=self.retention_days, writable=self.writer is not None)
+
+
+score_buckets = ScoreBuckets(supabase, service_supabase)
+metrics.register('score_buckets', score_buckets.stats)
@@ -0,0 +1,403 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # fcntl yoksa spool sahipliği PID kontrolüyle belirlenir
+    fcntl = None
+
+SCORE_FLUSH_INTERVAL = float(os.environ.get('SCORE_FLUSH_INTERVAL', 1.0))
+SCORE_FLUSH_BATCH_SIZE = int(os.environ.get('SCORE_FLUSH_BATCH_SIZE', 500))
+SCORE_SPOOL_DIR = os.environ.get('SCORE_SPOOL_DIR') or os.path.join(tempfile.gettempdir(), 'lp-score-spool')
+SCORE_SPOOL_FSYNC = os.environ.get('SCORE_SPOOL_FSYNC', '0') == '1'
+# Ölü worker spool'larının aranma aralığı
+SCORE_SPOOL_RECOVER_INTERVAL = float(os.environ.get('SCORE_SPOOL_RECOVER_INTERVAL', 30))
+# after_user_flush başarısız olursa sonraki flush'larda en fazla bu kadar tekrar denenir
+SCORE_AFTER_FLUSH_RETRIES = int(os.environ.get('SCORE_AFTER_FLUSH_RETRIES', 5))
+# Bir satır bu kadar flush'ta yazılamazsa kuyruktan çıkarılıp dead-letter dosyasına yazılır
+SCORE_MAX_ATTEMPTS = int(os.environ.get('SCORE_MAX_ATTEMPTS', 10))
+SCORE_DEAD_LETTER_FILE = 'score-dead-letter.jsonl'
+
+_KEY_FIELDS = ('user_id', 'category_id', 'language_code', 'level', 'game', 'bucket_start')
+
+
+class BatchApplyError(Exception):
+    """apply_batch satırların bir kısmını yazamadı.
+
+    `failed` yazılamayan satırlardır; listede olmayan satırlar yazılmıştır
+    ve tekrar uygulanmamalıdır.
+    """
+
+    def __init__(self, failed, error):
+        super().__init__(str(error))
+        self.failed = failed
+        self.error = error
+
+
+def _try_lock(f):
+    """Dosyaya bloklamadan özel kilit almayı dener; kilit başka süreçteyse False."""
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScoreWriteBehind:
+    """submit_score artışlarını biriktirip toplu olarak veritabanına yazan kuyruk.
+
+    Aynı (user, category, language, level, game, gün) anahtarına gelen
+    artışlar flush aralığı boyunca tek satırda birleştirilir; oyun ve gün,
+    liderlik tablosu kovaları için satırla birlikte RPC'ye iletilir. Her flush'ta önce
+    `apply_batch(rows)` ile satırlar yazılır, ardından etkilenen her kullanıcı
+    için bir kez `after_user_flush(user_id, points)` çağrılır.
+
+    `apply_batch` bir kısmını yazabildiyse BatchApplyError ile sadece
+    yazılamayan satırları bildirir; başka bir hata tüm parçanın yazılmadığı
+    anlamına gelir. Sadece yazılamayan satırlar kuyruğa geri konur; bir
+    satır SCORE_MAX_ATTEMPTS flush'ta yazılamazsa spool dizinindeki
+    dead-letter dosyasına taşınır ve diğer satırları bekletmez.
+
+    Onaylanan ama henüz yazılmayan artışlar süreç başına bir JSONL spool
+    dosyasında tutulur ve süreç yaşadıkça dosya üzerinde flock tutulur.
+    Kilidi alınabilen (sahibi ölmüş) spool'lar, başlangıçta ve sonra
+    SCORE_SPOOL_RECOVER_INTERVAL'da bir, önce atomik `os.rename` ile
+    sahiplenilip sonra kuyruğa geri yüklenir; aynı anda başlayan iki worker
+    aynı dosyayı iki kez uygulamaz, yeniden kullanılan PID'ler de ölü bir
+    spool'u canlı göstermez. (En az bir kez teslim: flush ortasında çökme
+    bir artışı tekrar uygulayabilir.) Başarısız after_user_flush çağrıları
+    sonraki flush'larda SCORE_AFTER_FLUSH_RETRIES kez tekrar denenir.
+    """
+
+    def __init__(self, apply_batch, after_user_flush=None, interval=SCORE_FLUSH_INTERVAL,
+                 batch_size=SCORE_FLUSH_BATCH_SIZE, spool_dir=SCORE_SPOOL_DIR):
+        self.apply_batch = apply_batch
+        self.after_user_flush = after_user_flush
+        self.interval = interval
+        self.batch_size = batch_size
+        self.spool_dir = spool_dir
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}   # key -> [points, first_enqueued_at, failed_attempts]
+        self._after_retry = {}   # user_id -> [points, attempts]
+        self._thread = None
+        self._pid = None
+        self._token = None
+        self._spool = None
+        self._last_recover = 0
+
+        self._stats = {
+            'enqueued_total': 0,
+            'flushed_rows_total': 0,
+            'failed_rows_total': 0,
+            'dead_lettered_rows_total': 0,
+            'after_flush_failures_total': 0,
+            'after_flush_dropped_total': 0,
+            'spools_recovered_total': 0,
+            'flushes_total': 0,
+            'last_flush_at': None,
+            'last_flush_duration_ms': None,
+            'last_flush_max_lag_ms': None,
+        }
+
+    # --- public API ---
+
+    def start(self):
+        """Flush thread'ini başlatır ve ölü worker spool'larını hemen geri yükler."""
+        self._ensure_started()
+
+    def enqueue(self, user_id, category_id, language_code, level, points, game=None, day=None):
+        """Bir artışı kuyruğa ekler ve spool'a yazar; veritabanına dokunmaz.
+
+        `day` artışın sayılacağı gün kovasıdır (flush gün dönümünden sonra olsa da).
+        """
+        self._ensure_started()
+        key = (str(user_id), int(category_id), language_code, int(level), game or None, day)
+        now = time.time()
+        with self._lock:
+            self._append_spool(key, int(points))
+            entry = self._pending.get(key)
+            if entry:
+                entry[0] += int(points)
+            else:
+                self._pending[key] = [int(points), now, 0]
+            self._stats['enqueued_total'] += 1
+
+    def flush(self):
+        """Bekleyen tüm artışları yazar. Arka plan thread'i tarafından çağrılır."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = {}
+            if not batch:
+                self._run_after_flush({})
+                return
+
+            started = time.time()
+            failed = {}
+            keys = list(batch.keys())
+            for i in range(0, len(keys), self.batch_size):
+                chunk = keys[i:i + self.batch_size]
+                rows = [dict(zip(_KEY_FIELDS, k), score_increment=batch[k][0]) for k in chunk]
+                try:
+                    self.apply_batch(rows)
+                except BatchApplyError as e:
+                    print(f"[score_queue] apply_batch failed for {len(e.failed)} of {len(rows)} rows: {e}")
+                    for row in e.failed:
+                        k = tuple(row[f] for f in _KEY_FIELDS)
+                        failed[k] = batch[k]
+                except Exception as e:
+                    print(f"[score_queue] apply_batch failed for {len(rows)} rows: {e}")
+                    traceback.print_exc()
+                    for k in chunk:
+                        failed[k] = batch[k]
+
+            users = {}
+            for k in keys:
+                if k not in failed:
+                    users[k[0]] = users.get(k[0], 0) + batch[k][0]
+            self._run_after_flush(users)
+
+            finished = time.time()
+            with self._lock:
+                # Başarısız satırları bir sonraki flush için geri koy; deneme
+                # sınırını aşanlar dead-letter dosyasına taşınır
+                dead = []
+                for k, (points, first_at, attempts) in failed.items():
+                    attempts += 1
+                    entry = self._pending.get(k)
+                    if attempts >= SCORE_MAX_ATTEMPTS:
+                        # Bu arada aynı anahtara gelen artışlar da aynı satıra yazılacaktı
+                        if entry:
+                            points += self._pending.pop(k)[0]
+                        dead.append((k, points, attempts))
+                    elif entry:
+                        entry[0] += points
+                        entry[1] = min(entry[1], first_at)
+                        entry[2] = max(entry[2], attempts)
+                    else:
+                        self._pending[k] = [points, first_at, attempts]
+                if dead:
+                    try:
+                        self._dead_letter(dead)
+                    except OSError as e:
+                        # Dosyaya yazılamadıysa satırlar kaybolmasın, kuyrukta kalsın
+                        print(f"[score_queue] could not write dead-letter rows: {e}")
+                        for k, points, attempts in dead:
+                            self._pending[k] = [points, time.time(), attempts]
+                        dead = []
+                self._rewrite_spool()
+
+                flushed = len(keys) - len(failed)
+                oldest = min(v[1] for v in batch.values())
+                self._stats['flushes_total'] += 1
+                self._stats['flushed_rows_total'] += flushed
+                self._stats['failed_rows_total'] += len(failed)
+                self._stats['dead_lettered_rows_total'] += len(dead)
+                self._stats['last_flush_at'] = finished
+                self._stats['last_flush_duration_ms'] = round((finished - started) * 1000, 1)
+                self._stats['last_flush_max_lag_ms'] = round((finished - oldest) * 1000, 1)
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            oldest = min((v[1] for v in self._pending.values()), default=None)
+            return dict(
+                self._stats,
+                pending_rows=len(self._pending),
+                after_flush_retry_users=len(self._after_retry),
+                oldest_pending_age_ms=round((now - oldest) * 1000, 1) if oldest else 0,
+            )
+
+    # --- internals ---
+
+    def _run_after_flush(self, users):
+        """Yazılan kullanıcılar ve önceki flush'lardan kalan başarısızlar için after_user_flush."""
+        if not self.after_user_flush:
+            return
+        with self._lock:
+            retry = self._after_retry
+            self._after_retry = {}
+        work = {user_id: [points, 0] for user_id, points in users.items()}
+        for user_id, (points, attempts) in retry.items():
+            entry = work.setdefault(user_id, [0, attempts])
+            entry[0] += points
+            entry[1] = max(entry[1], attempts)
+
+        failed = {}
+        for user_id, (points, attempts) in work.items():
+            try:
+                self.after_user_flush(user_id, points)
+            except Exception as e:
+                print(f"[score_queue] after_user_flush failed for user {user_id} (attempt {attempts + 1}): {e}")
+                failed[user_id] = [points, attempts + 1]
+        with self._lock:
+            self._stats['after_flush_failures_total'] += len(failed)
+            for user_id, entry in failed.items():
+                if entry[1] > SCORE_AFTER_FLUSH_RETRIES:
+                    self._stats['after_flush_dropped_total'] += 1
+                    continue
+                current = self._after_retry.setdefault(user_id, [0, 0])
+                current[0] += entry[0]
+                current[1] = max(current[1], entry[1])
+
+    def _ensure_started(self):
+        # gunicorn fork sonrası her worker kendi thread'ini ve spool'unu açar
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Fork öncesi açılan spool ebeveyne aittir; devralınan tanımlayıcı
+            # kapatılır (flock ebeveynde kalır), kuyruk ebeveynin spool'unda durur
+            if self._spool:
+                self._spool.close()
+            self._spool = None
+            self._pending = {}
+            self._after_retry = {}
+            self._token = uuid.uuid4().hex[:12]
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._rewrite_spool(create=True)
+            self._recover_spools()
+            self._thread = threading.Thread(target=self._run, name='score-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self._shutdown)
+
+    def _shutdown(self):
+        self.flush()
+        with self._lock:
+            # Temiz çıkışta boş spool bırakılmaz; yazılamayanlar bir sonraki worker'a kalır
+            if self._spool and not self._pending and self._pid == os.getpid():
+                os.remove(self._spool_path())
+                self._spool.close()
+                self._spool = None
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if time.time() - self._last_recover >= SCORE_SPOOL_RECOVER_INTERVAL:
+                    with self._lock:
+                        self._recover_spools()
+                self.flush()
+            except Exception as e:
+                print(f"[score_queue] flush loop error: {e}")
+                traceback.print_exc()
+
+    def _spool_path(self):
+        return os.path.join(self.spool_dir, f"score-spool-{self._pid}-{self._token}.jsonl")
+
+    def _recover_spools(self):
+        """Sahibi ölmüş spool'ları sahiplenip kuyruğa geri yükler (self._lock altında çağrılır)."""
+        self._last_recover = time.time()
+        own = self._spool_path()
+        paths = glob.glob(os.path.join(self.spool_dir, 'score-spool-*.jsonl')) + \
+            glob.glob(os.path.join(self.spool_dir, 'score-claim-*.jsonl'))
+        recovered = False
+        for path in paths:
+            if path == own:
+                continue
+            try:
+                f = open(path, encoding='utf-8')
+            except FileNotFoundError:
+                continue   # başka bir worker az önce sahiplendi
+            try:
+                if fcntl is not None:
+                    if not _try_lock(f):
+                        continue   # sahibi yaşıyor (veya başka bir worker geri yüklüyor)
+                elif self._owner_alive(path):
+                    continue
+                # Atomik sahiplenme: sadece rename'i başaran worker dosyayı uygular
+                claimed = os.path.join(self.spool_dir, f"score-claim-{self._pid}-{uuid.uuid4().hex[:12]}.jsonl")
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+                for line in f:
+                    try:
+                        *key, points = json.loads(line)
+                    except Exception:
+                        continue
+                    # Oyun/gün alanları olmayan eski spool satırları
+                    key = tuple(key) + (None,) * (6 - len(key))
+                    entry = self._pending.setdefault(key, [0, time.time(), 0])
+                    entry[0] += points
+                # Artışlar önce kendi spool'umuza yazılır, sonra sahiplenilen dosya silinir
+                self._rewrite_spool()
+                os.remove(claimed)
+                recovered = True
+                self._stats['spools_recovered_total'] += 1
+            except Exception as e:
+                print(f"[score_queue] could not recover spool {path}: {e}")
+            finally:
+                f.close()
+        return recovered
+
+    def _owner_alive(self, path):
+        # fcntl olmayan platformlarda: dosya adındaki PID hâlâ yaşıyor mu
+        try:
+            pid = int(os.path.basename(path).split('-')[2])
+        except (IndexError, ValueError):
+            return False
+        return pid != self._pid and _pid_alive(pid)
+
+    def _dead_letter(self, dead):
+        """Yazılamayan satırları elle incelenip yeniden oynatılmak üzere dosyaya ekler.
+
+        Spool kurtarma bu dosyaya bakmaz; satırlar bir daha otomatik denenmez.
+        """
+        path = os.path.join(self.spool_dir, SCORE_DEAD_LETTER_FILE)
+        now = time.time()
+        with open(path, 'a', encoding='utf-8') as f:
+            for key, points, attempts in dead:
+                f.write(json.dumps(dict(zip(_KEY_FIELDS, key), score_increment=points,
+                                        attempts=attempts, dead_lettered_at=now)) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"[score_queue] moved {len(dead)} rows to {path} after {SCORE_MAX_ATTEMPTS} failed attempts")
+
+    def _append_spool(self, key, points):
+        if not self._spool:
+            return
+        self._spool.write(json.dumps([*key, points]) + '\n')
+        self._spool.flush()
+        if SCORE_SPOOL_FSYNC:
+            os.fsync(self._spool.fileno())
+
+    def _rewrite_spool(self, create=False):
+        # Spool'u sadece henüz yazılmamış artışlarla değiştir (atomik rename).
+        # Yeni dosya rename'den önce kilitlenir, böylece spool hiçbir an kilitsiz görünmez.
+        if not self._spool and not create:
+            return
+        path = self._spool_path()
+        tmp_path = path + '.tmp'
+        f = open(tmp_path, 'w', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        for key, (points, *_) in self._pending.items():
+            f.write(json.dumps([*key, points]) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if self._spool:
+            self._spool.close()
+        self._spool = f
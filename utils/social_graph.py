@@ -0,0 +1,162 @@
+import os
+import threading
+
+from extensions import supabase
+from utils import metrics
+from utils.cache import TTLCache
+
+SOCIAL_GRAPH_CACHE_SIZE = int(os.environ.get('SOCIAL_GRAPH_CACHE_SIZE', 20000))
+# Diğer worker'larda yapılan değişiklikler en fazla bu süre sonra görülür
+SOCIAL_GRAPH_TTL_SECONDS = float(os.environ.get('SOCIAL_GRAPH_TTL_SECONDS', 120))
+
+FRIENDSHIP_FIELDS = 'id, user1_id, user2_id, status'
+
+# sql/friendships_pair_key.sql yüklü değilse istekler kontrol + insert ile oluşturulur
+_pair_key = {'available': True}
+
+
+def pair_key(user_a, user_b):
+    """Arkadaşlığın yönden bağımsız anahtarı: (küçük id, büyük id).
+
+    Veritabanındaki user_low/user_high (least/greatest) kolonlarıyla aynı
+    sıralamayı verir; uuid'lerin küçük harfli metin sırası bayt sırasıyla aynıdır.
+    """
+    a, b = str(user_a).lower(), str(user_b).lower()
+    return (a, b) if a <= b else (b, a)
+
+
+def _is_missing_pair_key_error(e):
+    message = str(e)
+    # 42703: user_low/user_high kolonu yok, 42P10: on_conflict'e uyan unique kısıt yok
+    return '42703' in message or '42P10' in message
+
+
+class SocialGraph:
+    """Kullanıcı başına arkadaşlık komşuluk listesi önbelleği.
+
+    Bir kullanıcının listesi ilk erişimde tek bir `or_` sorgusuyla yüklenir
+    (other_id -> friendship satırı). Arkadaşlık isteği gönderme, kabul ve
+    reddetme route'ları değişikliği önbellekteki her iki kullanıcıya da
+    uygular; böylece arkadaş/istek listeleri ve "ilişkili mi" kontrolleri
+    bellekten cevaplanır. Önbellek sadece okumalar içindir: istek
+    oluştururken varlık kontrolü her zaman veritabanında yapılır.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._adjacency = TTLCache(SOCIAL_GRAPH_CACHE_SIZE, SOCIAL_GRAPH_TTL_SECONDS)
+        self._stats = {'loads_total': 0, 'updates_total': 0}
+
+    def rows(self, user_id):
+        """Kullanıcının dahil olduğu tüm friendship satırları."""
+        return list(self._edges(user_id).values())
+
+    def friends(self, user_id):
+        return [other for other, row in self._edges(user_id).items() if row['status'] == 'accepted']
+
+    def related_ids(self, user_id):
+        """Arkadaş veya bekleyen isteği olan kullanıcıların id kümesi."""
+        return set(self._edges(user_id))
+
+    def request(self, requester_id, receiver_id):
+        """Bekleyen bir arkadaşlık isteği oluşturur; (created, row) döndürür.
+
+        created False ise iki kullanıcı arasında (hangi yönde olursa olsun)
+        zaten bir satır vardır ve row o satırdır. Pair key yüklüyse varlık
+        kontrolü ve ekleme (user_low, user_high) benzersizliğine dayanan tek
+        bir koşullu upsert'tür; aynı anda gelen iki istekten sadece biri satır
+        ekler. Çakışmada mevcut satır pair key ile tek sorguda okunur.
+        """
+        row = {'user1_id': str(requester_id), 'user2_id': str(receiver_id), 'status': 'pending'}
+        low, high = pair_key(requester_id, receiver_id)
+        # Çakışan satır okunmadan önce silinirse upsert bir kez daha denenir
+        for _ in range(2):
+            if not _pair_key['available']:
+                break
+            try:
+                res = self.client.table('friendships') \
+                    .upsert(row, on_conflict='user_low,user_high', ignore_duplicates=True).execute()
+            except Exception as e:
+                if not _is_missing_pair_key_error(e):
+                    raise
+                print("[social-graph] friendships pair key not found, falling back to check + insert")
+                _pair_key['available'] = False
+                break
+            if res.data:
+                self.apply(res.data)
+                return True, res.data[0]
+            existing = self.client.table('friendships').select(FRIENDSHIP_FIELDS) \
+                .eq('user_low', low).eq('user_high', high).limit(1).execute().data
+            if existing:
+                self.apply(existing)
+                return False, existing[0]
+        else:
+            self.invalidate(requester_id, receiver_id)
+            raise RuntimeError("friendship row changed concurrently, please retry")
+
+        # Yazma yolunda varlık kontrolü önbellekten değil veritabanından yapılır
+        existing = self._load_pair(requester_id, receiver_id)
+        if existing:
+            self.apply([existing])
+            return False, existing
+        res = self.client.table('friendships').insert(row).execute()
+        self.apply(res.data)
+        return True, (res.data or [row])[0]
+
+    def apply(self, rows, deleted=False):
+        """Eklenen/güncellenen (veya silinen) satırları önbellekteki iki tarafa da uygular."""
+        with self._lock:
+            for row in rows or []:
+                a, b = str(row.get('user1_id')), str(row.get('user2_id'))
+                for owner, other in ((a, b), (b, a)):
+                    edges = self._adjacency.get(owner)
+                    if edges is None:
+                        continue
+                    if deleted:
+                        edges.pop(other, None)
+                    else:
+                        edges[other] = {k: row.get(k) for k in ('id', 'user1_id', 'user2_id', 'status')}
+                self._stats['updates_total'] += 1
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self._adjacency.pop(str(user_id))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cache=self._adjacency.stats())
+
+    def _load_pair(self, user_a, user_b):
+        """İki kullanıcı arasındaki satırı (hangi yönde olursa olsun) veritabanından okur."""
+        a, b = str(user_a), str(user_b)
+        rows = self.client.table('friendships').select(FRIENDSHIP_FIELDS) \
+            .or_(f'and(user1_id.eq.{a},user2_id.eq.{b}),and(user1_id.eq.{b},user2_id.eq.{a})') \
+            .limit(1).execute().data
+        return rows[0] if rows else None
+
+    def _edges(self, user_id):
+        user_id = str(user_id)
+        edges = self._adjacency.get(user_id)
+        if edges is not None:
+            # apply() aynı sözlüğü güncelleyebildiği için kopya döndür
+            with self._lock:
+                return dict(edges)
+        res = self.client.table('friendships').select(FRIENDSHIP_FIELDS) \
+            .or_(f'user1_id.eq.{user_id},user2_id.eq.{user_id}').execute()
+        edges = {}
+        for row in res.data or []:
+            other = str(row['user2_id']) if str(row['user1_id']) == user_id else str(row['user1_id'])
+            edges[other] = {k: row.get(k) for k in ('id', 'user1_id', 'user2_id', 'status')}
+        with self._lock:
+            self._stats['loads_total'] += 1
+            # Yükleme sırasında başka bir thread doldurduysa onu kullan
+            current = self._adjacency.get(user_id)
+            if current is not None:
+                return dict(current)
+            self._adjacency.set(user_id, edges)
+            return dict(edges)
+
+
+social_graph = SocialGraph(supabase)
+metrics.register('social_graph', social_graph.stats)
@@ -0,0 +1,343 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import time
+from urllib.parse import parse_qs, quote, urlsplit
+
+import httpx
+
+from extensions import SUPABASE_TIMEOUT, key, pooled_transport, service_key, url
+from utils import metrics
+
+AVATAR_BUCKET = 'avatars'
+AVATAR_MAX_BYTES = int(os.environ.get('AVATAR_MAX_BYTES', 5 * 1024 * 1024))
+AVATAR_ALLOWED_TYPES = tuple(
+    t.strip() for t in os.environ.get('AVATAR_ALLOWED_TYPES', 'image/png,image/jpeg,image/webp,image/gif').split(',') if t.strip()
+)
+# Multipart başlıkları ve sınır satırları için dosya boyutuna eklenen pay
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+AVATAR_UPLOAD_CHUNK_BYTES = int(os.environ.get('AVATAR_UPLOAD_CHUNK_BYTES', 64 * 1024))
+
+# 'supabase' (varsayılan) veya 'local': testler/geliştirme için dosya sistemi
+AVATAR_STORAGE = os.environ.get('AVATAR_STORAGE', 'supabase').lower()
+AVATAR_LOCAL_DIR = os.environ.get('AVATAR_LOCAL_DIR', os.path.join(tempfile.gettempdir(), 'avatars'))
+AVATAR_LOCAL_PUBLIC_PATH = os.environ.get('AVATAR_LOCAL_PUBLIC_PATH', '/api/profile/avatar/local')
+AVATAR_LOCAL_UPLOAD_PATH = os.environ.get('AVATAR_LOCAL_UPLOAD_PATH', '/api/profile/avatar/local-upload')
+# Doğrudan yükleme biletlerinin geçerlilik süresi
+AVATAR_UPLOAD_URL_TTL_SECONDS = int(os.environ.get('AVATAR_UPLOAD_URL_TTL_SECONDS', 300))
+# Biletleri imzalayan, sadece bu iş için kullanılan anahtar; tüm worker'larda aynı olmalı.
+# Tanımlı değilse doğrudan yükleme kapalıdır, avatarlar API üzerinden yüklenir.
+AVATAR_UPLOAD_SECRET = os.environ.get('AVATAR_UPLOAD_SECRET', '').encode()
+DIRECT_UPLOADS_ENABLED = bool(AVATAR_UPLOAD_SECRET)
+if not DIRECT_UPLOADS_ENABLED:
+    print("Warning: AVATAR_UPLOAD_SECRET is not set; direct avatar uploads (upload-url/complete) are disabled")
+
+# Bucket yönetimi (imzalı URL, kopyalama, silme, HEAD, küçük görsel yüklemeleri)
+# service_role ile yapılır; anahtar yoksa anon key'e düşülür ve bu işlemler
+# bucket politikalarının izin verdiği kadar çalışır
+_storage_key = service_key or key
+
+IMAGE_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/webp': 'webp', 'image/gif': 'gif'}
+
+_SAFE_PATH_RE = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]*(/[A-Za-z0-9_-][A-Za-z0-9_.-]*)*$')
+
+_stats = {'uploads_total': 0, 'uploaded_bytes_total': 0, 'rejected_too_large': 0, 'rejected_type': 0,
+          'upload_urls_total': 0}
+metrics.register('avatar_uploads', lambda: dict(_stats))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImageType(Exception):
+    pass
+
+
+class InvalidUploadTicket(Exception):
+    pass
+
+
+def sniff_image_type(head):
+    """Dosyanın ilk baytlarından görsel tipini çıkarır (tanınmazsa None)."""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def open_image_stream(stream, max_bytes=AVATAR_MAX_BYTES, chunk_size=AVATAR_UPLOAD_CHUNK_BYTES):
+    """Akışın ilk parçasını okuyup tipini doğrular ve (content_type, chunks) döndürür.
+
+    `chunks` akışın tamamını parça parça verir; toplam boyut `max_bytes`'ı
+    geçerse UploadTooLarge fırlatır. Bellekte aynı anda tek parça tutulur.
+    """
+    first = stream.read(chunk_size)
+    content_type = sniff_image_type(first)
+    if content_type not in AVATAR_ALLOWED_TYPES:
+        _stats['rejected_type'] += 1
+        raise UnsupportedImageType(content_type or 'unknown')
+    return content_type, iter_limited(stream, max_bytes, chunk_size, first=first)
+
+
+def iter_limited(stream, max_bytes=AVATAR_MAX_BYTES, chunk_size=AVATAR_UPLOAD_CHUNK_BYTES, first=None):
+    """Akışı parça parça verir; toplam `max_bytes`'ı geçerse UploadTooLarge fırlatır."""
+    total = 0
+    chunk = stream.read(chunk_size) if first is None else first
+    while chunk:
+        total += len(chunk)
+        if total > max_bytes:
+            _stats['rejected_too_large'] += 1
+            raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+        yield chunk
+        chunk = stream.read(chunk_size)
+    _stats['uploaded_bytes_total'] += total
+
+
+def spool_stream(chunks, max_memory=AVATAR_UPLOAD_CHUNK_BYTES * 4):
+    """Parçaları geçici dosyaya yazarken SHA-256'larını hesaplar.
+
+    (spool, hex_digest, size) döndürür; spool başa sarılmıştır ve bellekte
+    en fazla `max_memory` bayt tutar, kalanı diske taşar.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        for chunk in chunks:
+            digest.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def iter_file(fileobj, chunk_size=AVATAR_UPLOAD_CHUNK_BYTES):
+    """Dosyayı baştan sona parça parça okur."""
+    fileobj.seek(0)
+    return iter(lambda: fileobj.read(chunk_size), b'')
+
+
+def is_safe_path(path):
+    """Nesne yolunun göreli, '..' içermeyen ve beklenen karakterlerden oluştuğunu kontrol eder."""
+    return bool(path) and len(path) <= 512 and _SAFE_PATH_RE.match(path) is not None and '..' not in path
+
+
+def sign_upload_ticket(user_id, path, ttl=AVATAR_UPLOAD_URL_TTL_SECONDS):
+    """(kullanıcı, yol, son kullanma) bilgisini HMAC ile imzalanmış bir bilete çevirir."""
+    payload = base64.urlsafe_b64encode(json.dumps(
+        {'u': str(user_id), 'p': path, 'e': int(time.time() + ttl)}, separators=(',', ':')
+    ).encode()).decode().rstrip('=')
+    signature = hmac.new(AVATAR_UPLOAD_SECRET, payload.encode(), hashlib.sha256).hexdigest()
+    return f"{payload}.{signature}"
+
+
+def verify_upload_ticket(ticket):
+    """Bileti doğrular ve {'user_id', 'path', 'expires_at'} döndürür; geçersizse InvalidUploadTicket."""
+    if not DIRECT_UPLOADS_ENABLED:
+        raise InvalidUploadTicket('direct uploads are disabled')
+    try:
+        payload, signature = str(ticket).rsplit('.', 1)
+        expected = hmac.new(AVATAR_UPLOAD_SECRET, payload.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(signature, expected):
+            raise InvalidUploadTicket('bad signature')
+        data = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except InvalidUploadTicket:
+        raise
+    except Exception:
+        raise InvalidUploadTicket('malformed ticket')
+    if data['e'] < time.time():
+        raise InvalidUploadTicket('ticket expired')
+    if not is_safe_path(data['p']):
+        raise InvalidUploadTicket('bad path')
+    return {'user_id': data['u'], 'path': data['p'], 'expires_at': data['e']}
+
+
+def upload_object(bucket, path, chunks, content_type, token=None, length=None, upsert=True):
+    """Parçaları Supabase Storage'a tek bir akış olarak yükler.
+
+    İstek kullanıcının JWT'siyle yapılır ki storage RLS politikaları doğru
+    kullanıcıyı görsün; `token` yoksa (küçük görseller) servis anahtarı
+    kullanılır. `length` biliniyorsa Content-Length gönderilir, bilinmiyorsa
+    chunked aktarım kullanılır.
+    """
+    headers = {
+        'apikey': key if token else _storage_key,
+        'Authorization': f'Bearer {token or _storage_key}',
+        'Content-Type': content_type,
+        'x-upsert': 'true' if upsert else 'false',
+    }
+    if length is not None:
+        headers['Content-Length'] = str(length)
+    with httpx.Client(transport=pooled_transport, timeout=SUPABASE_TIMEOUT) as client:
+        response = client.post(f"{url}/storage/v1/object/{bucket}/{quote(path)}", content=chunks, headers=headers)
+    response.raise_for_status()
+    _stats['uploads_total'] += 1
+    return response.json()
+
+
+def public_url(bucket, path):
+    """Public bucket'taki nesnenin URL'i (get_public_url ile aynı biçim, ağ isteği yok)."""
+    return f"{url}/storage/v1/object/public/{bucket}/{path}"
+
+
+class SupabaseStorage:
+    """Avatar bucket'ı için Supabase Storage arka ucu.
+
+    Tüm çağrılar paylaşılan bağlantı havuzu üzerinden yapılır; `token`
+    verilmeyen işlemler servis anahtarıyla çalışır.
+    """
+
+    def __init__(self, bucket=AVATAR_BUCKET):
+        self.bucket = bucket
+        self._url_re = re.compile(r'/storage/v1/object/public/' + re.escape(bucket) + r'/([^?#]+)')
+
+    def upload(self, path, chunks, content_type, token=None, length=None):
+        return upload_object(self.bucket, path, chunks, content_type, token=token, length=length)
+
+    def download(self, path):
+        response = self._request('GET', f"/object/authenticated/{self.bucket}/{quote(path)}")
+        return response.content
+
+    def read_head(self, path, size):
+        response = self._request('GET', f"/object/authenticated/{self.bucket}/{quote(path)}",
+                                 headers={'Range': f'bytes=0-{size - 1}'})
+        return response.content[:size]
+
+    def stat(self, path):
+        """Nesnenin {'size', 'content_type'} bilgisini döndürür (yoksa None)."""
+        response = self._request('HEAD', f"/object/authenticated/{self.bucket}/{quote(path)}", allow_missing=True)
+        if response is None:
+            return None
+        return {'size': int(response.headers.get('content-length') or 0),
+                'content_type': response.headers.get('content-type')}
+
+    def list_names(self, prefix):
+        response = self._request('POST', f"/object/list/{self.bucket}",
+                                 json={'prefix': prefix, 'limit': 100, 'offset': 0})
+        return {e.get('name') for e in response.json() or [] if isinstance(e, dict)}
+
+    def remove(self, paths):
+        self._request('DELETE', f"/object/{self.bucket}", json={'prefixes': list(paths)})
+
+    def create_upload_url(self, path):
+        """Nesne yoluna tek seferlik doğrudan yükleme (PUT) URL'i üretir."""
+        response = self._request('POST', f"/object/upload/sign/{self.bucket}/{quote(path)}")
+        signed = response.json().get('url')
+        token = parse_qs(urlsplit(signed).query).get('token', [None])[0]
+        return {'url': f"{url}/storage/v1{signed}", 'method': 'PUT', 'token': token}
+
+    def public_url(self, path):
+        return public_url(self.bucket, path)
+
+    def path_from_url(self, avatar_url):
+        match = self._url_re.search(avatar_url or '')
+        return match.group(1) if match else None
+
+    def _request(self, method, path, headers=None, json=None, allow_missing=False):
+        request_headers = {'apikey': _storage_key, 'Authorization': f'Bearer {_storage_key}'}
+        request_headers.update(headers or {})
+        with httpx.Client(transport=pooled_transport, timeout=SUPABASE_TIMEOUT) as client:
+            response = client.request(method, f"{url}/storage/v1{path}", headers=request_headers, json=json)
+        if allow_missing and response.status_code in (400, 404):
+            return None
+        response.raise_for_status()
+        return response
+
+
+class LocalStorage:
+    """Dosya sisteminde çalışan avatar deposu (AVATAR_STORAGE=local).
+
+    Supabase'e erişmeden testlerde ve yerel geliştirmede aynı akışları
+    (doğrudan yükleme dahil) çalıştırmak içindir. Yükleme URL'leri
+    /api/profile/avatar/local-upload altındaki PUT route'una, public URL'ler
+    /api/profile/avatar/local altına işaret eder.
+    """
+
+    def __init__(self, root=AVATAR_LOCAL_DIR):
+        self.root = os.path.abspath(root)
+        self._url_re = re.compile(re.escape(AVATAR_LOCAL_PUBLIC_PATH) + r'/([^?#]+)')
+
+    def upload(self, path, chunks, content_type=None, token=None, length=None):
+        target = self._file(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp, target)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        _stats['uploads_total'] += 1
+        return {'Key': path}
+
+    def download(self, path):
+        with open(self._file(path), 'rb') as f:
+            return f.read()
+
+    def read_head(self, path, size):
+        with open(self._file(path), 'rb') as f:
+            return f.read(size)
+
+    def stat(self, path):
+        try:
+            size = os.path.getsize(self._file(path))
+        except OSError:
+            return None
+        return {'size': size, 'content_type': None}
+
+    def list_names(self, prefix):
+        try:
+            return set(os.listdir(self._file(prefix)))
+        except OSError:
+            return set()
+
+    def remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(self._file(path))
+            except FileNotFoundError:
+                pass
+
+    def create_upload_url(self, path):
+        ticket = sign_upload_ticket(None, path)
+        return {'url': f"{AVATAR_LOCAL_UPLOAD_PATH}/{path}?token={ticket}", 'method': 'PUT', 'token': ticket}
+
+    def public_url(self, path):
+        return f"{AVATAR_LOCAL_PUBLIC_PATH}/{path}"
+
+    def path_from_url(self, avatar_url):
+        match = self._url_re.search(avatar_url or '')
+        return match.group(1) if match else None
+
+    def _file(self, path):
+        if not is_safe_path(path):
+            raise ValueError(f"unsafe storage path: {path!r}")
+        return os.path.join(self.root, *path.split('/'))
+
+
+avatar_storage = LocalStorage() if AVATAR_STORAGE == 'local' else SupabaseStorage()
+
+
+def create_avatar_upload(user_id, content_type):
+    """Kullanıcının `{user_id}/` önekine doğrudan yükleme URL'i ve tamamlama bileti üretir."""
+    path = f"{user_id}/{os.urandom(16).hex()}.{IMAGE_EXTENSIONS[content_type]}"
+    upload = avatar_storage.create_upload_url(path)
+    _stats['upload_urls_total'] += 1
+    return dict(upload, path=path, upload_id=sign_upload_ticket(user_id, path),
+                expires_in=AVATAR_UPLOAD_URL_TTL_SECONDS, max_bytes=AVATAR_MAX_BYTES)
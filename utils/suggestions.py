@@ -0,0 +1,120 @@
+import os
+import threading
+
+from extensions import supabase
+from utils import metrics
+from utils.cache import TTLCache
+from utils.social_graph import social_graph
+
+# Hesaplanan öneriler bu süre boyunca tekrar kullanılır, sonra yeniden hesaplanır
+SUGGESTION_TTL_SECONDS = float(os.environ.get('SUGGESTION_TTL_SECONDS', 900))
+SUGGESTION_CACHE_SIZE = int(os.environ.get('SUGGESTION_CACHE_SIZE', 10000))
+# Gezinmeye katılacak en fazla arkadaş, okunacak en fazla ikinci derece kenar
+# ve skorlanacak en fazla aday sayısı
+SUGGESTION_MAX_FRIENDS = int(os.environ.get('SUGGESTION_MAX_FRIENDS', 200))
+SUGGESTION_MAX_EDGES = int(os.environ.get('SUGGESTION_MAX_EDGES', 5000))
+SUGGESTION_MAX_CANDIDATES = int(os.environ.get('SUGGESTION_MAX_CANDIDATES', 100))
+# Skor yakınlığının (0-1) ortak arkadaş sayısına göre ağırlığı
+SUGGESTION_SCORE_WEIGHT = float(os.environ.get('SUGGESTION_SCORE_WEIGHT', 1.0))
+SUGGESTION_RESULT_SIZE = 30
+
+
+class FriendSuggestions:
+    """Arkadaşın arkadaşı önerileri.
+
+    Kullanıcının arkadaşlarının kabul edilmiş arkadaşlıkları tek bir
+    sorguyla okunur, ortak arkadaş sayısına göre en iyi adaylar seçilir ve
+    toplam skoru kullanıcınınkine yakın olanlar öne alınır. Hiç arkadaşı
+    olmayan kullanıcılara skoru en yakın oyuncular önerilir. Sonuç kullanıcı
+    başına SUGGESTION_TTL_SECONDS boyunca tutulur; okurken o an ilişkili
+    olunan kullanıcılar elenir.
+    """
+
+    def __init__(self, client, graph):
+        self.client = client
+        self.graph = graph
+        self._lock = threading.Lock()
+        self._cache = TTLCache(SUGGESTION_CACHE_SIZE, SUGGESTION_TTL_SECONDS)
+        self._stats = {'computed_total': 0, 'edges_read_total': 0}
+
+    def suggest(self, user_id, limit=10):
+        user_id = str(user_id)
+        suggestions = self._cache.get(user_id)
+        if suggestions is None:
+            suggestions = self._compute(user_id)
+            self._cache.set(user_id, suggestions)
+        related = self.graph.related_ids(user_id)
+        return [dict(s) for s in suggestions if s['id'] not in related][:limit]
+
+    def invalidate(self, user_id):
+        self._cache.pop(str(user_id))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cache=self._cache.stats())
+
+    # --- internals ---
+
+    def _compute(self, user_id):
+        related = self.graph.related_ids(user_id)
+        friends = self.graph.friends(user_id)[:SUGGESTION_MAX_FRIENDS]
+
+        mutuals = {}
+        if friends:
+            id_list = ','.join(friends)
+            res = self.client.table('friendships').select('user1_id, user2_id').eq('status', 'accepted') \
+                .or_(f'user1_id.in.({id_list}),user2_id.in.({id_list})').limit(SUGGESTION_MAX_EDGES).execute()
+            friend_set = set(friends)
+            for row in res.data or []:
+                a, b = str(row['user1_id']), str(row['user2_id'])
+                # Kenarın arkadaş olmayan ucu aday, diğer ucu ortak arkadaş
+                for friend, candidate in ((a, b), (b, a)):
+                    if friend in friend_set and candidate != user_id and candidate not in related \
+                            and candidate not in friend_set:
+                        mutuals[candidate] = mutuals.get(candidate, 0) + 1
+            with self._lock:
+                self._stats['edges_read_total'] += len(res.data or [])
+
+        candidates = sorted(mutuals, key=mutuals.get, reverse=True)[:SUGGESTION_MAX_CANDIDATES]
+        own = self._own_score(user_id)
+        if candidates:
+            rows = self.client.table('profiles').select('id, username, avatar_url, total_score') \
+                .in_('id', candidates).execute().data or []
+        else:
+            rows = self._nearest_by_score(own, exclude=related | {user_id})
+
+        suggestions = []
+        for row in rows:
+            score = int(row.get('total_score') or 0)
+            mutual = mutuals.get(row['id'], 0)
+            proximity = 1 - min(1.0, abs(score - own) / max(own, score, 1))
+            suggestions.append({
+                'id': row['id'],
+                'username': row.get('username'),
+                'avatar_url': row.get('avatar_url'),
+                'total_score': score,
+                'mutual_friends': mutual,
+                'rank': round(mutual + SUGGESTION_SCORE_WEIGHT * proximity, 4),
+            })
+        suggestions.sort(key=lambda s: (-s['rank'], s['username'] or ''))
+        with self._lock:
+            self._stats['computed_total'] += 1
+        return suggestions[:SUGGESTION_RESULT_SIZE]
+
+    def _own_score(self, user_id):
+        res = self.client.table('profiles').select('total_score').eq('id', user_id).limit(1).execute()
+        return int((res.data or [{}])[0].get('total_score') or 0)
+
+    def _nearest_by_score(self, own, exclude):
+        """Ortak arkadaş yoksa skoru en yakın oyuncular (üstten ve alttan birer dilim)."""
+        fields = 'id, username, avatar_url, total_score'
+        half = min(SUGGESTION_RESULT_SIZE // 2 + len(exclude), 200)
+        above = self.client.table('profiles').select(fields).gte('total_score', own) \
+            .order('total_score').limit(half).execute().data or []
+        below = self.client.table('profiles').select(fields).lt('total_score', own) \
+            .order('total_score', desc=True).limit(half).execute().data or []
+        return [r for r in above + below if str(r['id']) not in exclude]
+
+
+friend_suggestions = FriendSuggestions(supabase, social_graph)
+metrics.register('friend_suggestions', friend_suggestions.stats)
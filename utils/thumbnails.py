@@ -0,0 +1,245 @@
+import io
+import os
+import re
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import has_request_context, request
+
+from utils import metrics
+from utils.cache import TTLCache
+from utils.storage import avatar_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow yoksa küçük görseller üretilmez, orijinal URL döner
+    Image = None
+
+
+class ImageTooLarge(Exception):
+    pass
+
+AVATAR_THUMBNAIL_SIZES = tuple(sorted(
+    int(s) for s in os.environ.get('AVATAR_THUMBNAIL_SIZES', '64,128,256').split(',') if s.strip()
+))
+AVATAR_THUMBNAIL_FORMAT = os.environ.get('AVATAR_THUMBNAIL_FORMAT', 'webp').lower()
+AVATAR_THUMBNAIL_QUALITY = int(os.environ.get('AVATAR_THUMBNAIL_QUALITY', 80))
+AVATAR_THUMBNAIL_WORKERS = int(os.environ.get('AVATAR_THUMBNAIL_WORKERS', 2))
+# Liste görünümlerinde (liderlik, arkadaşlar, düellolar) varsayılan boyut
+AVATAR_LIST_SIZE = int(os.environ.get('AVATAR_LIST_SIZE', 64))
+# Bundan büyük (genişlik x yükseklik) görseller decode edilmeden reddedilir; küçük
+# bir dosyanın devasa bir bitmap'e açılıp worker belleğini tüketmesini önler
+AVATAR_MAX_PIXELS = int(os.environ.get('AVATAR_MAX_PIXELS', 4096 * 4096))
+# Hazır olduğu bilinen küçük görsel anahtarlarının sayısı ve tutulma süresi
+AVATAR_THUMBNAIL_READY_CACHE_SIZE = int(os.environ.get('AVATAR_THUMBNAIL_READY_CACHE_SIZE', 50000))
+AVATAR_THUMBNAIL_READY_TTL_SECONDS = float(os.environ.get('AVATAR_THUMBNAIL_READY_TTL_SECONDS', 24 * 3600))
+
+_THUMB_EXT = 'jpg' if AVATAR_THUMBNAIL_FORMAT in ('jpeg', 'jpg') else 'webp'
+_THUMB_CONTENT_TYPE = 'image/jpeg' if _THUMB_EXT == 'jpg' else 'image/webp'
+# Sadece kendi adlandırdığımız yüklemeler: API yüklemeleri {user_id}/{sha256}.{ext},
+# doğrudan yüklemeler {user_id}/{rastgele 32 hex}.{ext}; küçük görseller bu ada göre tutulur
+_HASHED_PATH_RE = re.compile(r'^[^/]+/([0-9a-f]{64}|[0-9a-f]{32})\.\w+$')
+
+
+class ThumbnailPipeline:
+    """Yüklenen avatarlardan sabit boyutlu küçük görseller üretir.
+
+    Küçük görseller içerik hash'ine göre `thumbs/{sha256}/{size}.{ext}`
+    altında tutulur; aynı görsel kimin yüklediğinden bağımsız bir kez
+    işlenir (doğrudan yüklemelerde hash yerine yolun rastgele adı kullanılır). Üretim bir thread havuzunda, istek yolunun dışında yapılır.
+    Hazır olduğu bilinen hash'ler için liste görünümleri küçük görselin
+    URL'ini, henüz bilinmeyenler için orijinali döndürür; bilinmeyen hash'ler
+    arka planda kontrol edilir ve eksikse orijinalden yeniden üretilir.
+    """
+
+    def __init__(self, storage, sizes=AVATAR_THUMBNAIL_SIZES):
+        self.storage = storage
+        self.sizes = sizes
+        self._lock = threading.Lock()
+        # Süresi dolan veya taşan anahtarlar bir sonraki istekte tekrar kontrol edilir
+        self._ready = TTLCache(AVATAR_THUMBNAIL_READY_CACHE_SIZE, AVATAR_THUMBNAIL_READY_TTL_SECONDS)
+        self._pending = set()
+        # Üretilemeyen hash'ler bir süre tekrar denenmez
+        self._failed = TTLCache(10000, 600)
+        self._executor = None
+        self._pid = None
+        self._stats = {'generated_total': 0, 'deduplicated_total': 0, 'failed_total': 0, 'rejected_too_large_total': 0,
+                       'checks_total': 0, 'variant_hits_total': 0, 'variant_misses_total': 0}
+
+    def submit(self, content_hash, source):
+        """Yeni yüklenen bir avatar için küçük görsel üretimini sıraya alır.
+
+        `source` okunabilir bir dosya nesnesidir; iş bitince kapatılır.
+        """
+        if Image is None or not self._claim(content_hash):
+            source.close()
+            return
+        self._pool().submit(self._process, content_hash, source)
+
+    def variant_url(self, avatar_url, size=AVATAR_LIST_SIZE):
+        """Avatar için `size`'a uygun küçük görsel URL'ini, yoksa orijinali döndürür."""
+        if not avatar_url or not self.sizes:
+            return avatar_url
+        source_path = self.storage.path_from_url(avatar_url)
+        match = _HASHED_PATH_RE.match(source_path or '')
+        if not match:
+            return avatar_url
+        content_hash = match.group(1)
+        with self._lock:
+            ready = self._ready.get(content_hash) is not None
+            self._stats['variant_hits_total' if ready else 'variant_misses_total'] += 1
+        if ready:
+            return self.storage.public_url(self._thumb_path(content_hash, self._pick_size(size)))
+        if self._failed.get(content_hash) is None and self._claim(content_hash):
+            self._pool().submit(self._check, content_hash, source_path)
+        return avatar_url
+
+    def adopt(self, path):
+        """Doğrudan yüklenmiş bir nesnenin küçük görsellerini arka planda üretir.
+
+        Nesne istek thread'inde indirilmez ve yolu değişmez; küçük görseller
+        yolun rastgele adı altında `_check` ile üretilir.
+        """
+        match = _HASHED_PATH_RE.match(path or '')
+        if Image is None or not match or not self._claim(match.group(1)):
+            return
+        self._pool().submit(self._check, match.group(1), path)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, ready=len(self._ready), pending=len(self._pending),
+                        pillow=Image is not None, sizes=list(self.sizes), format=_THUMB_EXT)
+
+    # --- internals ---
+
+    def _pick_size(self, size):
+        for s in self.sizes:
+            if s >= (size or 0):
+                return s
+        return self.sizes[-1]
+
+    def _thumb_path(self, content_hash, size):
+        return f"thumbs/{content_hash}/{size}.{_THUMB_EXT}"
+
+    def _claim(self, content_hash):
+        with self._lock:
+            if self._ready.get(content_hash) is not None or content_hash in self._pending:
+                return False
+            self._pending.add(content_hash)
+            return True
+
+    def _finish(self, content_hash, ready):
+        with self._lock:
+            self._pending.discard(content_hash)
+            if ready:
+                self._ready.set(content_hash, True)
+        if not ready:
+            self._failed.set(content_hash, True)
+
+    def _pool(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=AVATAR_THUMBNAIL_WORKERS,
+                                                        thread_name_prefix='avatar-thumbs')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _existing_sizes(self, content_hash):
+        names = self.storage.list_names(f"thumbs/{content_hash}")
+        return {s for s in self.sizes if f"{s}.{_THUMB_EXT}" in names}
+
+    def _process(self, content_hash, source):
+        ok = False
+        try:
+            if self._existing_sizes(content_hash) == set(self.sizes):
+                with self._lock:
+                    self._stats['deduplicated_total'] += 1
+            else:
+                source.seek(0)
+                self._generate(content_hash, source)
+            ok = True
+        except Exception as e:
+            print(f"[avatar-thumbs] generation failed for {content_hash}: {e}")
+            traceback.print_exc()
+            with self._lock:
+                self._stats['failed_total'] += 1
+        finally:
+            source.close()
+            self._finish(content_hash, ok)
+
+    def _check(self, content_hash, source_path):
+        """Bilinmeyen bir hash'in küçük görsellerini kontrol eder, eksikse üretir."""
+        ok = False
+        try:
+            with self._lock:
+                self._stats['checks_total'] += 1
+            if self._existing_sizes(content_hash) == set(self.sizes):
+                ok = True
+            elif Image is not None:
+                data = self.storage.download(source_path)
+                self._generate(content_hash, io.BytesIO(data))
+                ok = True
+        except Exception as e:
+            print(f"[avatar-thumbs] check failed for {content_hash}: {e}")
+            with self._lock:
+                self._stats['failed_total'] += 1
+        finally:
+            self._finish(content_hash, ok)
+
+    def _generate(self, content_hash, source):
+        with Image.open(source) as image:
+            # Image.open sadece başlığı okur; boyut piksel verisi açılmadan kontrol edilir
+            width, height = image.size
+            if width * height > AVATAR_MAX_PIXELS:
+                with self._lock:
+                    self._stats['rejected_too_large_total'] += 1
+                raise ImageTooLarge(f"{width}x{height} exceeds {AVATAR_MAX_PIXELS} pixels")
+            # JPEG'lerde en büyük hedef boyuta yakın ölçekte decode et
+            image.draft('RGB', (self.sizes[-1] * 2, self.sizes[-1] * 2))
+            image = ImageOps.exif_transpose(image)
+            if _THUMB_EXT == 'jpg' and image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+            for size in self.sizes:
+                thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                if _THUMB_EXT == 'jpg':
+                    thumb.save(buffer, format='JPEG', quality=AVATAR_THUMBNAIL_QUALITY, optimize=True, progressive=True)
+                else:
+                    thumb.save(buffer, format='WEBP', quality=AVATAR_THUMBNAIL_QUALITY, method=4)
+                data = buffer.getvalue()
+                self.storage.upload(self._thumb_path(content_hash, size), [data],
+                                    _THUMB_CONTENT_TYPE, length=len(data))
+        with self._lock:
+            self._stats['generated_total'] += 1
+
+
+if Image is not None:
+    # Pillow'un kendi bomba kontrolü de aynı sınıra çekilir (AVATAR_MAX_PIXELS'in iki
+    # katını aşanlarda Image.open DecompressionBombError fırlatır)
+    Image.MAX_IMAGE_PIXELS = AVATAR_MAX_PIXELS
+
+thumbnail_pipeline = ThumbnailPipeline(avatar_storage)
+metrics.register('avatar_thumbnails', thumbnail_pipeline.stats)
+
+
+def with_avatar_variants(rows, size=None):
+    """Satırlardaki avatar_url'i küçük görselle değiştirir, orijinali avatar_url_original'da tutar.
+
+    Boyut verilmezse istekteki `?avatar_size=` veya AVATAR_LIST_SIZE kullanılır.
+    """
+    if size is None:
+        size = (request.args.get('avatar_size', type=int) if has_request_context() else None) or AVATAR_LIST_SIZE
+    for row in rows or []:
+        if isinstance(row, dict) and row.get('avatar_url'):
+            original = row.get('avatar_url_original') or row['avatar_url']
+            row['avatar_url_original'] = original
+            row['avatar_url'] = thumbnail_pipeline.variant_url(original, size)
+    return rows
@@ -0,0 +1,133 @@
+from array import array
+from bisect import bisect_left, insort
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class UsernameSearchIndex:
+    """Username araması için bellek içi önek + trigram indeksi.
+
+    Önek (typeahead) aramaları, isim uzunluğuna göre ayrılmış sıralı
+    casefold dizileri üzerinde `bisect` ile yapılır; bu, trie ile aynı
+    O(log n + k) maliyeti çok daha az bellekle verir ve kısa isimler önce
+    geldiği için `limit` kadar sonuç bulununca durur. Alt dizi aramaları
+    (`%q%`) için her isim trigramlarına göre indekslenir; en kısa trigram
+    listesindeki adaylar doğrudan `q in name` ile doğrulanır. İki harfli
+    sorgularda trigram olmadığından tarama yeterli aday bulununca durur.
+    Silinen kayıtlar yerinde boşaltılır, trigram listeleri bir sonraki tam
+    yüklemede temizlenir.
+
+    Thread güvenliği çağırana aittir (UsernameIndex kilidi altında kullanılır).
+    """
+
+    def __init__(self, rows=()):
+        self._names = []       # pozisyon -> (folded, username, id) veya None
+        self._pos_by_id = {}   # id -> pozisyon
+        self._by_length = {}   # uzunluk -> [(folded, pozisyon), ...] sıralı
+        self._trigrams = {}    # trigram -> array('I', [pozisyon, ...])
+        for row in rows:
+            user_id, username = row.get('id'), row.get('username')
+            if not user_id or not username or user_id in self._pos_by_id:
+                continue
+            pos = self._append(user_id, username)
+            folded = self._names[pos][0]
+            self._by_length.setdefault(len(folded), []).append((folded, pos))
+        for bucket in self._by_length.values():
+            bucket.sort()
+
+    def __len__(self):
+        return len(self._pos_by_id)
+
+    def add(self, user_id, username):
+        pos = self._pos_by_id.get(user_id)
+        if pos is not None:
+            if self._names[pos][1] == username:
+                return
+            self.remove(user_id)
+        pos = self._append(user_id, username)
+        folded = self._names[pos][0]
+        insort(self._by_length.setdefault(len(folded), []), (folded, pos))
+
+    def remove(self, user_id):
+        pos = self._pos_by_id.pop(user_id, None)
+        if pos is None:
+            return
+        folded = self._names[pos][0]
+        bucket = self._by_length.get(len(folded), [])
+        i = bisect_left(bucket, (folded, pos))
+        if i < len(bucket) and bucket[i] == (folded, pos):
+            del bucket[i]
+        self._names[pos] = None
+
+    def search(self, query, limit=10, exclude=()):
+        """Sıralı [{'id', 'username'}] döndürür.
+
+        Sıra: birebir eşleşme, önek eşleşmeleri (kısa isim önce), alt dizi
+        eşleşmeleri (eşleşme konumu erken ve kısa isim önce).
+        """
+        q = (query or '').casefold()
+        if not q or limit <= 0:
+            return []
+        exclude = set(exclude or ())
+
+        ranked = []
+        for length in sorted(self._by_length):
+            if length < len(q):
+                continue
+            bucket = self._by_length[length]
+            i = bisect_left(bucket, (q,))
+            while i < len(bucket) and bucket[i][0].startswith(q):
+                pos = bucket[i][1]
+                if self._names[pos][2] not in exclude:
+                    ranked.append(pos)
+                    if len(ranked) >= limit:
+                        return self._rows(ranked)
+                i += 1
+        # Buraya gelindiyse tüm önek eşleşmeleri ranked içinde
+
+        substring = []
+        wanted = (limit - len(ranked)) * 4
+        for pos in self._substring_candidates(q):
+            entry = self._names[pos]
+            if entry is None or entry[2] in exclude:
+                continue
+            at = entry[0].find(q)
+            if at <= 0:
+                continue
+            substring.append((at, len(entry[0]), entry[0], pos))
+            if len(q) < 3 and len(substring) >= wanted:
+                # Trigram'sız kısa sorgularda tarama yeterli aday bulununca durur
+                break
+        substring.sort()
+        ranked.extend(pos for *_, pos in substring[:limit - len(ranked)])
+        return self._rows(ranked)
+
+    # --- internals ---
+
+    def _append(self, user_id, username):
+        folded = username.casefold()
+        pos = len(self._names)
+        self._names.append((folded, username, user_id))
+        self._pos_by_id[user_id] = pos
+        for tg in _trigrams(folded):
+            postings = self._trigrams.get(tg)
+            if postings is None:
+                postings = self._trigrams[tg] = array('I')
+            postings.append(pos)
+        return pos
+
+    def _substring_candidates(self, q):
+        if len(q) < 3:
+            return range(len(self._names))
+        postings = []
+        for tg in _trigrams(q):
+            p = self._trigrams.get(tg)
+            if p is None:
+                return ()
+            postings.append(p)
+        return min(postings, key=len)
+
+    def _rows(self, positions):
+        return [{'id': self._names[pos][2], 'username': self._names[pos][1]} for pos in positions]
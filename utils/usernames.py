@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+import traceback
+
+from extensions import supabase
+from utils import metrics
+from utils.cache import TTLCache
+from utils.username_search import UsernameSearchIndex
+
+# Tüm indeksin veritabanından yeniden yüklenme aralığı (0: sadece ilk yükleme)
+USERNAME_INDEX_REFRESH_SECONDS = float(os.environ.get('USERNAME_INDEX_REFRESH_SECONDS', 900))
+USERNAME_INDEX_PAGE_SIZE = int(os.environ.get('USERNAME_INDEX_PAGE_SIZE', 1000))
+# Veritabanında bulunamayan isimlerin tekrar sorulmama süresi
+USERNAME_NEGATIVE_CACHE_SECONDS = float(os.environ.get('USERNAME_NEGATIVE_CACHE_SECONDS', 30))
+# Kaçırılan bir isim için büyük/küçük harf varyantlarından okunacak en fazla satır
+USERNAME_LOOKUP_LIMIT = 20
+
+
+class UsernameIndex:
+    """Username çözümleme ve süreç içi username arama indeksi.
+
+    `resolve`/`resolve_many` birebir eşleşmeleri süreç içi haritadan verir;
+    haritada olmayan isimler veritabanına (indeksli `username` kolonu, bkz.
+    sql/profiles_username_lookup.sql) tek sorguyla sorulur. Harita ilk
+    aramada arka planda `profiles` tablosundan sayfa sayfa yüklenir ve
+    USERNAME_INDEX_REFRESH_SECONDS'ta bir tazelenir; çözümleme ve profil
+    okuyan diğer yollar (`observe`) onu güncel tutar. Arama yapmayan
+    worker'lar tabloyu hiç taramaz, haritaları sadece gördükleri isimlerle dolar.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._exact = {}    # username -> id
+        self._by_id = {}    # id -> username
+        self._search = UsernameSearchIndex()
+        self._ready = False
+        self._thread = None
+        self._pid = None
+        self._missing = TTLCache(10000, USERNAME_NEGATIVE_CACHE_SECONDS)
+        self._stats = {'loads_total': 0, 'load_errors_total': 0, 'lookups_total': 0, 'index_hits_total': 0,
+                       'db_lookups_total': 0, 'searches_total': 0, 'last_load_at': None, 'last_load_ms': None}
+
+    def resolve(self, username):
+        """Username'e ait user id'yi döndürür (yoksa None).
+
+        Haritadaki birebir eşleşme doğrudan döner. Yoksa veritabanına tek
+        sorgu gider: birebir eşleşme, o da yoksa büyük/küçük harf duyarsız
+        tek eşleşme seçilir; bulunamayan isimler kısa süre tekrar sorulmaz.
+        """
+        if not username:
+            return None
+        with self._lock:
+            self._stats['lookups_total'] += 1
+            user_id = self._exact.get(username)
+            if user_id is not None:
+                self._stats['index_hits_total'] += 1
+                return user_id
+        if self._missing.get(username) is not None:
+            return None
+        user_id = self._lookup(username)
+        if user_id is None:
+            self._missing.set(username, True)
+        return user_id
+
+    def resolve_many(self, usernames):
+        """{username: user_id} döndürür; haritada olmayanlar tek bir `in_` sorgusuyla çözülür."""
+        names = list(dict.fromkeys(u for u in usernames if u))
+        found = {}
+        with self._lock:
+            self._stats['lookups_total'] += len(names)
+            for username in names:
+                user_id = self._exact.get(username)
+                if user_id is not None:
+                    found[username] = user_id
+            self._stats['index_hits_total'] += len(found)
+        misses = [u for u in names if u not in found and self._missing.get(u) is None]
+        if not misses:
+            return found
+        with self._lock:
+            self._stats['db_lookups_total'] += 1
+        res = self.client.table('profiles').select('id, username').in_('username', misses).execute()
+        self.observe(res.data)
+        found.update({r['username']: r['id'] for r in res.data or [] if r['username'] in misses})
+        for username in misses:
+            if username in found:
+                continue
+            # Birebir eşleşmesi olmayanlar için büyük/küçük harf duyarsız arama
+            user_id = self._lookup(username)
+            if user_id is None:
+                self._missing.set(username, True)
+            else:
+                found[username] = user_id
+        return found
+
+    @property
+    def ready(self):
+        self._ensure_started()
+        return self._ready
+
+    def search(self, query, limit=10, exclude=()):
+        """Sıralı [{'id', 'username'}] döndürür; indeks henüz yüklenmediyse None."""
+        self._ensure_started()
+        with self._lock:
+            if not self._ready:
+                return None
+            self._stats['searches_total'] += 1
+            return self._search.search(query, limit=limit, exclude=exclude)
+
+    def observe(self, rows):
+        """Başka sorgulardan gelen (id, username) satırlarıyla indeksi günceller."""
+        with self._lock:
+            for row in rows or []:
+                if row.get('id') and row.get('username'):
+                    self._set(row['id'], row['username'])
+                    self._missing.pop(row['username'])
+
+    def load(self):
+        """Tüm indeksi id sırasıyla sayfa sayfa okuyup tek seferde değiştirir."""
+        started = time.perf_counter()
+        exact, by_id = {}, {}
+        rows_all = []
+        last_id = None
+        while True:
+            query = self.client.table('profiles').select('id, username').order('id').limit(USERNAME_INDEX_PAGE_SIZE)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.execute().data or []
+            rows_all.extend(rows)
+            for row in rows:
+                if row.get('username'):
+                    exact[row['username']] = row['id']
+                    by_id[row['id']] = row['username']
+            if len(rows) < USERNAME_INDEX_PAGE_SIZE:
+                break
+            last_id = rows[-1]['id']
+        search = UsernameSearchIndex(rows_all)
+        with self._lock:
+            self._exact, self._by_id = exact, by_id
+            self._search = search
+            self._ready = True
+            self._stats['loads_total'] += 1
+            self._stats['last_load_at'] = time.time()
+            self._stats['last_load_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, ready=self._ready, size=len(self._by_id))
+
+    # --- internals ---
+
+    def _lookup(self, username):
+        """Tek sorguyla birebir, yoksa büyük/küçük harf duyarsız tek eşleşmeyi bulur.
+
+        Birden fazla kullanıcı sadece harf farkıyla eşleşirse belirsizdir (None).
+        """
+        pattern = _ilike_literal(username)
+        query = self.client.table('profiles').select('id, username')
+        query = query.ilike('username', pattern) if pattern else query.eq('username', username)
+        with self._lock:
+            self._stats['db_lookups_total'] += 1
+        res = query.limit(USERNAME_LOOKUP_LIMIT).execute()
+        rows = [r for r in res.data or [] if (r.get('username') or '').casefold() == username.casefold()]
+        self.observe(rows)
+        for row in rows:
+            if row['username'] == username:
+                return row['id']
+        return rows[0]['id'] if len(rows) == 1 else None
+
+    def _set(self, user_id, username):
+        if self._by_id.get(user_id) == username:
+            return
+        self._remove(user_id)
+        self._exact[username] = user_id
+        self._by_id[user_id] = username
+        self._search.add(user_id, username)
+
+    def _remove(self, user_id):
+        old = self._by_id.pop(user_id, None)
+        if old is None:
+            return
+        self._search.remove(user_id)
+        if self._exact.get(old) == user_id:
+            del self._exact[old]
+
+    def _ensure_started(self):
+        if self._thread and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='username-index', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.load()
+            except Exception as e:
+                print(f"[username-index] load failed: {e}")
+                traceback.print_exc()
+                with self._lock:
+                    self._stats['load_errors_total'] += 1
+                time.sleep(30)
+                continue
+            if USERNAME_INDEX_REFRESH_SECONDS <= 0:
+                return
+            time.sleep(USERNAME_INDEX_REFRESH_SECONDS)
+
+
+def _ilike_literal(value):
+    """Değeri joker karakter içermeyen bir ilike desenine çevirir.
+
+    PostgREST `*`'ı da joker sayar ve kaçırılamaz; `*` içeren isimler için None.
+    """
+    if '*' in value:
+        return None
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+username_index = UsernameIndex(supabase)
+metrics.register('username_index', username_index.stats)